@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Rapport de démarrage à froid du kit DD-70 (mise sous tension -> jouable)
+Reconstitue, pour le démarrage en cours, les étapes en temps monotonic
+(secondes depuis le démarrage du noyau) :
+- noyau          : fin du noyau / initramfs, lancement de systemd
+- USB            : énumération du DD-70 (journal du noyau)
+- périphérique   : /dev/dd70midi créé par la règle udev
+- synthé         : dd70-synth prêt (mode 2 uniquement)
+- service        : lancement de dd70-remap (déclenché par udev)
+- jouable        : "Prêt à jouer" journalisé par le remapper
+Le temps passé dans le firmware du Pi avant le noyau n'est pas mesurable ici.
+
+Usage:
+python3 dd70-boot-report.py
+(lecture du journal : membre du groupe systemd-journal ou adm, ou sudo)
+"""
+
+import re
+import subprocess
+import sys
+
+from dd70_boottime import PLAYABLE_PATTERN
+
+# Objectif : premier son possible moins de BOOT_BUDGET_S après le démarrage du noyau
+BOOT_BUDGET_S = 15.0
+
+USB_PATTERN = re.compile(r'^\[\s*([\d.]+)\].*(e-drum|DD-70)', re.IGNORECASE | re.MULTILINE)
+DEVICE_UNIT = 'dev-dd70midi.device'
+
+
+def command_output(args):
+    try:
+        return subprocess.run(args, capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return ''
+
+
+def unit_timestamp(unit, prop):
+    """Propriété *TimestampMonotonic d'une unité systemd (µs) -> secondes, None si absente"""
+    args = ['systemctl', 'show', '-p', prop, '--value']
+    if unit:
+        args.append(unit)
+    value = command_output(args).strip()
+    if not value.isdigit() or value == '0':
+        return None
+    return int(value) / 1e6
+
+
+def usb_enumeration():
+    """Première ligne du noyau qui mentionne le DD-70"""
+    match = USB_PATTERN.search(command_output(['journalctl', '-k', '-b', '-o', 'short-monotonic', '--no-pager']))
+    return float(match.group(1)) if match else None
+
+
+def playable():
+    """Dernier "Prêt à jouer" du remapper pour ce démarrage"""
+    matches = PLAYABLE_PATTERN.findall(command_output(['journalctl', '-u', 'dd70-remap', '-b', '-o', 'cat',
+                                                       '--no-pager']))
+    return float(matches[-1]) if matches else None
+
+
+def main():
+    steps = [
+        ('noyau', unit_timestamp(None, 'UserspaceTimestampMonotonic')),
+        ('USB (DD-70 énuméré)', usb_enumeration()),
+        ('périphérique udev', unit_timestamp(DEVICE_UNIT, 'ActiveEnterTimestampMonotonic')),
+        ('synthé prêt', unit_timestamp('dd70-synth.service', 'ActiveEnterTimestampMonotonic')),
+        ('service lancé', unit_timestamp('dd70-remap.service', 'ExecMainStartTimestampMonotonic')),
+        ('jouable', playable()),
+    ]
+
+    print("="*60)
+    print("  DD-70 - démarrage à froid (temps depuis le noyau)")
+    print("="*60)
+    previous = 0.0
+    for name, stamp in steps:
+        if stamp is None:
+            print(f"  {name:<22}      -")
+            continue
+        print(f"  {name:<22} {stamp:7.2f} s   (+{stamp - previous:.2f} s)")
+        previous = stamp
+
+    ready = steps[-1][1]
+    if ready is None:
+        print("\n⚠️  Pas de \"Prêt à jouer\" dans le journal de dd70-remap pour ce démarrage")
+        return 1
+    if ready > BOOT_BUDGET_S:
+        print(f"\n✗ Jouable après {ready:.2f} s (objectif {BOOT_BUDGET_S:.0f} s)")
+        print("  Voir: systemd-analyze critical-chain dd70-remap.service")
+        return 1
+    print(f"\n✓ Jouable après {ready:.2f} s (objectif {BOOT_BUDGET_S:.0f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
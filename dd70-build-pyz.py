@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Construit une archive exécutable (zipapp) d'un remapper DD-70
+Le script choisi devient __main__ de l'archive, avec uniquement les modules
+dd70_* qu'il importe (directement ou non). Chaque module est accompagné de
+son bytecode précompilé : au démarrage du service, Python ne recompile rien
+(le script principal lancé directement n'a jamais de cache .pyc, et
+/opt/dd70-remap n'est pas modifiable par l'utilisateur du service).
+
+Le bytecode dépend de la version de Python : construire l'archive avec
+l'interpréteur qui la lancera (install.sh utilise celui du venv). Si les
+versions diffèrent, Python se rabat sur les sources incluses.
+
+Usage:
+python3 dd70-build-pyz.py dd70-remap-synth-v3.py -o dd70-remap.pyz
+"""
+
+import argparse
+import os
+import py_compile
+import re
+import shutil
+import sys
+import tempfile
+import zipapp
+
+# Imports de modules du projet, y compris les imports paresseux dans les fonctions
+LOCAL_IMPORT = re.compile(r'^\s*(?:from|import)\s+(dd70_\w+)', re.MULTILINE)
+
+
+def local_modules(script, source_dir):
+    """Modules dd70_* nécessaires au script, dépendances comprises"""
+    found = set()
+    pending = [script]
+    while pending:
+        with open(pending.pop(), 'r') as f:
+            source = f.read()
+        for name in LOCAL_IMPORT.findall(source):
+            path = os.path.join(source_dir, f'{name}.py')
+            if name not in found and os.path.exists(path):
+                found.add(name)
+                pending.append(path)
+    return sorted(found)
+
+
+def add_module(build_dir, source, name):
+    """Copie la source et son bytecode (hash non vérifié : valable dans une archive)"""
+    shutil.copyfile(source, os.path.join(build_dir, f'{name}.py'))
+    py_compile.compile(source, cfile=os.path.join(build_dir, f'{name}.pyc'), dfile=f'{name}.py',
+                       doraise=True, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+
+
+def build(script, output, interpreter):
+    source_dir = os.path.dirname(os.path.abspath(script))
+    modules = local_modules(script, source_dir)
+    with tempfile.TemporaryDirectory() as build_dir:
+        add_module(build_dir, script, '__main__')
+        for name in modules:
+            add_module(build_dir, os.path.join(source_dir, f'{name}.py'), name)
+        # Archive non compressée : lecture directe, rien à décompresser au démarrage
+        zipapp.create_archive(build_dir, output, interpreter=interpreter)
+    print(f"✓ {output}: {os.path.basename(script)} + {', '.join(modules) or 'aucun module'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive zipapp précompilée d'un remapper DD-70")
+    parser.add_argument('script', help='script principal (ex: dd70-remap-synth-v3.py)')
+    parser.add_argument('-o', '--output', default='dd70-remap.pyz')
+    parser.add_argument('--python', default=sys.executable, help="interpréteur de la ligne #!")
+    args = parser.parse_args()
+
+    try:
+        build(args.script, args.output, args.python)
+    except (OSError, py_compile.PyCompileError) as e:
+        print(f"✗ Construction impossible: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
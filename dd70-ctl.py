@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Client du socket de contrôle du remapper DD-70
+Envoie une commande au remapper en cours (dd70-remap-synth-v3.py ou
+dd70-remapper-nolatency.py) et affiche sa réponse JSON. Les réglages sont
+appliqués entre deux frappes, sans redémarrer le service.
+
+Usage:
+python3 dd70-ctl.py help
+python3 dd70-ctl.py stats
+python3 dd70-ctl.py set hihat_hysteresis=5
+python3 dd70-ctl.py mapping input=dd70 mapping=@mon-mapping.json
+python3 dd70-ctl.py record on=true path=/home/pi/prise1.mid
+python3 dd70-ctl.py output name=daw on=false
+python3 dd70-ctl.py pedal dump=/tmp/dd70-pedal.csv
+
+Les valeurs sont lues en JSON si possible (70, true, [38, 40]), sinon
+comme texte ; @fichier lit la valeur JSON dans un fichier.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+from dd70_control import CONTROL_DIR, CONTROL_FALLBACK
+
+TIMEOUT = 5.0
+
+
+def find_socket():
+    """Socket du service (/run/dd70), sinon celui d'un remapper lancé à la main"""
+    for path in (os.path.join(CONTROL_DIR, 'control.sock'), CONTROL_FALLBACK):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def parse_value(text):
+    if text.startswith('@'):
+        with open(text[1:], 'r') as f:
+            return json.load(f)
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def build_request(command, fields):
+    request = {'cmd': command}
+    for field in fields:
+        name, sep, value = field.partition('=')
+        if not sep:
+            raise ValueError(f"argument attendu sous la forme nom=valeur: {field}")
+        request[name] = parse_value(value)
+    return request
+
+
+def send(path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(TIMEOUT)
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        reply = sock.makefile('rb').readline()
+    if not reply:
+        raise ConnectionError("pas de réponse du remapper")
+    return json.loads(reply)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Commande le remapper DD-70 en cours")
+    parser.add_argument('command', help="help, stats, settings, set, mapping, zones, pedal, record, output")
+    parser.add_argument('fields', nargs='*', metavar='nom=valeur')
+    parser.add_argument('--socket', help="chemin du socket de contrôle")
+    args = parser.parse_args()
+
+    path = args.socket or find_socket()
+    if path is None:
+        print("✗ Socket de contrôle introuvable : le remapper tourne-t-il ?")
+        return 1
+    try:
+        request = build_request(args.command, args.fields)
+        response = send(path, request)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+
+    if not response.pop('ok', False):
+        print(f"✗ {response.get('error')}")
+        return 1
+    print(json.dumps(response, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Tableau de bord temps réel du remapper DD-70 (terminal)
+S'attache en lecture seule au journal partagé du remapper (/dev/shm,
+voir dd70_shm.py) et affiche, rafraîchi ~10 fois par seconde :
+- par pad : frappes, cadence sur les dernières secondes, note envoyée,
+  histogramme des vélocités
+- ouverture de la charleston (CC#4) par kit, avec le dernier indice de pédale
+- latence entrée -> envoi (p50 / p99 / max)
+- compteurs : messages, étouffements, erreurs d'envoi, pertes, reconnexions
+
+Le remapper ne sait pas qu'on le regarde : rien n'est ajouté à son chemin
+chaud, le tableau de bord ne fait que lire la mémoire partagée.
+
+Usage:
+python3 dd70-dashboard.py        (q : quitter, r : remise à zéro)
+"""
+
+import collections
+import curses
+import sys
+import time
+
+from dd70_ring import unpack_message
+from dd70_shm import (DiagReader, SHM_PATH, KIND_MESSAGE, KIND_PEDAL,
+                      PEDAL_CC, PEDAL_CHICK, PEDAL_PAD,
+                      PEDAL_CUE_MASK, PEDAL_ZONE_SHIFT, PEDAL_ZONE_MASK,
+                      COUNT_MESSAGES, COUNT_NOTES, COUNT_CHOKES, COUNT_SEND_ERRORS,
+                      COUNT_RECONNECTS, COUNT_DROPPED)
+
+REFRESH = 0.1             # ~10 Hz
+RATE_WINDOW = 5.0         # cadence calculée sur les dernières secondes
+LATENCY_WINDOW = 2048
+VELOCITY_BUCKETS = 8
+BARS = ' ▁▂▃▄▅▆▇█'
+CUE_NAMES = {PEDAL_CC: 'CC#4', PEDAL_CHICK: 'chick (44)', PEDAL_PAD: 'pad 42/46'}
+
+
+class PadStats:
+    def __init__(self):
+        self.hits = 0
+        self.last_note = None
+        self.times = collections.deque()
+        self.velocities = [0] * VELOCITY_BUCKETS
+
+    def rate(self, now):
+        while self.times and now - self.times[0] > RATE_WINDOW:
+            self.times.popleft()
+        return len(self.times) / RATE_WINDOW
+
+    def histogram(self):
+        top = max(self.velocities) or 1
+        return ''.join(BARS[(count * (len(BARS) - 1) + top - 1) // top] for count in self.velocities)
+
+
+class Dashboard:
+    def __init__(self, path=SHM_PATH):
+        self.reader = DiagReader(path)
+        self.reset()
+
+    def reset(self):
+        self.pads = {}             # (source, note reçue) -> PadStats
+        self.openness = {}         # source -> (ouverture, dernier indice)
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.baseline = None       # compteurs au moment de la remise à zéro
+
+    def consume(self, now):
+        for record in self.reader.read():
+            stamp, event_in, event_out, kind, source, openness, flags, latency = record
+            if kind == KIND_PEDAL:
+                cue = CUE_NAMES.get(flags & PEDAL_CUE_MASK, '?')
+                zone = flags >> PEDAL_ZONE_SHIFT & PEDAL_ZONE_MASK
+                self.openness[source] = (openness, f"zone {zone}, {cue}")
+                continue
+            if kind != KIND_MESSAGE or event_in == 0:
+                continue
+            self.latencies.append(latency)
+            # note_on avec vélocité (statut 0x9n, data2 > 0)
+            if event_in & 0xF0 != 0x90 or not event_in >> 16:
+                continue
+            msg_in = unpack_message(event_in)
+            pad = self.pads.setdefault((source, msg_in.note), PadStats())
+            pad.hits += 1
+            pad.times.append(now)
+            pad.velocities[min(VELOCITY_BUCKETS - 1, msg_in.velocity * VELOCITY_BUCKETS // 128)] += 1
+            if event_out & 0xF0 == 0x90:
+                pad.last_note = (event_out >> 8) & 0x7F
+
+    def counters(self):
+        counters = self.reader.counters()
+        if self.baseline is None:
+            return counters
+        if any(value < base for value, base in zip(counters, self.baseline)):
+            # Remapper redémarré : ses compteurs repartent de 0, la remise à
+            # zéro n'a plus de sens (nouvelle époque)
+            self.baseline = None
+            return counters
+        return [value - base for value, base in zip(counters, self.baseline)]
+
+    def latency_line(self):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return "Latence entrée -> envoi : -"
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6
+        return (f"Latence entrée -> envoi : p50 {p50:6.0f} µs   p99 {p99:6.0f} µs   "
+                f"max {latencies[-1] * 1e6:6.0f} µs   ({len(latencies)} mesures)")
+
+    def draw(self, screen, now):
+        screen.erase()
+        height, width = screen.getmaxyx()
+        sources = self.reader.sources()
+        lines = []
+        alive = self.reader.writer_alive()
+        status = f"PID {self.reader.pid}" if alive else "remapper arrêté"
+        lines.append((f"DD-70 - tableau de bord ({status})   q: quitter  r: remise à zéro", curses.A_BOLD))
+        lines.append(("", 0))
+
+        lines.append(("Charleston", curses.A_UNDERLINE))
+        for source, name in enumerate(sources or ['-']):
+            openness, cue = self.openness.get(source, (None, '-'))
+            if openness is None:
+                lines.append((f"  {name:<8} -", 0))
+                continue
+            filled = openness * 20 // 127
+            lines.append((f"  {name:<8} [{'█' * filled}{'·' * (20 - filled)}] {openness:3d}   "
+                          f"dernier indice: {cue}", 0))
+        lines.append(("", 0))
+
+        lines.append((f"{'Pad':<14}{'-> note':>8}{'frappes':>9}{'/s':>7}   vélocités 0..127", curses.A_UNDERLINE))
+        for (source, note), pad in sorted(self.pads.items()):
+            name = sources[source] if source < len(sources) else str(source)
+            label = f"{name}:{note}"
+            out = '-' if pad.last_note is None else str(pad.last_note)
+            lines.append((f"{label:<14}{out:>8}{pad.hits:>9}{pad.rate(now):>7.1f}   {pad.histogram()}", 0))
+        lines.append(("", 0))
+
+        lines.append((self.latency_line(), 0))
+        c = self.counters()
+        lines.append((f"Messages {c[COUNT_MESSAGES]}   notes {c[COUNT_NOTES]}   étouffements {c[COUNT_CHOKES]}   "
+                      f"erreurs d'envoi {c[COUNT_SEND_ERRORS]}   perdus {c[COUNT_DROPPED]}   "
+                      f"reconnexions {c[COUNT_RECONNECTS]}", 0))
+        if self.reader.lost:
+            lines.append((f"Tableau de bord en retard : {self.reader.lost} enregistrement(s) non lus", curses.A_DIM))
+
+        for row, (text, attr) in enumerate(lines[:height]):
+            screen.addnstr(row, 0, text, width - 1, attr)
+        screen.refresh()
+
+    def run(self, screen):
+        curses.curs_set(0)
+        screen.timeout(int(REFRESH * 1000))
+        while True:
+            now = time.monotonic()
+            self.consume(now)
+            self.draw(screen, now)
+            key = screen.getch()
+            if key in (ord('q'), ord('Q')):
+                return
+            if key in (ord('r'), ord('R')):
+                self.reset()
+                self.baseline = self.reader.counters()
+
+
+def main():
+    dashboard = Dashboard(sys.argv[1] if len(sys.argv) > 1 else SHM_PATH)
+    if not dashboard.reader.open():
+        print(f"✗ Journal du remapper introuvable ({dashboard.reader.path}) : le remapper tourne-t-il ?")
+        return 1
+    try:
+        curses.wrapper(dashboard.run)
+    except KeyboardInterrupt:
+        pass
+    dashboard.reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Diagnostics du remapper DD-70, hors du processus temps réel
+S'attache en lecture seule au journal partagé (/dev/shm/dd70-diag, voir
+dd70_shm.py) écrit par dd70-remap-synth-v3.py ou dd70-remapper-nolatency.py
+et se charge de tout ce qui ne doit pas voler de temps aux frappes :
+- journal des frappes remappées et des déductions de la pédale
+- reconnexions hotplug des entrées (compteur partagé)
+- métriques périodiques : messages, notes, latence entrée -> envoi
+- enregistrement de la session en .mid (--record)
+
+Usage:
+python3 dd70-diag.py                 # frappes et changements de pédale
+python3 dd70-diag.py -v              # tous les messages (ex-mode DEBUG)
+python3 dd70-diag.py --record session.mid --quiet
+"""
+
+import argparse
+import signal
+import sys
+import time
+
+from dd70_ring import unpack_message
+from dd70_shm import (DiagReader, SHM_PATH, KIND_MESSAGE, KIND_PEDAL, KIND_CHOKE,
+                      PEDAL_CC, PEDAL_CHICK, PEDAL_PAD, PEDAL_CHANGED,
+                      PEDAL_CUE_MASK, PEDAL_ZONE_SHIFT, PEDAL_ZONE_MASK,
+                      COUNT_MESSAGES, COUNT_NOTES, COUNT_CHOKES, COUNT_SEND_ERRORS, COUNT_RECONNECTS)
+
+POLL_INTERVAL = 0.02     # lecture du journal (s)
+ATTACH_RETRY = 1.0       # attente du remapper (s)
+STATS_INTERVAL = 60.0    # métriques périodiques (s)
+
+
+class Diagnostics:
+    def __init__(self, args):
+        self.args = args
+        self.reader = DiagReader(args.path)
+        self.recorder = None
+        self.running = True
+        self.latencies = []
+        self.last_stats = time.monotonic()
+        self.last_counters = None
+        self.reconnects = None
+
+    def attach(self):
+        """Attend que le remapper ait créé son journal"""
+        waiting = False
+        while self.running:
+            if self.reader.open():
+                print(f"✓ Attaché au remapper (PID {self.reader.pid}, sources: "
+                      f"{', '.join(self.reader.sources()) or '-'})")
+                return True
+            if not waiting:
+                print(f"⏳ En attente du remapper ({self.args.path})...")
+                waiting = True
+            time.sleep(ATTACH_RETRY)
+        return False
+
+    def source_name(self, source):
+        sources = self.reader.sources()
+        return sources[source] if source < len(sources) else f'source {source}'
+
+    def show_message(self, record):
+        stamp, event_in, event_out, kind, source, openness, flags, latency = record
+        if event_in == 0:
+            # Message système (clock, sysex...) : compté, jamais affiché
+            return
+        msg_in = unpack_message(event_in)
+        if self.args.verbose:
+            print(f"📥 {msg_in}")
+        if msg_in.type == 'note_on' and msg_in.velocity > 0 and event_out:
+            msg_out = unpack_message(event_out)
+            if msg_out.type == 'note_on' and msg_out.note != msg_in.note:
+                print(f"🥁 {self.source_name(source)}: Note {msg_in.note} -> {msg_out.note} "
+                      f"(vel: {msg_in.velocity}, {latency * 1e6:.0f} µs)")
+
+    def show_pedal(self, record):
+        openness, flags = record[5], record[6]
+        cue = flags & PEDAL_CUE_MASK
+        zone = flags >> PEDAL_ZONE_SHIFT & PEDAL_ZONE_MASK
+        changed = flags & PEDAL_CHANGED
+        if cue == PEDAL_CC and (changed or self.args.verbose):
+            print(f"🎛️  CC#4 = {openness} (zone {zone})")
+        elif cue == PEDAL_CHICK:
+            print("🦶 Pédale ENFONCÉE (Note 44)")
+        elif cue == PEDAL_PAD and changed:
+            state = 'FERMÉE' if openness == 0 else 'OUVERTE'
+            print(f"💡 Déduction via Pad Central: Pédale {state}")
+
+    def handle(self, record):
+        kind = record[3]
+        if kind == KIND_MESSAGE:
+            self.latencies.append(record[7])
+            if not self.args.quiet:
+                self.show_message(record)
+            if self.recorder and record[2]:
+                self.recorder.send(unpack_message(record[2], record[0]))
+        elif kind == KIND_PEDAL:
+            if not self.args.quiet:
+                self.show_pedal(record)
+        elif kind == KIND_CHOKE:
+            if self.args.verbose:
+                print(f"🔇 {self.source_name(record[4])}: étouffement")
+            if self.recorder and record[2]:
+                self.recorder.send(unpack_message(record[2], record[0]))
+
+    def show_reconnects(self):
+        """Reconnexions hotplug : le remapper ne publie que leur nombre"""
+        reconnects = self.reader.counters()[COUNT_RECONNECTS]
+        if self.reconnects is not None and reconnects > self.reconnects:
+            print(f"🔌 Entrée reconnectée (reconnexions: {reconnects})")
+        # Plus bas qu'avant : remapper redémarré, on repart de sa valeur
+        self.reconnects = reconnects
+
+    def print_stats(self):
+        counters = self.reader.counters()
+        latencies = sorted(self.latencies)
+        self.latencies = []
+        line = (f"📊 {counters[COUNT_MESSAGES]} messages, {counters[COUNT_NOTES]} notes, "
+                f"{counters[COUNT_CHOKES]} étouffements, {counters[COUNT_SEND_ERRORS]} erreurs d'envoi, "
+                f"{counters[COUNT_RECONNECTS]} reconnexions")
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1e6
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6
+            line += f" | latence p50 {p50:.0f} µs / p99 {p99:.0f} µs / max {latencies[-1] * 1e6:.0f} µs"
+        if self.reader.lost:
+            line += f" | {self.reader.lost} enregistrement(s) perdus (lecture en retard)"
+        print(line)
+
+    def run(self):
+        if self.args.record:
+            from dd70_fanout import MidiFileRecorder
+            self.recorder = MidiFileRecorder(self.args.record)
+            print(f"⏺  Enregistrement: {self.args.record}")
+
+        if not self.attach():
+            return 0
+        alive = True
+        while self.running:
+            for record in self.reader.read():
+                self.handle(record)
+            if not self.args.quiet:
+                self.show_reconnects()
+            now = time.monotonic()
+            if now - self.last_stats >= self.args.interval:
+                self.last_stats = now
+                self.print_stats()
+                if alive and not self.reader.writer_alive():
+                    print("⚠️  Remapper arrêté, en attente de son redémarrage...")
+                alive = self.reader.writer_alive()
+            time.sleep(POLL_INTERVAL)
+
+        self.print_stats()
+        if self.recorder:
+            self.recorder.close()
+        self.reader.close()
+        return 0
+
+    def stop(self, signum=None, frame=None):
+        self.running = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diagnostics du remapper DD-70 (mémoire partagée)")
+    parser.add_argument('-v', '--verbose', action='store_true', help='tous les messages et indices de pédale')
+    parser.add_argument('-q', '--quiet', action='store_true', help='métriques seulement')
+    parser.add_argument('--record', metavar='FICHIER.mid', help='enregistre les messages envoyés')
+    parser.add_argument('--interval', type=float, default=STATS_INTERVAL, help='période des métriques (s)')
+    parser.add_argument('--path', default=SHM_PATH)
+    args = parser.parse_args()
+
+    diagnostics = Diagnostics(args)
+    signal.signal(signal.SIGTERM, diagnostics.stop)
+    signal.signal(signal.SIGINT, diagnostics.stop)
+    return diagnostics.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,9 @@ REMAP = {
     46: 38,
 }
 
+# Client ALSA du synthé persistant (voir dd70-synth-daemon.py)
+SYNTH_DAEMON_ID = 'DD70_Synth'
+
 class SimpleRemapper:
     def __init__(self):
         self.input_port = None
@@ -38,6 +41,12 @@ class SimpleRemapper:
     
     def start_fluidsynth(self):
         """Démarre FluidSynth en mode ALSA avec faible latence"""
+        # Synthé persistant déjà en service : on s'y attache sans le relancer
+        # (find_fluidsynth_port le trouvera, cleanup() ne l'arrêtera pas)
+        if any(SYNTH_DAEMON_ID in port for port in mido.get_output_names()):
+            print("✓ Synthé persistant détecté, pas de nouveau FluidSynth")
+            return True
+        
         print("Démarrage de FluidSynth...")
         
         # Vérifier qu'il n'y a pas déjà un FluidSynth qui tourne
@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 """
 Configuration de remapping MIDI pour Gear4music DD-70 avec synthétiseur logiciel
-Version 3: Utilise aconnect pour router MIDI vers FluidSynth
+Version 3: Client natif du séquenceur ALSA pour router MIDI vers FluidSynth
+           ou le moteur d'échantillons NumPy intégré (SYNTH_BACKEND = 'sampler')
 
 Requirements:
 - python3-rtmidi ou mido
 - fluidsynth (synthétiseur logiciel)
 - fluid-soundfont-gm (banque de sons)
-- alsa-utils (pour aconnect)
+- libasound2 (séquenceur ALSA, via ctypes)
+- python3-numpy + python3-alsaaudio (backend 'sampler' uniquement)
 
 Installation:
 sudo apt-get install python3-rtmidi fluidsynth fluid-soundfont-gm alsa-utils
@@ -18,11 +20,47 @@ python3 dd70-remap-synth-v3.py
 
 import mido
 import time
-import subprocess
 import os
 import signal
 import sys
-import re
+
+from dd70_alsaseq import AlsaSeq, AlsaSeqError
+from dd70_boottime import report_playable
+from dd70_rules import HitState, PedalZones, Settings, compile_mapping
+from dd70_hotplug import HotplugWatcher
+from dd70_inputs import InputMerger
+from dd70_shm import (DiagWriter, KIND_CHOKE, PEDAL_CC, PEDAL_CHICK,
+                      COUNT_CHOKES, COUNT_SEND_ERRORS, COUNT_RECONNECTS, COUNT_DROPPED, pack)
+from dd70_watchdog import Watchdog, STALL_TIMEOUT, shell_probe
+
+# Importés seulement si la configuration en a besoin (temps de démarrage) :
+# subprocess (FluidSynth lancé par le script), dd70_fanout (sorties
+# multiples, synthé réparti), dd70_sampler (backend 'sampler').
+# dd70_engine (asyncio), dd70_control et json ne sont importés qu'une fois
+# le kit jouable (start_engine) : ils ne servent pas au chemin des notes
+
+# Backend de synthèse:
+# - 'fluidsynth' : s'attache au synthé persistant (dd70-synth-daemon.py) s'il
+#                  tourne, sinon FluidSynth en sous-processus routé via aconnect
+# - 'sampler'    : one-shots pré-rendus mixés en NumPy dans ce processus
+#                  (latence plus faible, CPU plus prévisible sur le Pi)
+SYNTH_BACKEND = 'fluidsynth'
+
+# Client ALSA du synthé persistant (voir dd70-synth-daemon.py)
+SYNTH_DAEMON_ID = 'DD70_Synth'
+
+# Synthé réparti (SYNTH_SHARDS > 1 dans dd70-synth-daemon.py) : notes jouées
+# par chaque instance supplémentaire, les autres restent sur la première.
+# Si le daemon tourne avec moins d'instances, tout retombe sur la première.
+SHARD_NOTES = {
+    1: (42, 44, 46, 49, 51, 52, 53, 55, 57, 59),   # charleston et cymbales
+}
+
+SOUNDFONT_PATHS = [
+    '/usr/share/sounds/sf2/FluidR3_GM.sf2',
+    '/usr/share/soundfonts/FluidR3_GM.sf2',
+    '/usr/share/sounds/sf2/default.sf2',
+]
 
 # Mapping MIDI par défaut DD-70
 DEFAULT_MAPPING = {
@@ -42,39 +80,318 @@ DEFAULT_MAPPING = {
 }
 
 # NOUVELLE CONFIGURATION - Style RHCP
+# Remappages simples note -> note, plus des règles conditionnelles
+# ('rules', prioritaires, voir dd70_rules.py) compilées en tables : une
+# articulation conditionnelle coûte autant par frappe qu'un remappage simple.
 NEW_MAPPING = {
     38: 42,  # Caisse claire -> Charleston
     40: 42,
     42: 38,  # Charleston -> Caisse claire
     46: 38,
     'hihat_controller': 4,
+    'hihat_pads': (38, 40),   # pads qui jouent la note de la zone de pédale (HIHAT_ZONES)
+    'rules': [
+        # {'note': 38, 'velocity': [1, 20], 'pedal': 'closed', 'play': 44},   # ghost -> chick
+        # {'note': 51, 'previous': 51, 'since_ms': [0, 90], 'play': 53},     # doublé rapide -> cloche
+        # {'note': 36, 'previous': 36, 'since_ms': [0, 25], 'drop': True},   # double déclenchement
+    ],
+}
+
+# Entrées fusionnées dans le même pipeline : chaque périphérique a son propre
+# mapping (les notes d'un contrôleur n'ont pas le sens de celles du DD-70).
+# La première entrée est requise, les autres sont ouvertes dès leur branchement.
+# 'index' choisit le n-ième port correspondant (deux DD-70 identiques).
+INPUT_DEVICES = {
+    'dd70': {'patterns': ('e-drum', 'DD-70'), 'mapping': NEW_MAPPING},
+    # 'pads': {'patterns': ('nanoPAD',), 'mapping': {36: 49, 37: 57, 38: 51}},
+}
+
+# Zones de la pédale charleston (CC#4 continu, 0 = fermée) : nom (utilisable
+# dans 'pedal' des règles), début de zone, note jouée par les pads charleston,
+# gain de vélocité, valeur de CC#4 transmise au synthé (None = valeur reçue).
+# Le CC#4 n'est transmis qu'au changement de zone quand la zone fixe sa valeur.
+# Hystérésis : on entre dans une zone à début + HIHAT_HYSTERESIS et on n'en
+# sort que sous début - HIHAT_HYSTERESIS (pas de battement à la frontière).
+HIHAT_ZONES = [
+    ('closed', 0, 42, 1.0, 0),
+    ('tight', 24, 42, 0.85, 40),
+    ('half', 56, 46, 0.7, 72),
+    ('loose', 88, 46, 0.85, 100),
+    ('open', 112, 46, 1.0, 127),
+]
+HIHAT_HYSTERESIS = 3
+
+# Groupes d'étouffement (choke)
+# Chaque groupe joue sur son propre canal MIDI avec le preset batterie : un
+# "All Sound Off" (CC#120) sur ce canal coupe instantanément ses voix sans
+# toucher au reste du kit. Une frappe d'une autre note du groupe, ou la
+# fermeture de la pédale (note 44, ou CC#4 vers une zone dont la note de
+# pad diffère) pour 'choke_on_pedal', étouffe
+# les notes encore en train de sonner. Le canal de chaque groupe est choisi
+# par kit (KITS, 'choke_channels').
+CHOKE_GROUPS = {
+    'hihat': {'notes': (42, 44, 46), 'choke_on_pedal': True},
 }
+DRUM_CHANNEL = 9
+
+# Kits servis par ce processus : chacun a ses entrées, son état de pédale et
+# ses canaux MIDI sur le synthé partagé (16 canaux : kit + un par choke group).
+# Un canal autre que DRUM_CHANNEL reçoit le preset batterie par bank select.
+# Les noms d'entrées doivent être uniques entre les kits.
+KITS = {
+    'kit1': {'inputs': INPUT_DEVICES, 'channel': DRUM_CHANNEL, 'choke_channels': {'hihat': 10}},
+    # 'kit2': {'inputs': {'dd70-2': {'patterns': ('e-drum', 'DD-70'), 'index': 1, 'mapping': NEW_MAPPING}},
+    #          'channel': 11, 'choke_channels': {'hihat': 12}},
+}
+
+# Les choke groups bornent le nombre de voix actives : inutile d'en réserver 128
+SYNTH_POLYPHONY = 48
+
+# Sortie planifiée : chaque événement est livré à FluidSynth à son heure
+# d'entrée + SCHEDULE_OFFSET_MS via une file du séquenceur ALSA. On échange un
+# petit retard constant contre beaucoup moins de gigue. Régler le décalage
+# d'après "traitement max" affiché à l'arrêt (il doit rester au-dessus).
+SCHEDULED_OUTPUT = False
+SCHEDULE_OFFSET_MS = 4.0
+
+# Sorties supplémentaires (fan-out) : chaque sortie a sa propre file et son
+# thread d'envoi, une sortie bloquée ne retarde jamais le synthé
+LOOPBACK_TO_DD70 = False      # renvoyer aussi les messages remappés au DD-70
+RECORD_PATH = None            # ex: '/home/pi/session.mid'
+DAW_PORT_NAME = None          # ex: 'DD70_DAW' (port virtuel pour un séquenceur/DAW)
+
+# Pré-chauffage au démarrage : chaque note de chaque kit est jouée à chaque
+# couche de vélocité, expression quasi nulle (CC#11=1, inaudible mais le
+# rendu a bien lieu), pour que la première frappe de chaque pad ne soit pas
+# plus lente que les suivantes. Backend 'sampler' : la banque est lue en
+# entier, verrouillée en RAM si LOCK_SAMPLE_MEMORY (LimitMEMLOCK du service).
+PREWARM = True
+PREWARM_VELOCITIES = (16, 32, 48, 64, 80, 96, 112, 127)
+PREWARM_HOLD = 0.03
+LOCK_SAMPLE_MEMORY = False
+
+# Délai max d'apparition du port FluidSynth après son lancement
+FLUIDSYNTH_START_TIMEOUT = 10.0
+# Shell TCP du FluidSynth lancé par le script (test de vie du watchdog)
+FLUIDSYNTH_SHELL_PORT = 9800
+
+# Boucle d'événements (dd70_engine) : watchdog et compteurs partagés toutes
+# les TICK_INTERVAL secondes, socket de contrôle local (dd70-ctl.py), et
+# fichier JSON de mappings relu à chaque modification, sans redémarrer :
+#   {"inputs": {"dd70": {"38": 42, "40": 42, "hihat_controller": 4, "hihat_pads": [38, 40]}}}
+TICK_INTERVAL = 1.0
+CONTROL_SOCKET = True
+CONFIG_PATH = None            # ex: '/home/pi/dd70-mapping.json'
+
+# Réglages modifiables par le socket de contrôle ('set') : type, min, max
+SETTINGS_LIMITS = {
+    'hihat_hysteresis': (int, 0, 15),
+}
+
+def emitted_notes(inputs):
+    """Toutes les notes qu'un kit peut envoyer au synthé"""
+    notes = set(DEFAULT_MAPPING.values())
+    notes.update(zone[2] for zone in HIHAT_ZONES if len(zone) > 2)
+    for device in inputs.values():
+        notes.update(v for k, v in device['mapping'].items() if isinstance(k, int))
+        notes.update(rule['play'] for rule in device['mapping'].get('rules', ()) if 'play' in rule)
+    return notes
+
+
+class KitPipeline:
+    """Un kit : état de pédale, étouffements et canaux MIDI propres"""
+    
+    def __init__(self, name, remapper, channel, choke_channels, index=0):
+        self.name = name
+        self.index = index        # source dans le journal partagé (dd70-diag.py)
+        self.remapper = remapper  # sortie partagée : remapper.output_port
+        self.channel = channel
+        self.choke_channels = choke_channels
+        self.hihat_openness = 0
+        self.pedal_zone = 0       # zone de pédale courante (hystérésis)
+        self.zones = None         # zones de pédale auxquelles pedal_zone se rapporte
+        self.arrival = 0.0  # horodatage d'entrée du message en cours
+        self.chokes_sent = 0
+        self.messages = 0
+        self.hits = HitState()    # frappe précédente et notes en cours (règles)
+        
+        # Table note -> groupe d'étouffement, et notes qui sonnent par groupe
+        self.choke_group_of = {}
+        for group_name, group in CHOKE_GROUPS.items():
+            for note in group['notes']:
+                self.choke_group_of[note] = group_name
+        self.sounding = {group_name: set() for group_name in CHOKE_GROUPS}
+    
+    def setup_channels(self, output=None):
+        """Sélectionne le kit GM sur le canal du kit et de chaque groupe d'étouffement
+        (output : sortie pas encore publiée, lors d'une reconstruction)"""
+        output = output or self.remapper.output_port
+        channels = list(self.choke_channels.values())
+        if self.channel != DRUM_CHANNEL:
+            channels.append(self.channel)
+        for channel in channels:
+            output.send(mido.Message('control_change', channel=channel, control=0, value=127))
+            output.send(mido.Message('program_change', channel=channel, program=0))
+        print(f"✓ {self.name}: canal {self.channel + 1}, choke groups "
+              f"{', '.join(f'{n} (canal {c + 1})' for n, c in self.choke_channels.items())}")
+    
+    def choke(self, name):
+        """Coupe immédiatement les voix d'un groupe (All Sound Off sur son canal)"""
+        if not self.sounding[name]:
+            return
+        channel = self.choke_channels[name]
+        # Même horodatage que la frappe qui étouffe : en sortie planifiée,
+        # l'étouffement reste ordonné avant la nouvelle note
+        choke = mido.Message('control_change', channel=channel, control=120, value=0, time=self.arrival)
+        self.remapper.output_port.send(choke)
+        self.sounding[name].clear()
+        self.chokes_sent += 1
+        diag = self.remapper.diag
+        diag.publish(KIND_CHOKE, self.arrival, 0, pack(choke), self.index, self.hihat_openness)
+        diag.count(COUNT_CHOKES)
+    
+    def on_kit_channel(self, msg):
+        """Place le message sur le canal du kit (copie seulement si nécessaire)"""
+        if msg.channel == self.channel:
+            return msg
+        return msg.copy(channel=self.channel)
+    
+    def route_choke_group(self, msg):
+        """Envoie les notes d'un groupe sur son canal, en étouffant les autres notes du groupe"""
+        name = self.choke_group_of.get(msg.note)
+        if name is None:
+            return self.on_kit_channel(msg)
+        
+        if msg.type == 'note_on' and msg.velocity > 0:
+            if self.sounding[name] - {msg.note}:
+                self.choke(name)
+            self.sounding[name].add(msg.note)
+        return msg.copy(channel=self.choke_channels[name])
+    
+    def pedal_closed(self):
+        """Fermeture de la pédale : étouffe les groupes concernés"""
+        for name, group in CHOKE_GROUPS.items():
+            if group['choke_on_pedal']:
+                self.choke(name)
+    
+    def process_message(self, msg, mapping, table):
+        """Traite et remappe un message MIDI (mapping de l'entrée d'origine,
+        compilé en table de décision) ; None si une règle ignore la frappe
+        ou si un CC#4 ne change pas de zone"""
+        zones = table.zones
+        if zones is not self.zones:
+            # Zones remplacées (socket de contrôle) : zone recalculée sans hystérésis
+            self.zones = zones
+            self.pedal_zone = zones.table[self.hihat_openness]
+        
+        if msg.type == 'control_change' and msg.control == mapping.get('hihat_controller'):
+            previous = self.pedal_zone
+            zone = zones.transitions[previous][msg.value]
+            self.pedal_zone = zone
+            self.hihat_openness = msg.value
+            self.remapper.diag.pedal(self.arrival, PEDAL_CC, msg.value, zone != previous, self.index, zone)
+            if zone < previous and zones.notes[zone] != zones.notes[previous]:
+                self.pedal_closed()
+            cc = zones.cc[zone]
+            if cc is None:
+                return self.on_kit_channel(msg)
+            if zone == previous:
+                return None
+            return msg.copy(channel=self.channel, value=cc)
+        
+        elif msg.type in ['note_on', 'note_off']:
+            if msg.type == 'note_on' and msg.velocity > 0:
+                if msg.note == 44:
+                    # Pédale "chick" : la charleston se ferme
+                    changed = self.pedal_zone > 0
+                    self.hihat_openness = 0
+                    self.pedal_zone = 0
+                    self.remapper.diag.pedal(self.arrival, PEDAL_CHICK, 0, changed, self.index)
+                    self.pedal_closed()
+                
+                hit = self.hits.note_on(table, msg.note, msg.velocity, self.pedal_zone, self.arrival)
+                if hit is None:
+                    return None
+                note, velocity = hit
+                if note != msg.note or velocity != msg.velocity:
+                    msg = msg.copy(note=note, velocity=velocity)
+            else:
+                # note_off : même note que celle jouée par le note_on
+                note = self.hits.note_off(msg.note)
+                if note != msg.note:
+                    msg = msg.copy(note=note)
+            return self.route_choke_group(msg)
+        
+        elif hasattr(msg, 'channel'):
+            return self.on_kit_channel(msg)
+        return msg
+
 
 class DD70RemapperWithSynth:
     def __init__(self):
-        self.input_port = None
         self.output_port = None
+        self.synth_output = None   # sortie vers le synthé (derrière le fan-out s'il y en a un)
+        self.synth_clients = []    # clients ALSA du synthé au moment de la connexion
         self.fluidsynth_process = None
-        self.hihat_openness = 0
+        self.synth_started = 0.0
+        self.shell_ok = True       # dernière réponse du shell FluidSynth (probe_synth)
+        self.probing = False
+        self.send_failed = False   # envoi en échec : route à reconstruire (watchdog)
+        self.seq = AlsaSeq('DD70_Remapper')
+        # Une seule boucle : hotplug, watchdog, supervision du synthé, contrôle
+        # (créée par start_engine, une fois le kit jouable)
+        self.engine = None
+        self.controller = None
+        self.watcher = HotplugWatcher()
+        # Diagnostics hors du processus : enregistrements dans /dev/shm, lus par dd70-diag.py
+        self.diag = DiagWriter()
         
-    def start_fluidsynth_daemon(self):
-        """Démarre FluidSynth en tant que daemon ALSA seq"""
-        soundfont_paths = [
-            '/usr/share/sounds/sf2/FluidR3_GM.sf2',
-            '/usr/share/soundfonts/FluidR3_GM.sf2',
-            '/usr/share/sounds/sf2/default.sf2',
-        ]
-        
-        soundfont = None
-        for path in soundfont_paths:
-            if os.path.exists(path):
-                soundfont = path
-                break
+        # Toutes les entrées de tous les kits passent par le même InputMerger :
+        # un seul verrou sérialise les envois vers la sortie partagée
+        self.inputs = InputMerger(self.handle_message)
+        self.kits = []
+        self.kit_of = {}  # nom d'entrée -> kit
+        for kit_name, config in KITS.items():
+            kit = KitPipeline(kit_name, self, config['channel'], config['choke_channels'], len(self.kits))
+            self.kits.append(kit)
+            for name, device in config['inputs'].items():
+                self.inputs.add(name, device['patterns'], device['mapping'],
+                                required=not self.kit_of, index=device.get('index', 0))
+                self.kit_of[name] = kit
+        self.diag.open([kit.name for kit in self.kits])
+        
+        # Réglages du chemin des notes : remplacés en bloc par le socket de contrôle
+        self.settings = self.compiled(Settings(
+            mappings={device.name: device.mapping for device in self.inputs.devices},
+            hihat_zones=HIHAT_ZONES,
+            hihat_hysteresis=HIHAT_HYSTERESIS,
+        ))
         
+        # Watchdog systemd : chemin des notes et synthé reconstruits sur place
+        self.watchdog = Watchdog()
+        rebuild = self.rebuild_sampler if SYNTH_BACKEND == 'sampler' else self.rebuild_synth
+        self.watchdog.add('Chemin des notes', lambda: not self.inputs.stalled(STALL_TIMEOUT), rebuild)
+        if SYNTH_BACKEND == 'sampler':
+            self.watchdog.add('Moteur audio', lambda: self.synth_output.alive(), rebuild)
+        else:
+            self.watchdog.add('Synthé', self.synth_alive, rebuild)
+        
+    def find_soundfont(self):
+        """Retourne la première banque de sons installée"""
+        for path in SOUNDFONT_PATHS:
+            if os.path.exists(path):
+                return path
+        print("✗ Aucune banque de sons trouvée!")
+        return None
+    
+    def spawn_fluidsynth(self):
+        """Lance FluidSynth en tant que daemon ALSA seq, sans attendre son port"""
+        soundfont = self.find_soundfont()
         if not soundfont:
-            print("✗ Aucune banque de sons trouvée!")
             return False
         
+        import subprocess
+        
         try:
             # Démarrer FluidSynth en mode daemon avec serveur ALSA
             cmd = [
@@ -84,9 +401,13 @@ class DD70RemapperWithSynth:
                 '-g', '2.0',
                 '-r', '48000',
                 '-o', 'audio.alsa.device=hw:0',
-                '-o', 'synth.polyphony=128',
+                '-o', f'synth.polyphony={SYNTH_POLYPHONY}',
+                '-o', 'synth.midi-bank-select=xg',  # CC#0=127 -> canal batterie
+                '-o', 'synth.dynamic-sample-loading=0',  # échantillons chargés au démarrage...
+                '-o', 'synth.lock-memory=1',             # ...et verrouillés en RAM
                 '-o', 'synth.reverb.active=yes',
                 '-o', 'synth.chorus.active=no',
+                '-o', f'shell.port={FLUIDSYNTH_SHELL_PORT}',
                 '-s',  # Mode serveur (pas interactif)
                 soundfont
             ]
@@ -99,83 +420,341 @@ class DD70RemapperWithSynth:
                     stderr=subprocess.STDOUT,
                     stdin=subprocess.DEVNULL
                 )
-            
-            # Attendre que FluidSynth crée son port
+        except Exception as e:
+            print(f"✗ Erreur au démarrage de FluidSynth: {e}")
+            return False
+        
+        self.synth_started = time.monotonic()
+        self.shell_ok = True
+        if self.engine is not None:
+            # Au démarrage, start_engine s'en charge
+            self.engine.supervise(self.fluidsynth_process, self.synth_exited)
+        return True
+    
+    def start_fluidsynth_daemon(self):
+        """Démarre FluidSynth et attend son port (démarrage, avant la boucle)"""
+        if not self.spawn_fluidsynth():
+            return False
+        
+        try:
+            # Attendre que FluidSynth crée son port (annoncé dès qu'il est prêt)
             print("Attente du démarrage de FluidSynth...")
-            time.sleep(3)
-            
-            # Vérifier que le processus tourne
-            if self.fluidsynth_process.poll() is not None:
-                print("✗ FluidSynth s'est arrêté. Voir /tmp/fluidsynth.log")
-                with open('/tmp/fluidsynth.log', 'r') as f:
-                    print(f.read())
-                return False
+            deadline = time.monotonic() + FLUIDSYNTH_START_TIMEOUT
+            while time.monotonic() < deadline:
+                if self.fluidsynth_process.poll() is not None:
+                    print("✗ FluidSynth s'est arrêté. Voir /tmp/fluidsynth.log")
+                    with open('/tmp/fluidsynth.log', 'r') as f:
+                        print(f.read())
+                    return False
+                
+                fluid = self.find_fluidsynth_client()
+                if fluid:
+                    print(f"✓ FluidSynth démarré (client ALSA {fluid.client})")
+                    return True
+                time.sleep(0.05)
             
-            # Trouver le port FluidSynth
-            fluid_client = self.find_fluidsynth_client()
-            if fluid_client:
-                print(f"✓ FluidSynth démarré (client ALSA {fluid_client})")
-                return True
-            else:
-                print("✗ Port FluidSynth non trouvé")
-                return False
+            print("✗ Port FluidSynth non trouvé")
+            return False
                 
         except Exception as e:
             print(f"✗ Erreur au démarrage de FluidSynth: {e}")
             return False
     
-    def find_fluidsynth_client(self):
-        """Trouve le numéro de client FluidSynth"""
+    def start_sampler(self):
+        """Démarre le moteur d'échantillons NumPy comme port de sortie"""
+        from dd70_sampler import SampleEngine
+        
+        soundfont = self.find_soundfont()
+        if not soundfont:
+            return False
+        
+        # Toutes les notes que le remapper peut émettre
+        notes = set()
+        for config in KITS.values():
+            notes.update(emitted_notes(config['inputs']))
+        
+        engine = SampleEngine(soundfont, notes, prewarm=PREWARM, lock_memory=LOCK_SAMPLE_MEMORY)
+        if not engine.start():
+            return False
+        self.set_synth_output(engine, [])
+        return True
+    
+    def find_fluidsynth_client(self, pattern='FLUID'):
+        """Trouve le port d'entrée FluidSynth (PortInfo: client, port, noms)"""
+        return self.seq.find_port(pattern)
+    
+    def open_synth_output(self, fluid, name='DD70_Remapper'):
+        """Crée un port de sortie abonné au port FluidSynth (planifié ou direct)"""
+        if SCHEDULED_OUTPUT:
+            # Une file par sortie : chaque SeqOutput libère la sienne à la fermeture
+            queue = self.seq.create_queue(f'{name}_Schedule')
+            output = self.seq.open_output(fluid.client, fluid.port, name,
+                                          queue=queue, offset=SCHEDULE_OFFSET_MS / 1000)
+        else:
+            output = self.seq.open_output(fluid.client, fluid.port, name)
+        print(f"✓ Ports connectés: {output.seq.client_id}:{output.port} -> {fluid.client}:{fluid.port}")
+        return output
+    
+    def set_synth_output(self, output, shards):
+        """Installe la sortie synthé ; derrière un fan-out, seule celle-ci est remplacée"""
+        if self.output_port is None or self.output_port is self.synth_output:
+            self.output_port = output
+        else:
+            self.output_port.replace(SYNTH_BACKEND, output)
+        self.synth_output = output
+        self.synth_clients = [fluid.client for fluid in shards]
+    
+    def connect_synth(self, fluid):
+        """Crée notre port de sortie et l'abonne au port FluidSynth"""
         try:
-            result = subprocess.run(['aconnect', '-l'], capture_output=True, text=True)
-            for line in result.stdout.split('\n'):
-                if 'FLUID' in line:
-                    match = re.search(r'client (\d+)', line)
-                    if match:
-                        return match.group(1)
-            return None
-        except:
-            return None
-    
-    def create_virtual_port(self):
-        """Crée un port MIDI virtuel pour la sortie"""
+            self.set_synth_output(self.open_synth_output(fluid), [fluid])
+        except AlsaSeqError as e:
+            print(f"✗ Erreur connexion: {e}")
+            return False
+        if SCHEDULED_OUTPUT:
+            print(f"✓ Sortie planifiée: entrée + {SCHEDULE_OFFSET_MS:.1f} ms")
+        return True
+    
+    def find_synth_shards(self):
+        """Instances du synthé persistant : DD70_Synth, DD70_Synth_1, ..."""
+        shards = []
+        while True:
+            shard_id = SYNTH_DAEMON_ID if not shards else f'{SYNTH_DAEMON_ID}_{len(shards)}'
+            # Nom complet "FLUID Synth (DD70_Synth)" : pas de confusion avec DD70_Synth_1
+            fluid = self.find_fluidsynth_client(f'({shard_id})')
+            if not fluid:
+                return shards
+            shards.append(fluid)
+    
+    def build_shard_table(self, count):
+        """Table note -> instance, calculée une fois pour tout le jeu"""
+        table = [0] * 128
+        for shard, notes in SHARD_NOTES.items():
+            if shard < count:
+                for note in notes:
+                    table[note] = shard
+        return table
+    
+    def open_synth_shards(self, shards):
+        """Une sortie par instance, derrière un NoteRouter"""
+        from dd70_fanout import NoteRouter
+        
+        outputs = [self.open_synth_output(fluid, f'DD70_Remapper_{shard}')
+                   for shard, fluid in enumerate(shards)]
+        return NoteRouter(outputs, self.build_shard_table(len(shards)))
+    
+    def connect_synth_shards(self, shards):
         try:
-            # Créer un port virtuel avec mido
-            self.output_port = mido.open_output('DD70_Remapper', virtual=True)
-            print(f"✓ Port virtuel créé: DD70_Remapper")
-            
-            # Attendre que le port soit visible
-            time.sleep(1)
-            
-            # Trouver son numéro de client
-            result = subprocess.run(['aconnect', '-l'], capture_output=True, text=True)
-            our_client = None
-            for line in result.stdout.split('\n'):
-                if 'DD70_Remapper' in line or 'python' in line.lower():
-                    match = re.search(r'client (\d+)', line)
-                    if match:
-                        our_client = match.group(1)
-                        break
-            
-            return our_client
-        except Exception as e:
-            print(f"✗ Erreur création port virtuel: {e}")
-            return None
+            self.set_synth_output(self.open_synth_shards(shards), shards)
+        except AlsaSeqError as e:
+            print(f"✗ Erreur connexion: {e}")
+            return False
+        if SCHEDULED_OUTPUT:
+            print(f"✓ Sortie planifiée: entrée + {SCHEDULE_OFFSET_MS:.1f} ms")
+        print(f"✓ Synthé réparti sur {len(shards)} instances")
+        return True
+    
+    def attach_synth_daemon(self):
+        """S'attache au synthé persistant s'il tourne (aucun démarrage, aucun arrêt)"""
+        shards = self.find_synth_shards()
+        if not shards:
+            return False
+        if len(shards) == 1:
+            if not self.connect_synth(shards[0]):
+                return False
+        elif not self.connect_synth_shards(shards):
+            return False
+        print(f"✓ Attaché au synthé persistant: {', '.join(fluid.client_name for fluid in shards)}")
+        self.setup_kit_channels()
+        return True
+    
+    def start_synth_alsa(self):
+        """Démarre FluidSynth et y relie notre port de sortie"""
+        if not self.start_fluidsynth_daemon():
+            print("\n✗ Impossible de démarrer FluidSynth")
+            return False
+        
+        fluid = self.find_fluidsynth_client()
+        if not fluid:
+            print("✗ Client FluidSynth non trouvé")
+            self.cleanup()
+            return False
+        
+        if not self.connect_synth(fluid):
+            self.cleanup()
+            return False
+        
+        self.setup_kit_channels()
+        return True
+    
+    def current_synth_clients(self):
+        """Instances du synthé visibles maintenant (sous-processus ou synthé persistant)"""
+        if self.fluidsynth_process:
+            fluid = self.find_fluidsynth_client()
+            return [fluid] if fluid else []
+        return self.find_synth_shards()
+    
+    def probe_synth(self):
+        """Interroge le shell de FluidSynth en tâche de fond : le watchdog lit
+        le dernier résultat (shell_ok) sans jamais attendre le réseau"""
+        if self.fluidsynth_process and not self.probing:
+            self.probing = True
+            self.engine.spawn(self.probe_shell(self.fluidsynth_process))
     
-    def connect_ports(self, our_client, fluid_client):
-        """Connecte notre port virtuel à FluidSynth"""
+    async def probe_shell(self, process):
         try:
-            cmd = ['aconnect', f'{our_client}:0', f'{fluid_client}:0']
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                print(f"✓ Ports connectés: {our_client}:0 -> {fluid_client}:0")
-                return True
-            else:
-                print(f"✗ Erreur connexion: {result.stderr}")
+            ok = await shell_probe(FLUIDSYNTH_SHELL_PORT)
+        finally:
+            self.probing = False
+        # Résultat d'une instance remplacée entre-temps : ignoré
+        if process is self.fluidsynth_process:
+            self.shell_ok = ok
+    
+    def synth_alive(self):
+        """Synthé vivant, qui répond, et route intacte : une instance relancée
+        (par nous ou par le synthé persistant) a un nouveau client ALSA et a
+        perdu nos abonnements ; un envoi en échec compte aussi comme route cassée"""
+        if self.fluidsynth_process:
+            if self.fluidsynth_process.poll() is not None or not self.shell_ok:
                 return False
-        except Exception as e:
-            print(f"✗ Erreur: {e}")
+        if self.send_failed:
+            return False
+        return [fluid.client for fluid in self.current_synth_clients()] == self.synth_clients
+    
+    def rebuild_synth(self):
+        """Relance FluidSynth s'il est arrêté ou figé (sous-processus), puis la route.
+        Ne bloque pas la boucle : le nouveau FluidSynth charge sa banque pendant
+        que la boucle tourne, la route est reconstruite dès que son port existe"""
+        process = self.fluidsynth_process
+        if process and process.poll() is None and time.monotonic() - self.synth_started < FLUIDSYNTH_START_TIMEOUT:
+            # Relancé à l'instant : pas encore de shell, on attend seulement son port
+            if not self.find_fluidsynth_client():
+                return False
+        elif process and (process.poll() is not None or not self.shell_ok):
+            # kill débloque aussi un envoi en attente sur son port ALSA
+            process.kill()
+            process.wait()
+            self.spawn_fluidsynth()
             return False
+        return self.rebuild_route()
+    
+    def synth_exited(self, process):
+        """FluidSynth terminé (pidfd) : reprise immédiate, sans attendre le prochain tick"""
+        if process is not self.fluidsynth_process:
+            return
+        print(f"⚠️  FluidSynth arrêté (code {process.returncode})")
+        self.watchdog.tick()
+    
+    def rebuild_route(self):
+        """Nouvelle sortie vers le(s) synthé(s) actuel(s), échangée sans verrou :
+        une affectation d'attribut. Le message en cours finit (ou échoue, handle
+        non bloquant) sur l'ancienne sortie, le suivant part sur la nouvelle"""
+        shards = self.current_synth_clients()
+        if not shards:
+            return False
+        old = self.synth_output
+        try:
+            if len(shards) == 1:
+                output = self.open_synth_output(shards[0])
+            else:
+                output = self.open_synth_shards(shards)
+        except AlsaSeqError as e:
+            print(f"✗ Erreur connexion: {e}")
+            return False
+        # Kit sélectionné sur la nouvelle sortie avant sa première frappe
+        self.setup_kit_channels(output)
+        self.set_synth_output(output, shards)
+        self.send_failed = False
+        if old is not None:
+            try:
+                old.close()
+            except Exception:
+                pass
+        return True
+    
+    def rebuild_sampler(self):
+        """Moteur d'échantillons : flux audio rouvert, banque conservée"""
+        return self.synth_output.restart()
+    
+    def prewarm_synth(self):
+        """Joue chaque note de chaque kit à chaque vélocité, expression quasi nulle"""
+        start = time.perf_counter()
+        played = 0
+        for kit, config in zip(self.kits, KITS.values()):
+            notes_by_channel = {}
+            for note in sorted(emitted_notes(config['inputs'])):
+                group = kit.choke_group_of.get(note)
+                channel = kit.choke_channels[group] if group else kit.channel
+                notes_by_channel.setdefault(channel, []).append(note)
+            
+            for channel in notes_by_channel:
+                self.output_port.send(mido.Message('control_change', channel=channel, control=11, value=1))
+            for velocity in PREWARM_VELOCITIES:
+                for channel, notes in notes_by_channel.items():
+                    for note in notes:
+                        self.output_port.send(mido.Message('note_on', channel=channel, note=note,
+                                                           velocity=velocity))
+                        played += 1
+                time.sleep(PREWARM_HOLD)
+                for channel in notes_by_channel:
+                    self.output_port.send(mido.Message('control_change', channel=channel, control=120, value=0))
+            for channel in notes_by_channel:
+                self.output_port.send(mido.Message('control_change', channel=channel, control=11, value=127))
+        
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"✓ Synthé pré-chauffé: {played} notes en {elapsed_ms:.0f} ms")
+    
+    def setup_kit_channels(self, output=None):
+        for kit in self.kits:
+            kit.setup_channels(output)
+    
+    def open_extra_output(self, name, path=None):
+        """Ouvre une sortie supplémentaire : 'dd70' (boucle), 'record' ou 'daw'"""
+        if name == 'dd70':
+            for port in mido.get_output_names():
+                if 'e-drum' in port or 'DD-70' in port:
+                    return mido.open_output(port)
+            raise ValueError("sortie DD-70 non trouvée")
+        if name == 'record':
+            from dd70_fanout import MidiFileRecorder
+            return MidiFileRecorder(path or RECORD_PATH or time.strftime('/tmp/dd70-%Y%m%d-%H%M%S.mid'))
+        if name == 'daw':
+            return mido.open_output(DAW_PORT_NAME or 'DD70_DAW', virtual=True)
+        raise ValueError(f"sortie inconnue: {name}")
+    
+    def fanout(self):
+        """Fan-out des sorties, créé au premier besoin : la sortie synthé passe
+        derrière lui. Échange sans verrou (une affectation, la boucle n'attend
+        jamais le chemin des notes) : les callbacks étant sérialisés, le message
+        en cours finit sur l'envoi direct avant que le suivant n'entre en file"""
+        from dd70_fanout import FanOut
+        
+        if isinstance(self.output_port, FanOut):
+            return self.output_port
+        fanout = FanOut()
+        fanout.add(SYNTH_BACKEND, self.output_port)
+        self.output_port = fanout
+        return fanout
+    
+    def setup_outputs(self):
+        """Ajoute les sorties supplémentaires derrière un fan-out (si configurées)"""
+        extra = []
+        for name, enabled in (('dd70', LOOPBACK_TO_DD70), ('record', RECORD_PATH), ('daw', DAW_PORT_NAME)):
+            if not enabled:
+                continue
+            try:
+                extra.append((name, self.open_extra_output(name)))
+            except Exception as e:
+                print(f"⚠️  Sortie {name} indisponible: {e}")
+        
+        if not extra:
+            # Une seule sortie : envoi direct, sans saut de thread ni import du fan-out
+            return
+        
+        fanout = self.fanout()
+        for name, port in extra:
+            fanout.add(name, port)
+        print(f"✓ Fan-out: {', '.join(sink.name for sink in fanout.sinks)}")
     
     def list_ports(self):
         """Liste tous les ports MIDI disponibles"""
@@ -183,60 +762,21 @@ class DD70RemapperWithSynth:
         for port in mido.get_input_names():
             print(f"  {port}")
     
-    def connect_input(self, input_name=None):
-        """Connecte au port d'entrée MIDI"""
+    def connect_inputs(self):
+        """Ouvre toutes les entrées configurées (INPUT_DEVICES)"""
         try:
-            input_ports = mido.get_input_names()
-            
-            if not input_ports:
+            self.inputs.wait_for_required()
+            if not mido.get_input_names():
                 print("✗ Aucun port MIDI détecté!")
                 return False
-            
-            if input_name is None:
-                for port in input_ports:
-                    if 'e-drum' in port or 'DD-70' in port:
-                        input_name = port
-                        break
-                if input_name is None:
-                    for port in input_ports:
-                        if 'Through' not in port:
-                            input_name = port
-                            break
-                if input_name is None:
-                    input_name = input_ports[0]
-            
-            self.input_port = mido.open_input(input_name)
-            print(f"✓ Connecté à l'entrée: {input_name}")
-            return True
-            
+            return self.inputs.open_all()
         except Exception as e:
             print(f"✗ Erreur de connexion: {e}")
             return False
     
-    def remap_note(self, note):
-        """Remapper une note MIDI"""
-        return NEW_MAPPING.get(note, note)
-    
-    def process_message(self, msg):
-        """Traite et remappe un message MIDI"""
-        if msg.type == 'control_change' and msg.control == NEW_MAPPING['hihat_controller']:
-            self.hihat_openness = msg.value
-            return msg
-        
-        elif msg.type in ['note_on', 'note_off']:
-            if msg.note in [38, 40]:
-                new_note = 46 if self.hihat_openness > 64 else 42
-                return msg.copy(note=new_note)
-            else:
-                new_note = self.remap_note(msg.note)
-                if new_note != msg.note:
-                    return msg.copy(note=new_note)
-        
-        return msg
-    
     def run(self):
         """Boucle principale"""
-        if not self.input_port or not self.output_port:
+        if not self.inputs.any_open() or not self.output_port:
             print("✗ Ports non connectés")
             return
         
@@ -248,31 +788,225 @@ class DD70RemapperWithSynth:
         print("\nAppuyez sur Ctrl+C pour arrêter")
         print("="*50 + "\n")
         
+        # Les callbacks des entrées tournent déjà : le kit est jouable
+        report_playable()
+        self.start_engine()
+        self.watchdog.ready()
         try:
-            for msg in self.input_port:
-                new_msg = self.process_message(msg)
-                self.output_port.send(new_msg)
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    if msg.note != new_msg.note:
-                        print(f"🥁 Remap: Note {msg.note} -> {new_msg.note} (vel: {msg.velocity})")
-                
-        except KeyboardInterrupt:
+            self.engine.run()
             print("\n✓ Arrêté")
         finally:
             self.cleanup()
     
+    def start_engine(self):
+        """Boucle d'événements et socket de contrôle, importés seulement ici
+        (asyncio pèse sur le temps de démarrage, pas sur les frappes)"""
+        from dd70_control import Controller
+        from dd70_engine import Engine
+        
+        self.engine = Engine()
+        if self.fluidsynth_process:
+            self.engine.supervise(self.fluidsynth_process, self.synth_exited)
+        self.controller = Controller()
+        self.controller.add('stats', self.command_stats, "compteurs des kits, entrées et sorties")
+        self.controller.add('settings', self.command_settings, "réglages en cours")
+        self.controller.add('set', self.command_set, f"modifie un réglage ({', '.join(SETTINGS_LIMITS)})")
+        self.controller.add('mapping', self.command_mapping, "remplace le mapping d'une entrée")
+        self.controller.add('zones', self.command_zones, "remplace les zones de la pédale charleston")
+        self.controller.add('record', self.command_record, "démarre / arrête l'enregistrement .mid")
+        self.controller.add('output', self.command_output, "active / coupe une sortie (dd70, daw, record)")
+        
+        # Les frappes ne passent pas par la boucle : callbacks des entrées
+        self.watcher.attach(self.engine, self.on_hotplug)
+        self.engine.every(TICK_INTERVAL, self.tick)
+        if CONFIG_PATH:
+            self.engine.watch_file(CONFIG_PATH, self.reload_config)
+        if CONTROL_SOCKET:
+            self.engine.serve_control(self.controller)
+    
+    def on_hotplug(self, event):
+        self.engine.spawn(self.inputs.hotplug(event))
+    
+    def tick(self):
+        """Filet de sécurité hotplug, watchdog, compteurs partagés"""
+        self.inputs.resync()
+        self.probe_synth()
+        self.watchdog.tick()
+        self.diag.counters[COUNT_RECONNECTS] = self.inputs.reconnects()
+        self.diag.counters[COUNT_DROPPED] = self.dropped_messages()
+    
+    def compiled(self, settings):
+        """Tables de décision des mappings, compilées hors du chemin des notes
+        (une erreur de règle est levée avant toute publication)"""
+        zones = PedalZones(settings.hihat_zones, settings.hihat_hysteresis)
+        tables = {name: compile_mapping(mapping, zones) for name, mapping in settings.mappings.items()}
+        return settings.replace(zones=zones, tables=tables)
+    
+    def apply(self, **changes):
+        """Publie un nouveau jeu de réglages : une affectation, entre deux messages"""
+        self.settings = self.compiled(self.settings.replace(**changes))
+    
+    def swap_mappings(self, mappings):
+        """Remplace les mappings des entrées nommées (les autres sont conservés)"""
+        unknown = set(mappings) - set(self.settings.mappings)
+        if unknown:
+            raise ValueError(f"entrée inconnue: {', '.join(sorted(unknown))}")
+        self.apply(mappings=dict(self.settings.mappings, **mappings))
+    
+    def reload_config(self, path):
+        """Fichier de mappings modifié : même échange que la commande 'mapping'"""
+        import json
+        from dd70_control import parse_mapping
+        
+        try:
+            with open(path, 'r') as f:
+                config = json.load(f)
+            mappings = {name: parse_mapping(raw) for name, raw in config.get('inputs', {}).items()}
+            self.swap_mappings(mappings)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"⚠️  Configuration {path} ignorée: {e}")
+            return
+        print(f"✓ Mappings rechargés: {', '.join(mappings) or '-'}")
+    
+    def command_stats(self, request):
+        sinks = getattr(self.output_port, 'stats', None)
+        return {
+            'kits': {kit.name: {'messages': kit.messages, 'chokes': kit.chokes_sent,
+                                'hihat_openness': kit.hihat_openness,
+                                'hihat_zone': self.settings.zones.names[kit.pedal_zone]
+                                if kit.zones is self.settings.zones else None} for kit in self.kits},
+            'inputs': {device.name: device.port_name if device.port else None
+                       for device in self.inputs.devices},
+            'outputs': sinks() if sinks else {SYNTH_BACKEND: {}},
+            'reconnects': self.inputs.reconnects(),
+            'dropped': self.dropped_messages(),
+            'loop_lag_max_ms': round(self.engine.lag_max * 1000, 2),
+        }
+    
+    def command_settings(self, request):
+        settings = self.settings
+        return {'mappings': settings.mappings, 'hihat_zones': settings.hihat_zones,
+                'hihat_hysteresis': settings.hihat_hysteresis,
+                'table_cells': {name: table.size for name, table in settings.tables.items()}}
+    
+    def command_set(self, request):
+        from dd70_control import parse_changes
+        self.apply(**parse_changes(request, SETTINGS_LIMITS))
+        return self.command_settings(request)
+    
+    def command_mapping(self, request):
+        name = request.get('input') or self.inputs.devices[0].name
+        from dd70_control import parse_mapping
+        self.swap_mappings({name: parse_mapping(request.get('mapping'))})
+        print(f"✓ Mapping de '{name}' remplacé (socket de contrôle)")
+        return {'input': name, 'mapping': self.settings.mappings[name]}
+    
+    def command_zones(self, request):
+        zones = request.get('zones')
+        if not isinstance(zones, list) or not all(isinstance(zone, list) for zone in zones):
+            raise ValueError("zones: liste de [nom, début, note, gain, cc] attendue")
+        self.apply(hihat_zones=[tuple(zone) for zone in zones])
+        print(f"✓ Zones de pédale remplacées: {', '.join(self.settings.zones.names)}")
+        return self.command_settings(request)
+    
+    def output_names(self):
+        return [sink.name for sink in getattr(self.output_port, 'sinks', [])]
+    
+    def set_output(self, name, on, path=None):
+        """Ajoute ou retire une sortie en cours de jeu ; la sortie synthé reste"""
+        if name == SYNTH_BACKEND:
+            raise ValueError("la sortie synthé ne se coupe pas")
+        present = name in self.output_names()
+        if on and not present:
+            port = self.open_extra_output(name, path)
+            self.fanout().add(name, port)
+            print(f"✓ Sortie '{name}' ajoutée")
+        elif not on and present:
+            # Fermeture après retrait, par le thread de la sortie : la file est
+            # vidée et l'enregistrement sauvegardé sans bloquer la boucle
+            self.output_port.remove(name)
+            print(f"✓ Sortie '{name}' retirée")
+        return {'outputs': self.output_names()}
+    
+    def command_output(self, request):
+        name = request.get('name')
+        return self.set_output(name, bool(request.get('on', name not in self.output_names())),
+                               request.get('path'))
+    
+    def command_record(self, request):
+        response = self.set_output('record', bool(request.get('on', 'record' not in self.output_names())),
+                                   request.get('path'))
+        sink = self.output_port.get('record') if 'record' in response['outputs'] else None
+        response['recording'] = sink.port.path if sink else None
+        return response
+    
+    def dropped_messages(self):
+        """Messages perdus par les files de sortie (fan-out, file du sampler)"""
+        sinks = getattr(self.output_port, 'sinks', [])
+        dropped = sum(sink.dropped + sink.ring.overflows for sink in sinks)
+        for port in [sink.port for sink in sinks] or [self.output_port]:
+            pending = getattr(port, 'pending', None)
+            if pending is not None:
+                dropped += pending.overflows
+        return dropped
+    
+    def handle_message(self, device, msg):
+        """Remappe et envoie un message (appelé depuis le thread rtmidi de
+        l'entrée, sérialisé par InputMerger)"""
+        kit = self.kit_of[device.name]
+        # Un seul instantané des réglages par message (échangé en bloc par le socket de contrôle)
+        settings = self.settings
+        # Horodatage d'entrée posé par InputMerger, utilisé par la sortie planifiée
+        kit.arrival = msg.time
+        kit.messages += 1
+        try:
+            # L'étouffement d'un groupe est envoyé pendant process_message
+            new_msg = kit.process_message(msg, settings.mappings[device.name], settings.tables[device.name])
+            if new_msg is None:
+                # Frappe ignorée par une règle ('drop'), CC#4 sans changement de zone
+                return
+            self.output_port.send(new_msg)
+        except Exception as e:
+            # Client du synthé disparu, par exemple : l'entrée continue, le
+            # watchdog reconstruit la route
+            self.send_failed = True
+            self.diag.count(COUNT_SEND_ERRORS)
+            print(f"⚠️  Envoi impossible: {e}")
+            return
+        # Aucun affichage ici : dd70-diag.py journalise depuis son propre processus
+        self.diag.message(msg, new_msg, kit.index, kit.hihat_openness)
+    
     def cleanup(self):
         """Nettoyage"""
         print("\nNettoyage...")
+        self.watcher.stop()
         
-        if self.input_port:
-            self.input_port.close()
-            print("✓ Port d'entrée fermé")
+        if self.inputs.any_open():
+            self.inputs.close()
+            print("✓ Ports d'entrée fermés")
+        
+        if self.inputs.reconnects():
+            print(f"  Reconnexions hotplug: {self.inputs.reconnects()}")
+        self.watchdog.print_stats()
+        if self.engine:
+            self.engine.print_stats()
             
         if self.output_port:
+            if hasattr(self.output_port, 'print_stats'):
+                # FanOut ou NoteRouter
+                self.output_port.print_stats()
+            outputs = getattr(self.output_port, 'outputs', [self.output_port])
+            for output in outputs:
+                if getattr(output, 'queue', None) is not None:
+                    print(f"  Sortie planifiée {output.name}: traitement max {output.max_processing * 1000:.2f} ms, "
+                          f"{output.late_events} événement(s) au-delà du décalage")
             self.output_port.close()
             print("✓ Port de sortie fermé")
+        self.seq.close()
+        
+        for kit in self.kits:
+            print(f"  {kit.name}: {kit.messages} messages, {kit.chokes_sent} étouffement(s)")
+        self.diag.close()
             
         if self.fluidsynth_process:
             self.fluidsynth_process.terminate()
@@ -285,37 +1019,31 @@ class DD70RemapperWithSynth:
 
 def main():
     print("="*60)
-    print("  DD-70 REMAPPER V3 - avec FluidSynth ALSA")
+    print(f"  DD-70 REMAPPER V3 - backend {SYNTH_BACKEND}")
     print("="*60)
     
     remapper = DD70RemapperWithSynth()
     
-    # Démarrer FluidSynth
-    if not remapper.start_fluidsynth_daemon():
-        print("\n✗ Impossible de démarrer FluidSynth")
+    if SYNTH_BACKEND == 'sampler':
+        if not remapper.start_sampler():
+            print("\n✗ Impossible de démarrer le moteur d'échantillons")
+            return 1
+    elif not remapper.seq.open():
         return 1
-    
-    fluid_client = remapper.find_fluidsynth_client()
-    if not fluid_client:
-        print("✗ Client FluidSynth non trouvé")
-        remapper.cleanup()
+    elif remapper.attach_synth_daemon():
+        pass
+    elif not remapper.start_synth_alsa():
         return 1
     
-    # Créer port virtuel
-    our_client = remapper.create_virtual_port()
-    if not our_client:
-        print("✗ Impossible de créer le port virtuel")
-        remapper.cleanup()
-        return 1
+    # Avant le fan-out : le pré-chauffage ne part pas vers l'enregistrement ou le DAW
+    if PREWARM and SYNTH_BACKEND != 'sampler':
+        remapper.prewarm_synth()
     
-    # Connecter les ports
-    if not remapper.connect_ports(our_client, fluid_client):
-        remapper.cleanup()
-        return 1
+    remapper.setup_outputs()
     
-    # Lister et connecter l'entrée
+    # Lister et connecter les entrées
     remapper.list_ports()
-    if not remapper.connect_input():
+    if not remapper.connect_inputs():
         remapper.cleanup()
         return 1
     
@@ -2,6 +2,18 @@
 """
 DD-70 Remapper - SANS LATENCE
 Remappe les notes MIDI et les renvoie au DD-70 pour génération audio instantanée
+
+Hotplug: si le câble USB est débranché, seuls les ports du DD-70 sont rouverts
+à son retour (udev ou /proc/asound), sans redémarrer le service.
+
+INPUT_BACKEND = 'rawmidi' : lecture/écriture directe sur /dev/snd/midiC*D0,
+sans passer par le séquenceur ALSA ni les threads rtmidi : le descripteur est
+surveillé par la boucle d'événements (dd70_engine), qui porte aussi le
+hotplug, le watchdog et le socket de contrôle.
+
+Le processus ne fait que lire, remapper et renvoyer : messages reçus et
+déductions de la pédale sont écrits dans /dev/shm (dd70_shm) et affichés
+par dd70-diag.py, dans un autre processus.
 """
 
 import mido
@@ -9,6 +21,17 @@ import time
 import sys
 import signal
 
+from dd70_hotplug import HotplugWatcher
+from dd70_boottime import report_playable
+from dd70_pedal import PedalState
+from dd70_rules import HitState, PedalZones, Settings, compile_mapping
+from dd70_watchdog import Watchdog, STALL_TIMEOUT
+from dd70_shm import DiagWriter, COUNT_SEND_ERRORS, COUNT_RECONNECTS, COUNT_DROPPED
+
+# dd70_engine (asyncio) et dd70_control ne sont importés qu'une fois le kit
+# jouable (start_engine) : ils ne servent pas au chemin des notes. Seul le
+# backend 'rawmidi', lu par la boucle, a besoin d'elle dès l'ouverture
+
 # Configuration du remapping
 REMAP = {
     38: 42,  # Caisse claire -> Charleston
@@ -16,15 +39,101 @@ REMAP = {
     42: 38,  # Charleston -> Caisse claire  
     46: 38,
 }
+# Ancien pad caisse claire -> charleston : note de la zone de pédale (HIHAT_ZONES)
+HIHAT_PADS = (38, 40)
+# Règles conditionnelles prioritaires (voir dd70_rules.py), compilées en tables
+RULES = [
+    # {'note': 36, 'previous': 36, 'since_ms': [0, 25], 'drop': True},   # double déclenchement
+]
+
+# Accès au DD-70:
+# - 'rtmidi'  : ports mido/rtmidi via le séquenceur ALSA
+# - 'rawmidi' : périphérique rawmidi ouvert directement (chemin le plus court)
+INPUT_BACKEND = 'rtmidi'
+
+# Délai max pour retrouver les ports du DD-70 après un événement hotplug
+RECONNECT_TIMEOUT = 5.0
+# Temps laissé à ALSA pour retirer les ports après un événement 'remove'
+REMOVE_SETTLE = 0.05
+# Au démarrage (lancé par udev dès l'énumération USB), les ports ALSA du
+# DD-70 peuvent apparaître quelques ms après le périphérique : on les attend
+STARTUP_WAIT = 3.0
+# Watchdog et compteurs partagés, socket de contrôle local (dd70_engine, dd70-ctl.py)
+TICK_INTERVAL = 1.0
+CONTROL_SOCKET = True
+
+# Zones de la pédale (CC#4, 0 = fermée) : nom, début, note des pads 38/40,
+# gain de vélocité, CC#4 renvoyé au DD-70 (None = valeur reçue, sinon envoyé
+# seulement au changement de zone). Hystérésis de HIHAT_HYSTERESIS autour
+# de chaque début de zone, comme dans dd70-remap-synth-v3.py
+HIHAT_ZONES = [
+    ('closed', 0, 42, 1.0, 0),
+    ('tight', 24, 42, 0.85, 40),
+    ('half', 56, 46, 0.7, 72),
+    ('loose', 88, 46, 0.85, 100),
+    ('open', 112, 46, 1.0, 127),
+]
+HIHAT_HYSTERESIS = 3
+
+# Indices de l'état de la pédale, fusionnés par dd70_pedal.PedalState :
+# nom, message, numéro, ouverture (None = valeur du CC), priorité, autorité (s).
+# Un indice est écarté tant qu'une source plus prioritaire fait autorité ;
+# le CC#4 cesse de faire autorité 2 s après son dernier message, et le pad
+# central (42 = fermée, 46 = ouverte) redevient alors la référence.
+PEDAL_CUES = [
+    ('cc', 'control_change', 4, None, 2, 2.0),
+    ('chick', 'note_on', 44, 0, 3, 0.0),          # pédale enfoncée
+    ('pad_closed', 'note_on', 42, 0, 1, 0.0),     # déduction via le pad central
+    ('pad_open', 'note_on', 46, 127, 1, 0.0),
+]
+# Trace des transitions de la pédale écrite en CSV à l'arrêt (None : aucune) ;
+# aussi lisible en cours de jeu : dd70-ctl.py pedal
+PEDAL_TRACE_PATH = None   # ex: '/tmp/dd70-pedal.csv'
+# Boost de vélocité des notes remappées : vel * gain + offset (plafonné à 127)
+VELOCITY_GAIN = 1.3
+VELOCITY_OFFSET = 20
+
+# Réglages modifiables par le socket de contrôle ('set') : type, min, max
+SETTINGS_LIMITS = {
+    'hihat_hysteresis': (int, 0, 15),
+    'velocity_gain': (float, 0.0, 4.0),
+    'velocity_offset': (int, -127, 127),
+}
 
 class DD70RemapperNoLatency:
     def __init__(self):
         self.input_port = None
         self.output_port = None
-        self.hihat_openness = 127  # État par défaut : OUVERT (Pédale relâchée)
+        # État par défaut : OUVERT (Pédale relâchée)
+        self.pedal = PedalState(PEDAL_CUES, openness=127)
+        self.watcher = HotplugWatcher()
+        self.reconnects = 0
+        self.dropped = 0        # messages perdus par les ports fermés (rawmidi)
+        self.busy_since = None  # début du traitement en cours (perf_counter)
+        self.diag = DiagWriter()
+        self.diag.open(['dd70'])
+        self.engine = None      # boucle d'événements (new_engine)
+        self.controller = None
+        
+        # Réglages du chemin des notes : remplacés en bloc par le socket de contrôle
+        self.hits = HitState()
+        self.settings = self.compiled(Settings(
+            mapping=dict(REMAP, hihat_pads=HIHAT_PADS, rules=RULES),
+            hihat_zones=HIHAT_ZONES, hihat_hysteresis=HIHAT_HYSTERESIS,
+            velocity_gain=VELOCITY_GAIN, velocity_offset=VELOCITY_OFFSET))
+        # Watchdog systemd : un envoi bloqué vers le DD-70 -> ports rouverts
+        self.watchdog = Watchdog()
+        self.watchdog.add('Boucle DD-70', lambda: not self.stalled(), self.rebuild_ports)
     
-    def connect(self):
-        """Connecte les ports MIDI"""
+    def find_dd70_ports(self, verbose=False):
+        """Retourne les noms (entrée, sortie) du DD-70, ou (None, None)"""
+        if INPUT_BACKEND == 'rawmidi':
+            from dd70_rawmidi import find_rawmidi_device
+            device = find_rawmidi_device()
+            if not device and verbose:
+                print("✗ Périphérique rawmidi du DD-70 non trouvé (voir /proc/asound/cards)")
+            return device, device
+        
         input_ports = mido.get_input_names()
         output_ports = mido.get_output_names()
         
@@ -43,14 +152,55 @@ class DD70RemapperNoLatency:
                 break
         
         if not dd70_in or not dd70_out:
-            print("✗ DD-70 non trouvé")
-            print("Entrées:", input_ports)
-            print("Sorties:", output_ports)
+            if verbose:
+                print("✗ DD-70 non trouvé")
+                print("Entrées:", input_ports)
+                print("Sorties:", output_ports)
+            return None, None
+        return dd70_in, dd70_out
+    
+    def open_ports(self, dd70_in, dd70_out):
+        """Ouvre la boucle DD-70 : sortie d'abord, puis entrée en mode callback"""
+        if INPUT_BACKEND == 'rawmidi':
+            # Un seul handle rawmidi pour l'entrée et le retour vers le DD-70
+            from dd70_rawmidi import RawMidiPort
+            port = RawMidiPort(dd70_in, callback=self.receive, engine=self.new_engine())
+            self.input_port = self.output_port = port
+            return
+        
+        self.output_port = mido.open_output(dd70_out)
+        # Le callback tourne dans le thread rtmidi : le thread principal reste
+        # libre pour surveiller le hotplug
+        self.input_port = mido.open_input(dd70_in, callback=self.receive)
+    
+    def close_ports(self):
+        """Ferme uniquement les ports du DD-70 (l'état du remapper est conservé)"""
+        self.dropped = self.dropped_messages()
+        if self.input_port:
+            self.input_port.close()
+        if self.output_port and self.output_port is not self.input_port:
+            self.output_port.close()
+        self.input_port = None
+        self.output_port = None
+    
+    def wait_for_ports(self):
+        """Attend jusqu'à STARTUP_WAIT que les ports du DD-70 apparaissent"""
+        start = time.perf_counter()
+        while time.perf_counter() - start < STARTUP_WAIT:
+            dd70_in, dd70_out = self.find_dd70_ports()
+            if dd70_in:
+                return dd70_in, dd70_out
+            time.sleep(0.01)
+        return self.find_dd70_ports(verbose=True)
+    
+    def connect(self):
+        """Connecte les ports MIDI"""
+        dd70_in, dd70_out = self.wait_for_ports()
+        if not dd70_in:
             return False
         
         try:
-            self.input_port = mido.open_input(dd70_in)
-            self.output_port = mido.open_output(dd70_out)
+            self.open_ports(dd70_in, dd70_out)
             
             # S'assurer que le volume du canal MIDI est au maximum
             # Souvent le volume MIDI par défaut n'est pas à 100% sur les entrées
@@ -65,43 +215,58 @@ class DD70RemapperNoLatency:
         except Exception as e:
             print(f"✗ Erreur: {e}")
             return False
-    def remap(self, msg):
-        """Remappe un message MIDI"""
-        # Gestion de la pédale charleston (Control Change CC#4)
-        if msg.type == 'control_change' and msg.control == 4:
-            self.hihat_openness = msg.value
-            return msg  # Passer le CC tel quel
-        
-        # Remapping des notes
-        if msg.type in ['note_on', 'note_off']:
-            # Cas spécial: ancien pad caisse claire (38/40) → Charleston avec pédale
-            if msg.note in [38, 40]:
-                # DEBUG: Afficher l'état de la pédale lors de la frappe
-                print(f"👉 Frappe Pad (Note {msg.note}) | Pédale={self.hihat_openness}")
-                
-                # Choisir charleston ouverte ou fermée selon la pédale
-                # Essai 3 : On remet la logique < 64 = Fermé (car l'essai 2 > 64 donnait "toujours ouvert")
-                if self.hihat_openness < 64:
-                    new_note = 42  # Valeur basse -> Charleston fermée
-                else:
-                    new_note = 46  # Valeur haute -> Charleston ouverte
-                
-                # Boost de volume pour compenser la perte
-                new_vel = msg.velocity
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    new_vel = min(127, int(msg.velocity * 1.3 + 20))
-                
-                return msg.copy(note=new_note, velocity=new_vel)
-            
-            # Remapping standard pour les autres notes
-            new_note = REMAP.get(msg.note, msg.note)
-            if new_note != msg.note:
-                # Boost de volume pour compenser la perte
-                new_vel = msg.velocity
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    new_vel = min(127, int(msg.velocity * 1.3 + 20))
-                return msg.copy(note=new_note, velocity=new_vel)
-        
+    
+    def reopen(self, start=None):
+        """Rouvre les ports du DD-70 s'ils sont présents (un essai, sans attente)"""
+        dd70_in, dd70_out = self.find_dd70_ports()
+        if not dd70_in:
+            return False
+        try:
+            self.open_ports(dd70_in, dd70_out)
+        except Exception as e:
+            print(f"⚠️  Réouverture impossible: {e}")
+            self.close_ports()
+            return False
+        self.output_port.send(mido.Message('control_change', channel=9, control=7, value=127))
+        self.output_port.send(mido.Message('control_change', channel=9, control=11, value=127))
+        self.reconnects += 1
+        elapsed_ms = (time.perf_counter() - (start or time.perf_counter())) * 1000
+        print(f"🔌 DD-70 reconnecté en {elapsed_ms:.1f} ms (reconnexions: {self.reconnects})")
+        return True
+    
+    async def reconnect(self):
+        """Rouvre les ports du DD-70 dès qu'ils réapparaissent (sans bloquer la boucle)"""
+        start = time.perf_counter()
+        return await self.engine.poll_until(lambda: self.input_port is not None or self.reopen(start),
+                                            RECONNECT_TIMEOUT)
+    
+    def stalled(self):
+        """True si un message est en traitement depuis plus de STALL_TIMEOUT"""
+        busy_since = self.busy_since
+        return busy_since is not None and time.perf_counter() - busy_since > STALL_TIMEOUT
+    
+    def rebuild_ports(self):
+        """Ferme et rouvre les ports du DD-70 (débloque un envoi en attente)"""
+        self.close_ports()
+        self.busy_since = None
+        return self.reopen()
+    
+    def remap(self, msg, settings):
+        """Remappe une note avec la table de décision du jeu de réglages du
+        message ; None si une règle ignore la frappe"""
+        if msg.type == 'note_on' and msg.velocity > 0:
+            table = settings.table
+            hit = self.hits.note_on(table, msg.note, msg.velocity, self.pedal.zone, msg.time)
+            if hit is None:
+                return None
+            note, velocity = hit
+            if note != msg.note or velocity != msg.velocity:
+                return msg.copy(note=note, velocity=velocity)
+        elif msg.type in ('note_on', 'note_off'):
+            # note_off : même note que celle jouée par le note_on
+            note = self.hits.note_off(msg.note)
+            if note != msg.note:
+                return msg.copy(note=note)
         return msg
     
     def run(self):
@@ -112,60 +277,196 @@ class DD70RemapperNoLatency:
         print("  Charleston    : Pad bas gauche (ex-caisse claire)")
         print("  Caisse claire : Pad centre (ex-charleston)")
         print("\n  ⚡ Son généré par le DD-70 - AUCUNE LATENCE")
-        print("  🔍 Mode DEBUG: Tous les messages MIDI affichés")
+        print("  🔍 Messages MIDI et pédale: python3 dd70-diag.py (autre processus)")
         print("  Ctrl+C pour arrêter")
         print("="*60 + "\n")
         
+        report_playable()
+        self.start_engine()
+        self.watchdog.ready()
         try:
-            for msg in self.input_port:
-                # DEBUG: Afficher TOUS les messages pour analyse
-                if msg.type != 'clock':
-                    print(f"📥 {msg}")
-
-                # Gestion de la pédale charleston
-                # 1. Via Control Change (Standard)
-                if msg.type == 'control_change' and msg.control == 4:
-                    print(f"🎛️  CC#4 DETECTÉ ! Valeur = {msg.value}")
-                    self.hihat_openness = msg.value
-                
-                # 2. Via Note On 44 (Pédale Chick)
-                elif msg.type == 'note_on' and msg.note == 44:
-                    if msg.velocity > 0:
-                        print("🦶 Pédale ENFONCÉE (Note 44)")
-                        self.hihat_openness = 0  # Fermé
-
-                # 3. DÉDUCTION via le Pad Central (Hi-Hat d'origine)
-                # Si on reçoit une note 42 (Closed HH), c'est que la pédale est fermée
-                # Si on reçoit une note 46 (Open HH), c'est que la pédale est ouverte
-                elif msg.type == 'note_on' and msg.note == 42:
-                    if self.hihat_openness != 0:
-                        print("💡 Déduction via Pad Central: Pédale FERMÉE")
-                    self.hihat_openness = 0
-                elif msg.type == 'note_on' and msg.note == 46:
-                    if self.hihat_openness != 127:
-                        print("💡 Déduction via Pad Central: Pédale OUVERTE")
-                    self.hihat_openness = 127
-
-
-                
-                new_msg = self.remap(msg)
-                self.output_port.send(new_msg)
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    if msg.note != new_msg.note:
-                        print(f"🥁 Note {msg.note} → {new_msg.note} (vel: {msg.velocity})")
-                    
-        except KeyboardInterrupt:
+            self.engine.run()
             print("\n\n✓ Arrêté")
         finally:
             self.cleanup()
     
+    def new_engine(self):
+        """Boucle d'événements, créée au premier besoin (asyncio pèse sur le
+        temps de démarrage, pas sur les frappes)"""
+        if self.engine is None:
+            from dd70_engine import Engine
+            self.engine = Engine()
+        return self.engine
+    
+    def start_engine(self):
+        """Hotplug, watchdog et socket de contrôle, une fois le kit jouable"""
+        from dd70_control import Controller
+        
+        engine = self.new_engine()
+        self.controller = Controller()
+        self.controller.add('stats', self.command_stats, "état de la boucle DD-70")
+        self.controller.add('settings', self.command_settings, "réglages en cours")
+        self.controller.add('set', self.command_set, f"modifie un réglage ({', '.join(SETTINGS_LIMITS)})")
+        self.controller.add('mapping', self.command_mapping, "remplace le mapping (notes, hihat_pads, règles)")
+        self.controller.add('zones', self.command_zones, "remplace les zones de la pédale charleston")
+        self.controller.add('pedal', self.command_pedal, "état de la pédale et trace des transitions")
+        
+        self.watcher.attach(engine, self.on_hotplug)
+        engine.every(TICK_INTERVAL, self.tick)
+        if CONTROL_SOCKET:
+            engine.serve_control(self.controller)
+    
+    def on_hotplug(self, event):
+        self.engine.spawn(self.hotplug(event))
+    
+    async def hotplug(self, event):
+        """Événement hotplug : les attentes cèdent la boucle au lieu de dormir"""
+        import asyncio      # déjà chargé par la boucle ; pas au démarrage du script
+        
+        if event == 'remove' and self.input_port:
+            # Le DD-70 a peut-être disparu : on relâche ses ports
+            self.close_ports()
+            await asyncio.sleep(REMOVE_SETTLE)
+            if self.find_dd70_ports()[0]:
+                # Un autre périphérique a été retiré, le DD-70 est toujours là
+                await self.reconnect()
+            else:
+                print("🔌 DD-70 débranché, en attente de reconnexion...")
+        elif event == 'add' and not self.input_port:
+            await self.reconnect()
+    
+    def tick(self):
+        """Filet de sécurité hotplug, watchdog, compteurs partagés"""
+        if not self.input_port:
+            # Un événement 'add' a pu être manqué
+            self.reopen()
+        self.watchdog.tick()
+        self.diag.counters[COUNT_RECONNECTS] = self.reconnects
+        self.diag.counters[COUNT_DROPPED] = self.dropped_messages()
+    
+    def dropped_messages(self):
+        """Messages perdus, buffer de sortie rawmidi plein (rtmidi : jamais compté)"""
+        return self.dropped + getattr(self.output_port, 'dropped', 0)
+    
+    def compiled(self, settings):
+        """Table de décision du mapping, compilée hors du chemin des notes"""
+        table = compile_mapping(settings.mapping, PedalZones(settings.hihat_zones, settings.hihat_hysteresis),
+                                settings.velocity_gain, settings.velocity_offset)
+        return settings.replace(table=table)
+    
+    def apply(self, **changes):
+        """Publie un nouveau jeu de réglages : une affectation, entre deux messages"""
+        self.settings = self.compiled(self.settings.replace(**changes))
+    
+    def command_stats(self, request):
+        return {
+            'input': getattr(self.input_port, 'name', None),
+            'hihat_openness': self.pedal.openness,
+            'hihat_zone': self.pedal.zones.names[self.pedal.zone] if self.pedal.zones else None,
+            'reconnects': self.reconnects,
+            'dropped': self.dropped_messages(),
+            'loop_lag_max_ms': round(self.engine.lag_max * 1000, 2),
+        }
+    
+    def command_settings(self, request):
+        settings = self.settings.as_dict()
+        table = settings.pop('table')
+        settings['table_cells'] = table.size
+        return settings
+    
+    def command_set(self, request):
+        from dd70_control import parse_changes
+        self.apply(**parse_changes(request, SETTINGS_LIMITS))
+        return self.command_settings(request)
+    
+    def command_mapping(self, request):
+        from dd70_control import parse_mapping
+        mapping = parse_mapping(request.get('mapping'))
+        self.apply(mapping=mapping)
+        print("✓ Mapping remplacé (socket de contrôle)")
+        return {'mapping': mapping}
+    
+    def command_zones(self, request):
+        zones = request.get('zones')
+        if not isinstance(zones, list) or not all(isinstance(zone, list) for zone in zones):
+            raise ValueError("zones: liste de [nom, début, note, gain, cc] attendue")
+        self.apply(hihat_zones=[tuple(zone) for zone in zones])
+        print(f"✓ Zones de pédale remplacées: {', '.join(self.settings.table.zones.names)}")
+        return self.command_settings(request)
+    
+    def command_pedal(self, request):
+        """État fusionné de la pédale et dernières transitions ; 'dump' : trace en CSV"""
+        response = self.pedal.stats(int(request.get('last', 20)))
+        path = request.get('dump')
+        if path:
+            response['dumped'] = self.pedal.dump(path)
+        return response
+    
+    def receive(self, msg):
+        """Callback d'entrée : marque le traitement en cours pour le watchdog"""
+        # Horodatage d'entrée : latence mesurée par dd70-diag.py
+        msg.time = self.busy_since = time.perf_counter()
+        try:
+            self.handle_message(msg)
+        finally:
+            self.busy_since = None
+    
+    def handle_message(self, msg):
+        """Traite un message du DD-70 (thread rtmidi, ou boucle d'événements en rawmidi)
+        Aucun affichage ici : chaque étape est publiée pour dd70-diag.py"""
+        # Un seul instantané des réglages par message (socket de contrôle)
+        settings = self.settings
+        zones = settings.table.zones
+        pedal = self.pedal
+        pedal.sync(zones)
+        
+        # État de la pédale charleston : CC#4, note 44 (chick) et pad central
+        # 42 / 46 fusionnés par priorité et horodatage (dd70_pedal)
+        cue, value = pedal.classify(msg)
+        previous = pedal.zone
+        if cue and pedal.feed(msg.time, cue, value):
+            self.diag.pedal(msg.time, pedal.diag_cue[cue], pedal.openness,
+                            pedal.zone != previous, 0, pedal.zone)
+        
+        if pedal.continuous[cue]:
+            # CC#4 renvoyé au DD-70 : valeur fixée par la zone, seulement au
+            # changement de zone (None : valeur reçue)
+            cc = zones.cc[pedal.zone]
+            if cc is None:
+                new_msg = msg
+            elif pedal.zone != previous:
+                new_msg = msg.copy(value=cc)
+            else:
+                new_msg = None
+        else:
+            new_msg = self.remap(msg, settings)
+        output_port = self.output_port
+        if output_port is None or new_msg is None:
+            return
+        try:
+            output_port.send(new_msg)
+        except Exception as e:
+            self.diag.count(COUNT_SEND_ERRORS)
+            print(f"⚠️  Envoi impossible: {e}")
+            return
+        self.diag.message(msg, new_msg, 0, pedal.openness)
+    
     def cleanup(self):
         """Nettoyage"""
-        if self.input_port:
-            self.input_port.close()
-        if self.output_port:
-            self.output_port.close()
+        self.watcher.stop()
+        self.close_ports()
+        if self.reconnects:
+            print(f"  Reconnexions hotplug: {self.reconnects}")
+        self.watchdog.print_stats()
+        if self.engine:
+            self.engine.print_stats()
+        if PEDAL_TRACE_PATH:
+            try:
+                count = self.pedal.dump(PEDAL_TRACE_PATH)
+                print(f"✓ Trace de la pédale: {count} transitions -> {PEDAL_TRACE_PATH}")
+            except OSError as e:
+                print(f"⚠️  Trace de la pédale non écrite: {e}")
+        self.diag.close()
 
 
 def main():
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Rapport de temps de démarrage d'un remapper DD-70 (budget par phase)
+Mesure, avec l'interpréteur qui lancera le service :
+- interpréteur : `python -c pass` (démarrage de Python et du site/venv)
+- imports      : modules importés par le script (ou l'archive .pyz) sans
+                 lancer main(), détaillés par paquet avec -X importtime
+- backend MIDI : chargement du backend rtmidi de mido (premier appel à
+                 get_input_names, fait par tous les remappers au démarrage)
+et compare chaque phase au budget STARTUP_BUDGET_MS. Code de sortie 1 si
+le budget est dépassé.
+
+Usage:
+python3 dd70-startup-report.py dd70-remap-synth-v3.py
+python3 dd70-startup-report.py /opt/dd70-remap/dd70-remap.pyz
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+# Budget visé sur un Pi 3A+ (ms)
+STARTUP_BUDGET_MS = {
+    'interpréteur': 150,
+    'imports': 250,
+    'backend MIDI': 150,
+}
+RUNS = 3          # on garde la meilleure mesure (caches disque chauds)
+TOP_IMPORTS = 8
+
+# Exécuté dans un interpréteur séparé : run_path avec un autre nom que
+# __main__ importe tout le script sans lancer main()
+PROBE = '''
+import sys, time
+import pkgutil, runpy  # outils de la sonde, hors mesure
+sys.stderr.write('DD70_PROBE_START\\n')
+sys.path.insert(0, {path_dir!r})
+runpy.run_path({target!r}, run_name='dd70_startup_probe')
+sys.stderr.write('DD70_PROBE_BACKEND\\n')
+start = time.perf_counter()
+try:
+    import mido
+    mido.get_input_names()
+    print('BACKEND_MS', (time.perf_counter() - start) * 1000)
+except Exception as e:
+    print('BACKEND_ERROR', e)
+'''
+
+
+def run_python(args):
+    """Lance l'interpréteur, renvoie (durée en ms, stdout, stderr)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, capture_output=True, text=True)
+    return (time.perf_counter() - start) * 1000, result.stdout, result.stderr
+
+
+def parse_importtime(stderr):
+    """Imports de premier niveau après le marqueur : {module: cumul en ms}"""
+    imports = {}
+    active = False
+    for line in stderr.splitlines():
+        if line == 'DD70_PROBE_START':
+            active = True
+            continue
+        if line == 'DD70_PROBE_BACKEND':
+            break
+        if not active or not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2]
+        # Un seul espace d'indentation : import fait directement par le script
+        if len(name) - len(name.lstrip()) == 1:
+            imports[name.strip()] = int(fields[1]) / 1000
+    return imports
+
+
+def measure(target):
+    """Meilleure mesure sur RUNS lancements de chaque phase"""
+    path_dir = target if target.endswith('.pyz') else os.path.dirname(os.path.abspath(target))
+    probe = PROBE.format(path_dir=path_dir, target=os.path.abspath(target))
+
+    interpreter = min(run_python(['-c', 'pass'])[0] for _ in range(RUNS))
+    best = None
+    backend_error = None
+    for _ in range(RUNS):
+        _, stdout, stderr = run_python(['-X', 'importtime', '-c', probe])
+        imports = parse_importtime(stderr)
+        backend = None
+        for line in stdout.splitlines():
+            if line.startswith('BACKEND_MS'):
+                backend = float(line.split()[1])
+            elif line.startswith('BACKEND_ERROR'):
+                backend_error = line[len('BACKEND_ERROR '):]
+        total = sum(imports.values())
+        if 'Traceback' in stderr and not imports:
+            print(stderr)
+            return None
+        if best is None or total < sum(best[0].values()):
+            best = (imports, backend)
+    if backend_error:
+        print(f"⚠️  Backend MIDI indisponible: {backend_error}")
+    return interpreter, best[0], best[1]
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        return 2
+    target = sys.argv[1]
+    result = measure(target)
+    if result is None:
+        print("✗ Le script n'a pas pu être importé")
+        return 1
+    interpreter, imports, backend = result
+
+    phases = {
+        'interpréteur': interpreter,
+        'imports': sum(imports.values()),
+        'backend MIDI': backend,
+    }
+
+    print("="*60)
+    print(f"  Démarrage de {os.path.basename(target)} (Python {sys.version.split()[0]})")
+    print("="*60)
+    over = False
+    for phase, elapsed in phases.items():
+        budget = STARTUP_BUDGET_MS[phase]
+        if elapsed is None:
+            print(f"  ?  {phase:<14} non mesuré       (budget {budget} ms)")
+            continue
+        ok = elapsed <= budget
+        over = over or not ok
+        print(f"  {'✓' if ok else '✗'}  {phase:<14} {elapsed:7.1f} ms   (budget {budget} ms)")
+    total = sum(v for v in phases.values() if v is not None)
+    print(f"     {'total':<14} {total:7.1f} ms   (budget {sum(STARTUP_BUDGET_MS.values())} ms)")
+
+    print("\nImports les plus coûteux (cumul, ms):")
+    for name, elapsed in sorted(imports.items(), key=lambda item: -item[1])[:TOP_IMPORTS]:
+        print(f"  {elapsed:7.1f}  {name}")
+
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
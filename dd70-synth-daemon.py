@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+DD-70 Synth Daemon - FluidSynth persistant
+Fait tourner FluidSynth comme un service indépendant du remapper : la banque
+de sons et le périphérique audio ne sont chargés qu'une fois. Le remapper
+s'y attache via un client ALSA au nom stable (SYNTH_ID) et peut redémarrer
+en quelques millisecondes sans couper le son.
+
+Si FluidSynth s'arrête, le daemon le relance (compteur de redémarrages).
+Une instance figée (vivante mais dont le shell ne répond plus) est tuée puis
+relancée de la même façon ; le daemon ne bat pour le watchdog systemd que
+si toutes ses instances répondent.
+
+Avec SYNTH_SHARDS > 1, le kit est réparti sur plusieurs instances FluidSynth
+(ex: cymbales/charleston d'un côté, fûts de l'autre), chacune épinglée sur
+son cœur CPU et mixées par dmix (ou JACK). Les clients ALSA s'appellent
+DD70_Synth, DD70_Synth_1, ... ; le remapper V3 y envoie chaque note selon
+sa table SHARD_NOTES. Seule l'instance arrêtée est relancée.
+
+Requirements:
+- fluidsynth
+- fluid-soundfont-gm
+
+Usage:
+python3 dd70-synth-daemon.py
+(ou via le service systemd dd70-synth installé par install.sh)
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from dd70_watchdog import sd_notify, shell_responds, watchdog_interval
+
+# Identifiant stable du client ALSA : "FLUID Synth (DD70_Synth)"
+SYNTH_ID = 'DD70_Synth'
+
+# Port TCP du shell FluidSynth (commandes à chaud : réglages, reverb...)
+SHELL_PORT = 9800
+
+SOUNDFONT_PATHS = [
+    '/usr/share/sounds/sf2/FluidR3_GM.sf2',
+    '/usr/share/soundfonts/FluidR3_GM.sf2',
+    '/usr/share/sounds/sf2/default.sf2',
+]
+
+AUDIO_DEVICE = 'hw:0'
+
+# Nombre d'instances FluidSynth (1 = comportement historique). Au-delà, les
+# instances partagent la carte son via dmix ('alsa') ou le serveur JACK ('jack')
+SYNTH_SHARDS = 1
+SHARD_AUDIO_DRIVER = 'alsa'
+SHARD_AUDIO_DEVICE = 'plug:dmix'
+# Cœurs CPU des instances (le cœur 0 reste au remapper et aux IRQ USB) ;
+# Pi 3A+ : 4 cœurs
+SHARD_CORES = (1, 2, 3)
+SYNTH_POLYPHONY = 48
+RESTART_DELAY = 1.0
+LOG_PATH = '/tmp/fluidsynth.log'
+
+# Délestage adaptatif : sous charge (CPU, xruns), réduit polyphonie, reverb
+# et interpolation via le shell, puis restaure quand la charge retombe
+LOAD_SHEDDING = True
+
+# Attente du client ALSA avant de signaler "prêt" à systemd
+READY_TIMEOUT = 15.0
+# Test de vie des instances via leur shell TCP : figée après N échecs de suite
+PROBE_INTERVAL = 1.0
+PROBE_FAILURES = 3
+SEQ_CLIENTS = '/proc/asound/seq/clients'
+
+
+def shard_id(shard):
+    """Nom du client ALSA d'une instance : DD70_Synth, DD70_Synth_1, ..."""
+    return SYNTH_ID if shard == 0 else f'{SYNTH_ID}_{shard}'
+
+
+class SynthDaemon:
+    def __init__(self):
+        self.processes = [None] * SYNTH_SHARDS
+        self.probe_failures = [0] * SYNTH_SHARDS
+        self.running = True
+        self.restarts = 0
+        self.hangs = 0
+        self.watchdog_interval = watchdog_interval()
+        self.last_probe = 0.0
+        self.last_ping = 0.0
+        self.shedder = None
+        if LOAD_SHEDDING:
+            from dd70_loadshed import LoadShedder
+            self.shedder = LoadShedder([SHELL_PORT + shard for shard in range(SYNTH_SHARDS)],
+                                       SYNTH_POLYPHONY, LOG_PATH)
+
+    def find_soundfont(self):
+        """Retourne la première banque de sons installée"""
+        for path in SOUNDFONT_PATHS:
+            if os.path.exists(path):
+                return path
+        print("✗ Aucune banque de sons trouvée!")
+        print("Installez: sudo apt-get install fluid-soundfont-gm")
+        return None
+
+    def audio_options(self, shard):
+        """Sortie audio : carte directe avec une seule instance, sinon mixage"""
+        if SYNTH_SHARDS == 1:
+            return ['-a', 'alsa', '-o', f'audio.alsa.device={AUDIO_DEVICE}']
+        if SHARD_AUDIO_DRIVER == 'jack':
+            return ['-a', 'jack', '-o', f'audio.jack.id={shard_id(shard)}', '-o', 'audio.jack.autoconnect=1']
+        return ['-a', 'alsa', '-o', f'audio.alsa.device={SHARD_AUDIO_DEVICE}']
+
+    def fluidsynth_command(self, soundfont, shard=0):
+        """Ligne de commande FluidSynth (mêmes réglages que le remapper V3)"""
+        return [
+            'fluidsynth',
+            *self.audio_options(shard),
+            '-m', 'alsa_seq',
+            '-g', '2.0',
+            '-r', '48000',
+            '-o', f'midi.alsa_seq.id={shard_id(shard)}',
+            '-o', f'shell.port={SHELL_PORT + shard}',
+            '-o', f'synth.polyphony={SYNTH_POLYPHONY}',
+            '-o', 'synth.midi-bank-select=xg',  # CC#0=127 -> canal batterie (choke groups)
+            '-o', 'synth.dynamic-sample-loading=0',  # échantillons chargés au démarrage...
+            '-o', 'synth.lock-memory=1',             # ...et verrouillés en RAM (LimitMEMLOCK)
+            '-o', 'synth.reverb.active=yes',
+            '-o', 'synth.chorus.active=no',
+            '-i',  # Pas de shell sur stdin
+            '-s',  # Serveur shell TCP
+            soundfont
+        ]
+
+    def pin_to_core(self, shard):
+        """preexec_fn : épingle l'instance sur son cœur avant l'exec de FluidSynth"""
+        if SYNTH_SHARDS == 1 or not SHARD_CORES:
+            return None
+        cores = {SHARD_CORES[shard % len(SHARD_CORES)]} & os.sched_getaffinity(0)
+        if not cores:
+            return None
+        return lambda: os.sched_setaffinity(0, cores)
+
+    def start_fluidsynth(self, soundfont, shard=0):
+        """Démarre une instance FluidSynth en arrière-plan"""
+        try:
+            with open(LOG_PATH, 'a') as log:
+                process = subprocess.Popen(
+                    self.fluidsynth_command(soundfont, shard),
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL,
+                    preexec_fn=self.pin_to_core(shard)
+                )
+            self.processes[shard] = process
+            cores = ','.join(str(c) for c in sorted(os.sched_getaffinity(process.pid)))
+            print(f"✓ FluidSynth démarré (PID: {process.pid}, client ALSA '{shard_id(shard)}', cœurs {cores})")
+            return True
+        except FileNotFoundError:
+            print("✗ FluidSynth non installé!")
+            print("Installez: sudo apt-get install fluidsynth")
+            return False
+        except Exception as e:
+            print(f"✗ Erreur au démarrage de FluidSynth: {e}")
+            return False
+
+    def wait_for_port(self, shard=0):
+        """Attend que le client ALSA de l'instance soit visible"""
+        # Nom complet "FLUID Synth (DD70_Synth)" : DD70_Synth ne doit pas
+        # correspondre à DD70_Synth_1
+        client_name = f'({shard_id(shard)})'
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.processes[shard].poll() is not None:
+                return False
+            try:
+                with open(SEQ_CLIENTS, 'r') as f:
+                    if client_name in f.read():
+                        return True
+            except OSError:
+                pass
+            time.sleep(0.05)
+        return False
+
+    def notify_ready(self):
+        """Signale à systemd (Type=notify) que le port du synthé est prêt"""
+        sd_notify('READY=1')
+
+    def probe_shards(self):
+        """Tue les instances figées (relancées par la boucle) ; battement si toutes répondent"""
+        now = time.monotonic()
+        if now - self.last_probe < PROBE_INTERVAL:
+            return
+        self.last_probe = now
+        healthy = True
+        for shard, process in enumerate(self.processes):
+            if process.poll() is not None:
+                healthy = False
+                continue
+            if shell_responds(SHELL_PORT + shard):
+                self.probe_failures[shard] = 0
+                continue
+            healthy = False
+            self.probe_failures[shard] += 1
+            if self.probe_failures[shard] >= PROBE_FAILURES:
+                self.hangs += 1
+                print(f"⚠️  FluidSynth '{shard_id(shard)}' ne répond plus, arrêt forcé")
+                process.kill()
+                process.wait()
+                self.probe_failures[shard] = 0
+        if healthy and self.watchdog_interval and now - self.last_ping >= self.watchdog_interval:
+            sd_notify('WATCHDOG=1')
+            self.last_ping = now
+
+    def start_shard(self, soundfont, shard):
+        """Démarre une instance et attend son port ALSA"""
+        if not self.start_fluidsynth(soundfont, shard):
+            return False
+        if self.wait_for_port(shard):
+            print(f"✓ Port ALSA '{shard_id(shard)}' prêt")
+        else:
+            print(f"⚠️  Port ALSA '{shard_id(shard)}' non visible. Voir {LOG_PATH}")
+        return True
+
+    def run(self):
+        """Supervise les instances FluidSynth : relance immédiate de celle qui s'arrête"""
+        soundfont = self.find_soundfont()
+        if not soundfont:
+            return 1
+
+        for shard in range(SYNTH_SHARDS):
+            if not self.start_shard(soundfont, shard):
+                return 1
+        self.notify_ready()
+
+        while self.running:
+            time.sleep(0.2)
+            if self.shedder:
+                self.shedder.update([process.pid for process in self.processes if process.poll() is None])
+            self.probe_shards()
+            for shard, process in enumerate(self.processes):
+                returncode = process.poll()
+                if returncode is None or not self.running:
+                    continue
+                self.restarts += 1
+                print(f"⚠️  FluidSynth '{shard_id(shard)}' arrêté (code {returncode}), "
+                      f"relance #{self.restarts}. Voir {LOG_PATH}")
+                time.sleep(RESTART_DELAY)
+                if not self.start_shard(soundfont, shard):
+                    return 1
+                if self.shedder:
+                    self.shedder.reapply(SHELL_PORT + shard)
+
+        if self.shedder:
+            self.shedder.print_summary()
+        if self.hangs:
+            print(f"  Instances figées relancées: {self.hangs}")
+        return 0
+
+    def stop(self, signum=None, frame=None):
+        """Arrêt propre (SIGTERM de systemd ou Ctrl+C)"""
+        self.running = False
+        for process in self.processes:
+            if process and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                print("✓ FluidSynth arrêté")
+
+
+def main():
+    print("="*60)
+    print("  DD-70 SYNTH DAEMON - FluidSynth persistant")
+    print("="*60)
+
+    daemon = SynthDaemon()
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    return daemon.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
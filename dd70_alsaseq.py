@@ -0,0 +1,486 @@
+"""
+Client natif du séquenceur ALSA (alsa-lib via ctypes)
+Remplace les appels à `aconnect -l` + expressions régulières : lister les
+clients/ports, créer nos ports, abonner des routes et recevoir les
+événements d'annonce (ports qui apparaissent/disparaissent) se fait en
+quelques appels système, sans lancer de processus.
+
+SeqOutput peut aussi planifier les événements sur une file (queue) du
+séquenceur : horodatage d'entrée + décalage fixe, livrés par le timer du
+noyau plutôt qu'au rythme de l'ordonnanceur Python.
+
+Le tampon d'émission d'alsa-lib n'est pas thread-safe : les sorties
+(SeqOutput, appelées depuis les threads d'entrée ou d'envoi) ont leur
+propre handle, distinct de celui qu'énumère la boucle d'événements, et un
+verrou tenu seulement le temps d'un envoi (output + drain).
+
+Requirements:
+- libasound2 (déjà présent avec alsa-utils / python3-rtmidi)
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import threading
+import time
+
+# snd_seq_open
+SND_SEQ_OPEN_OUTPUT = 1
+SND_SEQ_OPEN_INPUT = 2
+SND_SEQ_OPEN_DUPLEX = 3
+SND_SEQ_NONBLOCK = 1
+POLLIN = 0x001
+
+# Capacités et types de ports
+SND_SEQ_PORT_CAP_READ = 1 << 0
+SND_SEQ_PORT_CAP_WRITE = 1 << 1
+SND_SEQ_PORT_CAP_SUBS_READ = 1 << 5
+SND_SEQ_PORT_CAP_SUBS_WRITE = 1 << 6
+SND_SEQ_PORT_CAP_NO_EXPORT = 1 << 7
+SND_SEQ_PORT_TYPE_MIDI_GENERIC = 1 << 1
+SND_SEQ_PORT_TYPE_APPLICATION = 1 << 20
+
+SND_SEQ_USER_CLIENT = 1
+SND_SEQ_KERNEL_CLIENT = 2
+
+# Adresses spéciales
+SND_SEQ_CLIENT_SYSTEM = 0
+SND_SEQ_PORT_SYSTEM_ANNOUNCE = 1
+SND_SEQ_ADDRESS_SUBSCRIBERS = 254
+SND_SEQ_QUEUE_DIRECT = 253
+
+# Horodatage des événements (champ flags)
+SND_SEQ_TIME_STAMP_REAL = 1 << 0
+SND_SEQ_TIME_MODE_REL = 1 << 1
+
+# Types d'événements
+SND_SEQ_EVENT_NOTEON = 6
+SND_SEQ_EVENT_NOTEOFF = 7
+SND_SEQ_EVENT_CONTROLLER = 10
+SND_SEQ_EVENT_PGMCHANGE = 11
+SND_SEQ_EVENT_START = 30
+SND_SEQ_EVENT_CLIENT_START = 60
+SND_SEQ_EVENT_CLIENT_EXIT = 61
+SND_SEQ_EVENT_PORT_START = 63
+SND_SEQ_EVENT_PORT_EXIT = 64
+
+
+class SeqAddr(ctypes.Structure):
+    _fields_ = [('client', ctypes.c_ubyte), ('port', ctypes.c_ubyte)]
+
+
+class SeqRealTime(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_uint), ('tv_nsec', ctypes.c_uint)]
+
+
+class SeqTimestamp(ctypes.Union):
+    _fields_ = [('tick', ctypes.c_uint), ('time', SeqRealTime)]
+
+
+class SeqEvNote(ctypes.Structure):
+    _fields_ = [('channel', ctypes.c_ubyte), ('note', ctypes.c_ubyte),
+                ('velocity', ctypes.c_ubyte), ('off_velocity', ctypes.c_ubyte),
+                ('duration', ctypes.c_uint)]
+
+
+class SeqEvCtrl(ctypes.Structure):
+    _fields_ = [('channel', ctypes.c_ubyte), ('unused', ctypes.c_ubyte * 3),
+                ('param', ctypes.c_uint), ('value', ctypes.c_int)]
+
+
+class SeqEventData(ctypes.Union):
+    _fields_ = [('note', SeqEvNote), ('control', SeqEvCtrl), ('addr', SeqAddr),
+                ('raw8', ctypes.c_ubyte * 12)]
+
+
+class SeqEvent(ctypes.Structure):
+    """snd_seq_event_t (28 octets)"""
+    _fields_ = [('type', ctypes.c_ubyte), ('flags', ctypes.c_ubyte),
+                ('tag', ctypes.c_ubyte), ('queue', ctypes.c_ubyte),
+                ('time', SeqTimestamp),
+                ('source', SeqAddr), ('dest', SeqAddr),
+                ('data', SeqEventData)]
+
+
+class PollFd(ctypes.Structure):
+    """struct pollfd"""
+    _fields_ = [('fd', ctypes.c_int), ('events', ctypes.c_short), ('revents', ctypes.c_short)]
+
+
+PortInfo = collections.namedtuple(
+    'PortInfo', 'client port client_name port_name capability type client_type')
+
+
+def load_libasound():
+    """Charge libasound, None si indisponible"""
+    path = ctypes.util.find_library('asound') or 'libasound.so.2'
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError:
+        return None
+
+    vp = ctypes.c_void_p
+    signatures = {
+        'snd_seq_open': (ctypes.c_int, [ctypes.POINTER(vp), ctypes.c_char_p, ctypes.c_int, ctypes.c_int]),
+        'snd_seq_close': (ctypes.c_int, [vp]),
+        'snd_seq_set_client_name': (ctypes.c_int, [vp, ctypes.c_char_p]),
+        'snd_seq_client_id': (ctypes.c_int, [vp]),
+        'snd_seq_nonblock': (ctypes.c_int, [vp, ctypes.c_int]),
+        'snd_seq_poll_descriptors_count': (ctypes.c_int, [vp, ctypes.c_short]),
+        'snd_seq_poll_descriptors': (ctypes.c_int, [vp, ctypes.POINTER(PollFd), ctypes.c_uint, ctypes.c_short]),
+        'snd_seq_client_info_malloc': (ctypes.c_int, [ctypes.POINTER(vp)]),
+        'snd_seq_client_info_free': (None, [vp]),
+        'snd_seq_client_info_set_client': (None, [vp, ctypes.c_int]),
+        'snd_seq_client_info_get_client': (ctypes.c_int, [vp]),
+        'snd_seq_client_info_get_name': (ctypes.c_char_p, [vp]),
+        'snd_seq_client_info_get_type': (ctypes.c_int, [vp]),
+        'snd_seq_get_any_client_info': (ctypes.c_int, [vp, ctypes.c_int, vp]),
+        'snd_seq_query_next_client': (ctypes.c_int, [vp, vp]),
+        'snd_seq_port_info_malloc': (ctypes.c_int, [ctypes.POINTER(vp)]),
+        'snd_seq_port_info_free': (None, [vp]),
+        'snd_seq_port_info_set_client': (None, [vp, ctypes.c_int]),
+        'snd_seq_port_info_set_port': (None, [vp, ctypes.c_int]),
+        'snd_seq_port_info_get_port': (ctypes.c_int, [vp]),
+        'snd_seq_port_info_get_name': (ctypes.c_char_p, [vp]),
+        'snd_seq_port_info_get_capability': (ctypes.c_uint, [vp]),
+        'snd_seq_port_info_get_type': (ctypes.c_uint, [vp]),
+        'snd_seq_query_next_port': (ctypes.c_int, [vp, vp]),
+        'snd_seq_create_simple_port': (ctypes.c_int, [vp, ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint]),
+        'snd_seq_delete_simple_port': (ctypes.c_int, [vp, ctypes.c_int]),
+        'snd_seq_connect_to': (ctypes.c_int, [vp, ctypes.c_int, ctypes.c_int, ctypes.c_int]),
+        'snd_seq_connect_from': (ctypes.c_int, [vp, ctypes.c_int, ctypes.c_int, ctypes.c_int]),
+        'snd_seq_event_output_direct': (ctypes.c_int, [vp, ctypes.POINTER(SeqEvent)]),
+        'snd_seq_event_output': (ctypes.c_int, [vp, ctypes.POINTER(SeqEvent)]),
+        'snd_seq_drain_output': (ctypes.c_int, [vp]),
+        'snd_seq_alloc_named_queue': (ctypes.c_int, [vp, ctypes.c_char_p]),
+        'snd_seq_free_queue': (ctypes.c_int, [vp, ctypes.c_int]),
+        'snd_seq_control_queue': (ctypes.c_int, [vp, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.POINTER(SeqEvent)]),
+        'snd_seq_event_input': (ctypes.c_int, [vp, ctypes.POINTER(ctypes.POINTER(SeqEvent))]),
+        'snd_strerror': (ctypes.c_char_p, [ctypes.c_int]),
+    }
+    for name, (restype, argtypes) in signatures.items():
+        func = getattr(lib, name)
+        func.restype = restype
+        func.argtypes = argtypes
+    return lib
+
+
+_lib = None
+
+
+def libasound():
+    global _lib
+    if _lib is None:
+        _lib = load_libasound()
+    return _lib
+
+
+class AlsaSeqError(Exception):
+    pass
+
+
+class AlsaSeq:
+    """Handle du séquenceur ALSA : énumération, ports, routes, annonces"""
+
+    def __init__(self, client_name='DD70_Remapper'):
+        self.client_name = client_name
+        self.handle = ctypes.c_void_p()
+        self.lib = None
+        self.client_id = None
+        self.streams = None
+        self.output_seq = None
+        self.lock = threading.Lock()    # tampon d'émission (sorties)
+
+    def open(self, streams=SND_SEQ_OPEN_DUPLEX, verbose=True):
+        """Ouvre le séquenceur, False si alsa-lib est absent ou inaccessible"""
+        self.lib = libasound()
+        if self.lib is None:
+            if verbose:
+                print("✗ libasound introuvable (sudo apt-get install libasound2)")
+            return False
+        err = self.lib.snd_seq_open(ctypes.byref(self.handle), b'default', streams, 0)
+        if err < 0:
+            if verbose:
+                print(f"✗ Séquenceur ALSA indisponible: {self.strerror(err)}")
+            return False
+        self.lib.snd_seq_set_client_name(self.handle, self.client_name.encode())
+        self.client_id = self.lib.snd_seq_client_id(self.handle)
+        self.streams = streams
+        return True
+
+    def outputs(self):
+        """Handle des sorties (même nom de client), ouvert au premier besoin"""
+        if self.streams == SND_SEQ_OPEN_OUTPUT:
+            return self
+        if self.output_seq is None:
+            seq = AlsaSeq(self.client_name)
+            if not seq.open(SND_SEQ_OPEN_OUTPUT, verbose=False):
+                raise AlsaSeqError("séquenceur ALSA indisponible pour les sorties")
+            # Non bloquant : un synthé qui ne lit plus fait échouer l'envoi
+            # (compté, route reconstruite) au lieu de bloquer le chemin des notes
+            seq.check(seq.lib.snd_seq_nonblock(seq.handle, 1), "mode non bloquant")
+            self.output_seq = seq
+        return self.output_seq
+
+    def strerror(self, err):
+        return self.lib.snd_strerror(err).decode(errors='replace')
+
+    def check(self, err, what):
+        if err < 0:
+            raise AlsaSeqError(f"{what}: {self.strerror(err)}")
+        return err
+
+    def ports(self):
+        """Liste tous les ports de tous les clients (sauf le client système)"""
+        lib = self.lib
+        cinfo = ctypes.c_void_p()
+        pinfo = ctypes.c_void_p()
+        lib.snd_seq_client_info_malloc(ctypes.byref(cinfo))
+        lib.snd_seq_port_info_malloc(ctypes.byref(pinfo))
+        result = []
+        try:
+            lib.snd_seq_client_info_set_client(cinfo, -1)
+            while lib.snd_seq_query_next_client(self.handle, cinfo) >= 0:
+                client = lib.snd_seq_client_info_get_client(cinfo)
+                if client == SND_SEQ_CLIENT_SYSTEM:
+                    continue
+                client_name = lib.snd_seq_client_info_get_name(cinfo).decode(errors='replace')
+                client_type = lib.snd_seq_client_info_get_type(cinfo)
+                lib.snd_seq_port_info_set_client(pinfo, client)
+                lib.snd_seq_port_info_set_port(pinfo, -1)
+                while lib.snd_seq_query_next_port(self.handle, pinfo) >= 0:
+                    result.append(PortInfo(
+                        client,
+                        lib.snd_seq_port_info_get_port(pinfo),
+                        client_name,
+                        lib.snd_seq_port_info_get_name(pinfo).decode(errors='replace'),
+                        lib.snd_seq_port_info_get_capability(pinfo),
+                        lib.snd_seq_port_info_get_type(pinfo),
+                        client_type,
+                    ))
+        finally:
+            lib.snd_seq_port_info_free(pinfo)
+            lib.snd_seq_client_info_free(cinfo)
+        return result
+
+    def find_port(self, pattern, capability=SND_SEQ_PORT_CAP_WRITE | SND_SEQ_PORT_CAP_SUBS_WRITE):
+        """Premier port dont le nom de client ou de port contient `pattern`
+        et qui offre `capability` (par défaut: accepte des abonnements en écriture).
+        Nos propres ports (handle des sorties compris) sont exclus."""
+        own = {self.client_id, self.output_seq.client_id if self.output_seq else None}
+        for info in self.ports():
+            if info.client in own:
+                continue
+            if (info.capability & capability) != capability:
+                continue
+            if pattern in info.client_name or pattern in info.port_name:
+                return info
+        return None
+
+    def client_type(self, client):
+        """Type du client (SND_SEQ_KERNEL_CLIENT pour le matériel), None s'il n'existe plus"""
+        cinfo = ctypes.c_void_p()
+        self.lib.snd_seq_client_info_malloc(ctypes.byref(cinfo))
+        try:
+            if self.lib.snd_seq_get_any_client_info(self.handle, client, cinfo) < 0:
+                return None
+            return self.lib.snd_seq_client_info_get_type(cinfo)
+        finally:
+            self.lib.snd_seq_client_info_free(cinfo)
+
+    def create_port(self, name, capability, port_type=SND_SEQ_PORT_TYPE_MIDI_GENERIC | SND_SEQ_PORT_TYPE_APPLICATION):
+        return self.check(
+            self.lib.snd_seq_create_simple_port(self.handle, name.encode(), capability, port_type),
+            f"création du port {name}")
+
+    def connect_to(self, port, dest_client, dest_port):
+        """Abonne notre port `port` -> dest_client:dest_port"""
+        self.check(self.lib.snd_seq_connect_to(self.handle, port, dest_client, dest_port),
+                   f"connexion vers {dest_client}:{dest_port}")
+
+    def connect_from(self, port, src_client, src_port):
+        """Abonne src_client:src_port -> notre port `port`"""
+        self.check(self.lib.snd_seq_connect_from(self.handle, port, src_client, src_port),
+                   f"connexion depuis {src_client}:{src_port}")
+
+    def watch_announce(self):
+        """Crée un port caché abonné aux annonces du système (ports/clients)"""
+        port = self.create_port(
+            'announce',
+            SND_SEQ_PORT_CAP_WRITE | SND_SEQ_PORT_CAP_NO_EXPORT,
+            SND_SEQ_PORT_TYPE_APPLICATION)
+        self.connect_from(port, SND_SEQ_CLIENT_SYSTEM, SND_SEQ_PORT_SYSTEM_ANNOUNCE)
+        return port
+
+    def input_fd(self):
+        """Descripteur à surveiller en lecture (boucle d'événements), handle non bloquant"""
+        count = self.lib.snd_seq_poll_descriptors_count(self.handle, POLLIN)
+        if count < 1:
+            raise AlsaSeqError("aucun descripteur d'entrée")
+        fds = (PollFd * count)()
+        self.lib.snd_seq_poll_descriptors(self.handle, fds, count, POLLIN)
+        self.check(self.lib.snd_seq_nonblock(self.handle, 1), "mode non bloquant")
+        return fds[0].fd
+
+    def read_event(self):
+        """Lit un événement, renvoie (type, client, port) ou None (bloquant,
+        sauf après input_fd() : None quand il n'y a plus rien à lire)"""
+        ev = ctypes.POINTER(SeqEvent)()
+        if self.lib.snd_seq_event_input(self.handle, ctypes.byref(ev)) < 0 or not ev:
+            return None
+        event = ev.contents
+        return event.type, event.data.addr.client, event.data.addr.port
+
+    def create_queue(self, name='DD70_Queue'):
+        """Alloue et démarre une file temps réel du séquenceur (sur le handle
+        des sorties : la file appartient au client qui y planifie)"""
+        seq = self.outputs()
+        with seq.lock:
+            queue = seq.check(seq.lib.snd_seq_alloc_named_queue(seq.handle, name.encode()),
+                              "allocation de la file")
+            seq.check(seq.lib.snd_seq_control_queue(seq.handle, queue, SND_SEQ_EVENT_START, 0, None),
+                      "démarrage de la file")
+            seq.check(seq.lib.snd_seq_drain_output(seq.handle), "démarrage de la file")
+        return queue
+
+    def open_output(self, dest_client, dest_port, name='DD70_Remapper', queue=None, offset=0.0):
+        """Crée notre port de sortie, l'abonne à la destination et renvoie
+        un objet compatible avec un port de sortie mido.
+        Avec `queue`, chaque événement est planifié à son horodatage d'entrée
+        (msg.time, en secondes time.perf_counter()) + `offset` secondes."""
+        seq = self.outputs()
+        port = seq.create_port(name, SND_SEQ_PORT_CAP_READ | SND_SEQ_PORT_CAP_SUBS_READ)
+        seq.connect_to(port, dest_client, dest_port)
+        return SeqOutput(seq, port, name, queue, offset)
+
+    def close(self):
+        if self.output_seq is not None:
+            self.output_seq.close()
+            self.output_seq = None
+        if self.handle:
+            self.lib.snd_seq_close(self.handle)
+            self.handle = ctypes.c_void_p()
+
+
+class SeqOutput:
+    """Port de sortie natif : envoie les messages mido en événements directs,
+    ou planifiés sur une file à entrée + décalage fixe"""
+
+    def __init__(self, seq, port, name, queue=None, offset=0.0):
+        self.seq = seq
+        self.port = port
+        self.name = name
+        self.queue = queue
+        self.offset = offset
+        self.closed = False
+
+        # Statistiques pour régler `offset` : pire délai de traitement observé
+        # et événements arrivés trop tard pour tenir le décalage
+        self.max_processing = 0.0
+        self.late_events = 0
+
+        # Événement préalloué, réutilisé à chaque envoi
+        self.event = SeqEvent()
+        self.event.source.port = port
+        self.event.dest.client = SND_SEQ_ADDRESS_SUBSCRIBERS
+        if queue is None:
+            self.event.queue = SND_SEQ_QUEUE_DIRECT
+        else:
+            self.event.queue = queue
+            self.event.flags = SND_SEQ_TIME_STAMP_REAL | SND_SEQ_TIME_MODE_REL
+        self.event_ref = ctypes.byref(self.event)
+
+    def fill(self, msg):
+        """Remplit l'événement préalloué, False si le type n'est pas géré"""
+        ev = self.event
+        if msg.type == 'note_on':
+            ev.type = SND_SEQ_EVENT_NOTEON
+            ev.data.note.channel = msg.channel
+            ev.data.note.note = msg.note
+            ev.data.note.velocity = msg.velocity
+        elif msg.type == 'note_off':
+            ev.type = SND_SEQ_EVENT_NOTEOFF
+            ev.data.note.channel = msg.channel
+            ev.data.note.note = msg.note
+            ev.data.note.velocity = msg.velocity
+        elif msg.type == 'control_change':
+            ev.type = SND_SEQ_EVENT_CONTROLLER
+            ev.data.control.channel = msg.channel
+            ev.data.control.param = msg.control
+            ev.data.control.value = msg.value
+        elif msg.type == 'program_change':
+            ev.type = SND_SEQ_EVENT_PGMCHANGE
+            ev.data.control.channel = msg.channel
+            ev.data.control.value = msg.program
+        else:
+            return False
+        return True
+
+    def fill_packed(self, event):
+        """Comme fill, depuis un événement empaqueté (dd70_ring) : aucun objet mido"""
+        ev = self.event
+        status = event & 0xF0
+        if status == 0x90 or status == 0x80:
+            ev.type = SND_SEQ_EVENT_NOTEON if status == 0x90 else SND_SEQ_EVENT_NOTEOFF
+            ev.data.note.channel = event & 0x0F
+            ev.data.note.note = (event >> 8) & 0x7F
+            ev.data.note.velocity = (event >> 16) & 0x7F
+        elif status == 0xB0:
+            ev.type = SND_SEQ_EVENT_CONTROLLER
+            ev.data.control.channel = event & 0x0F
+            ev.data.control.param = (event >> 8) & 0x7F
+            ev.data.control.value = (event >> 16) & 0x7F
+        elif status == 0xC0:
+            ev.type = SND_SEQ_EVENT_PGMCHANGE
+            ev.data.control.channel = event & 0x0F
+            ev.data.control.value = (event >> 8) & 0x7F
+        else:
+            return False
+        return True
+
+    def send(self, msg):
+        if self.fill(msg):
+            self.output(msg.time)
+
+    def send_packed(self, event, stamp):
+        """Envoi depuis une file MidiRing (thread d'envoi du fan-out)"""
+        if self.fill_packed(event):
+            self.output(stamp)
+
+    def output(self, stamp):
+        """Envoie l'événement rempli ; `stamp` = horodatage d'entrée (perf_counter)"""
+        seq = self.seq
+        if self.queue is None:
+            with seq.lock:
+                err = seq.lib.snd_seq_event_output_direct(seq.handle, self.event_ref)
+            seq.check(err, "envoi d'événement")
+            return
+
+        # Temps relatif : le noyau le compte depuis la réception de l'événement,
+        # on retranche donc le temps déjà passé depuis l'entrée (stamp)
+        delay = self.offset
+        if stamp > 0:
+            processing = time.perf_counter() - stamp
+            if processing > self.max_processing:
+                self.max_processing = processing
+            delay -= processing
+            if delay < 0:
+                self.late_events += 1
+                delay = 0.0
+        real = self.event.time.time
+        real.tv_sec = int(delay)
+        real.tv_nsec = int((delay - real.tv_sec) * 1e9)
+        with seq.lock:
+            err = seq.lib.snd_seq_event_output(seq.handle, self.event_ref)
+            if err >= 0:
+                seq.lib.snd_seq_drain_output(seq.handle)
+        seq.check(err, "envoi d'événement")
+
+    def close(self):
+        if not self.closed:
+            seq = self.seq
+            with seq.lock:
+                seq.lib.snd_seq_delete_simple_port(seq.handle, self.port)
+                if self.queue is not None:
+                    seq.lib.snd_seq_free_queue(seq.handle, self.queue)
+            self.closed = True
@@ -0,0 +1,32 @@
+"""
+Repères de démarrage du remapper DD-70
+Le remapper journalise l'instant où le kit devient jouable, en temps
+CLOCK_MONOTONIC (secondes depuis le démarrage du noyau, comme systemd et le
+journal du noyau) : dd70-boot-report.py peut ainsi mettre bout à bout
+noyau -> énumération USB -> service -> premier son possible.
+"""
+
+import os
+import re
+import time
+
+# Ligne cherchée par dd70-boot-report.py dans le journal du service
+PLAYABLE_PATTERN = re.compile(r'Prêt à jouer \(monotonic ([\d.]+) s')
+
+
+def process_start():
+    """Instant de création du processus (monotonic, s), avant l'interpréteur et les imports"""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def report_playable():
+    """Journalise l'instant où entrées et synthé sont prêts"""
+    now = time.monotonic()
+    start = process_start()
+    since_start = f", processus +{(now - start) * 1000:.0f} ms" if start is not None else ''
+    print(f"✓ Prêt à jouer (monotonic {now:.3f} s{since_start})")
@@ -0,0 +1,85 @@
+"""
+API de contrôle du remapper (socket Unix, une requête JSON par ligne)
+Le transport est celui de dd70_engine (serve_control) ; ce module fournit
+la table des commandes et l'échange atomique des réglages.
+
+Les réglages lus par le chemin des notes (mappings, zones de la pédale,
+gain de vélocité...) forment un objet Settings (défini dans dd70_rules : il
+sert dès le démarrage, ce module seulement une fois le kit jouable) qui
+n'est jamais modifié en place : une commande en construit une copie modifiée puis la publie en une
+seule affectation. Le callback des entrées lit `settings` une fois par
+message : le message en cours garde l'ancien jeu de réglages, le suivant
+voit le nouveau en entier, jamais un mélange des deux. Changer un réglage
+ne prend aucun verrou du chemin des notes.
+
+Exemples (voir dd70-ctl.py) :
+  {"cmd": "help"}
+  {"cmd": "stats"}
+  {"cmd": "settings"}
+  {"cmd": "set", "hihat_hysteresis": 5}
+  {"cmd": "zones", "zones": [["closed", 0, 42], ["open", 64, 46]]}
+  {"cmd": "mapping", "input": "dd70", "mapping": {"38": 42, "40": 42}}
+  {"cmd": "record", "on": true, "path": "/home/pi/prise1.mid"}
+  {"cmd": "output", "name": "daw", "on": false}
+  {"cmd": "pedal", "last": 50, "dump": "/tmp/dd70-pedal.csv"}
+"""
+
+# Socket de contrôle : /run/dd70 (RuntimeDirectory du service), sinon /tmp.
+# Ici plutôt que dans dd70_engine : dd70-ctl.py les lit sans charger asyncio
+CONTROL_DIR = '/run/dd70'
+CONTROL_FALLBACK = '/tmp/dd70-control.sock'
+
+
+def parse_mapping(raw):
+    """Mapping lu en JSON -> mapping du remapper (clés de notes entières, tuples)"""
+    if not isinstance(raw, dict):
+        raise ValueError("mapping: objet JSON attendu")
+    mapping = {}
+    for key, value in raw.items():
+        if isinstance(value, list):
+            value = tuple(value)
+        mapping[int(key) if str(key).isdigit() else key] = value
+    return mapping
+
+
+def parse_changes(request, limits):
+    """Champs d'une requête 'set' -> changements validés
+    (limits : nom -> (type, minimum, maximum))"""
+    changes = {}
+    for name, value in request.items():
+        if name == 'cmd':
+            continue
+        if name not in limits:
+            raise ValueError(f"réglage inconnu: {name} (réglages: {', '.join(limits)})")
+        kind, low, high = limits[name]
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}: {kind.__name__} attendu")
+        if not low <= value <= high:
+            raise ValueError(f"{name}: entre {low} et {high}")
+        changes[name] = value
+    if not changes:
+        raise ValueError("aucun réglage à modifier")
+    return changes
+
+
+class Controller:
+    """Table des commandes : nom -> fonction(requête) -> dict de réponse"""
+
+    def __init__(self):
+        self.commands = {}
+        self.add('help', self.help, "liste des commandes")
+
+    def add(self, name, func, description=''):
+        self.commands[name] = (func, description)
+
+    def help(self, request):
+        return {'commands': {name: description for name, (func, description) in self.commands.items()}}
+
+    def __call__(self, request):
+        """Handler pour Engine.serve_control (None = commande inconnue)"""
+        entry = self.commands.get(request.get('cmd'))
+        if entry is None:
+            return None
+        return entry[0](request)
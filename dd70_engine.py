@@ -0,0 +1,262 @@
+"""
+Boucle d'événements unique du remapper (asyncio)
+Tout ce qui n'est pas une frappe passe par une seule boucle, dans le thread
+principal, au lieu d'une boucle bloquante et d'un thread par besoin :
+- descripteurs prêts : entrée rawmidi, annonces du séquenceur ALSA, udev
+- minuteries : watchdog, compteurs, scrutation de /proc/asound/cards
+- supervision des sous-processus (FluidSynth) via pidfd
+- socket de contrôle local (JSON, une requête par ligne)
+- surveillance d'un fichier de configuration (date de modification)
+
+Le chemin des notes reste un seul appel synchrone, sans await ni tâche :
+un descripteur rawmidi prêt appelle directement le callback de l'entrée,
+et les entrées rtmidi gardent leur callback dans le thread de la
+bibliothèque. Ce qui doit attendre (réouverture après hotplug, démarrage
+d'un synthé) est une coroutine qui cède la boucle au lieu de dormir.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import time
+
+from dd70_control import CONTROL_DIR, CONTROL_FALLBACK
+
+CONTROL_MAX_LINE = 65536
+# Scrutation des fichiers de configuration et des sous-processus sans pidfd
+WATCH_INTERVAL = 1.0
+CHILD_POLL_INTERVAL = 0.5
+
+
+def control_path():
+    """Chemin du socket de contrôle (le même pour le remapper et ses clients)"""
+    if os.path.isdir(CONTROL_DIR) and os.access(CONTROL_DIR, os.W_OK):
+        return os.path.join(CONTROL_DIR, 'control.sock')
+    return CONTROL_FALLBACK
+
+
+class Timer:
+    """Appel périodique sur la boucle, sans dérive ; mesure son propre retard"""
+
+    def __init__(self, engine, interval, callback, args):
+        self.engine = engine
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.due = engine.loop.time() + interval
+        self.handle = engine.loop.call_at(self.due, self.fire)
+
+    def fire(self):
+        loop = self.engine.loop
+        # Retard de la minuterie = temps pendant lequel la boucle était occupée
+        lag = loop.time() - self.due
+        if lag > self.engine.lag_max:
+            self.engine.lag_max = lag
+        try:
+            self.callback(*self.args)
+        except Exception as e:
+            print(f"⚠️  Minuterie {getattr(self.callback, '__name__', '?')}: {e}")
+        self.due += self.interval
+        if self.due < loop.time():
+            # Boucle restée bloquée plus d'une période : pas de rattrapage en rafale
+            self.due = loop.time() + self.interval
+        self.handle = loop.call_at(self.due, self.fire)
+
+    def cancel(self):
+        self.handle.cancel()
+
+
+class Engine:
+    """Boucle asyncio du remapper : lecteurs, minuteries, tâches, contrôle"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.tasks = set()
+        self.timers = []
+        self.readers = set()
+        self.servers = []
+        self.lag_max = 0.0      # pire retard d'une minuterie (s)
+
+    # --- descripteurs et minuteries (callbacks synchrones) ---
+
+    def add_reader(self, fd, callback, *args):
+        """callback(*args) dès que fd est lisible, directement depuis la boucle"""
+        self.loop.add_reader(fd, callback, *args)
+        self.readers.add(fd)
+
+    def remove_reader(self, fd):
+        if fd in self.readers:
+            self.readers.discard(fd)
+            self.loop.remove_reader(fd)
+
+    def every(self, interval, callback, *args):
+        timer = Timer(self, interval, callback, args)
+        self.timers.append(timer)
+        return timer
+
+    # --- tâches (ce qui doit attendre) ---
+
+    def spawn(self, coro):
+        """Lance une coroutine ; ses erreurs sont affichées, jamais perdues"""
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️  Tâche interrompue: {task.exception()}")
+
+    async def poll_until(self, predicate, timeout, interval=0.01):
+        """Réessaie predicate() jusqu'à ce qu'il soit vrai ou timeout écoulé"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if predicate():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(interval)
+
+    # --- sous-processus ---
+
+    def supervise(self, process, on_exit):
+        """on_exit(process) à la fin du processus (pidfd, sinon scrutation)"""
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            self.spawn(self.poll_child(process, on_exit))
+            return
+
+        def exited():
+            self.remove_reader(pidfd)
+            os.close(pidfd)
+            process.poll()
+            on_exit(process)
+        self.add_reader(pidfd, exited)
+
+    async def poll_child(self, process, on_exit):
+        while process.poll() is None:
+            await asyncio.sleep(CHILD_POLL_INTERVAL)
+        on_exit(process)
+
+    # --- fichier de configuration ---
+
+    def watch_file(self, path, callback, interval=WATCH_INTERVAL):
+        """callback(path) quand le fichier change (date de modification ou taille)"""
+        def stat():
+            try:
+                st = os.stat(path)
+                return st.st_mtime_ns, st.st_size
+            except OSError:
+                return None
+        state = {'last': stat()}
+
+        def check():
+            current = stat()
+            if current != state['last']:
+                state['last'] = current
+                if current is not None:
+                    callback(path)
+        return self.every(interval, check)
+
+    # --- socket de contrôle ---
+
+    def serve_control(self, handler, path=None):
+        """Socket Unix, une requête JSON par ligne -> handler(requête) -> réponse JSON.
+        handler est synchrone et court : il s'exécute entre deux événements"""
+        path = path or control_path()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+        async def client(reader, writer):
+            # Connexion suivie comme les autres tâches : annulée à l'arrêt
+            task = asyncio.current_task()
+            self.tasks.add(task)
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    writer.write(self.encode(self.dispatch(handler, line)) + b'\n')
+                    await writer.drain()
+            except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                pass
+            except asyncio.CancelledError:
+                # Arrêt du remapper : la connexion se termine normalement
+                # (une tâche de connexion annulée fait réagir asyncio.streams)
+                pass
+            finally:
+                self.tasks.discard(task)
+                writer.close()
+
+        async def start():
+            try:
+                server = await asyncio.start_unix_server(client, path, limit=CONTROL_MAX_LINE)
+            except OSError as e:
+                print(f"⚠️  Socket de contrôle indisponible ({path}): {e}")
+                return
+            os.chmod(path, 0o660)
+            self.servers.append((server, path))
+            print(f"✓ Socket de contrôle: {path}")
+        self.spawn(start())
+
+    def dispatch(self, handler, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("objet JSON attendu")
+        except ValueError as e:
+            return {'ok': False, 'error': f"requête invalide: {e}"}
+        try:
+            response = handler(request)
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+        if response is None:
+            return {'ok': False, 'error': f"commande inconnue: {request.get('cmd')}"}
+        return dict({'ok': True}, **response)
+
+    def encode(self, response):
+        """Réponse -> ligne JSON ; une réponse non sérialisable devient une erreur"""
+        try:
+            return json.dumps(response, ensure_ascii=False).encode()
+        except (TypeError, ValueError) as e:
+            return json.dumps({'ok': False, 'error': f"réponse non sérialisable: {e}"},
+                              ensure_ascii=False).encode()
+
+    # --- cycle de vie ---
+
+    def run(self):
+        """Tourne jusqu'à stop(), SIGINT ou SIGTERM"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.stop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self.loop.stop()
+
+    def shutdown(self):
+        for timer in self.timers:
+            timer.cancel()
+        for fd in list(self.readers):
+            self.remove_reader(fd)
+        for server, path in self.servers:
+            server.close()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        for task in list(self.tasks):
+            task.cancel()
+        if self.tasks:
+            self.loop.run_until_complete(asyncio.gather(*self.tasks, return_exceptions=True))
+        self.loop.close()
+
+    def print_stats(self):
+        print(f"  Boucle d'événements: retard max {self.lag_max * 1000:.1f} ms")
@@ -0,0 +1,324 @@
+"""
+Fan-out MIDI vers plusieurs sorties indépendantes
+Chaque sortie (FluidSynth, boucle DD-70, enregistrement, DAW...) a sa propre
+file et son thread d'envoi : une sortie lente ou bloquée (pipe FluidSynth
+plein, interface USB-MIDI débranchée) ne retarde jamais les autres.
+
+Les files sont des MidiRing (dd70_ring) : événements empaquetés dans des
+tableaux préalloués, sans verrou ni allocation côté entrée. Le thread
+d'envoi vide la file par lots et applique les priorités :
+- notes (et program change, sysex) : jamais réordonnées ; le dernier
+  quart de la file leur est réservé, elles ne sont perdues que si la file
+  entière est pleine de notes (compté)
+- CC / pitch bend / aftertouch : dans un lot, une valeur suivie d'une
+  valeur plus récente du même contrôleur sans note entre les deux n'est
+  pas envoyée (la note garde l'état de pédale qu'elle a vu). File aux
+  trois quarts pleine : seule la dernière valeur de chaque contrôleur est
+  gardée hors file, côté entrée, et déposée dès qu'il y a de la place,
+  ou juste avant la note suivante (dans la réserve des notes s'il le faut)
+- le reste (clock, active sensing...) : refusé dès que la file est aux
+  trois quarts pleine
+
+FanOut se comporte comme un port de sortie mido (send / close). Une
+sortie peut être ajoutée ou retirée en cours de jeu (socket de contrôle) :
+la liste des sorties est remplacée, jamais modifiée en place, et send() ne
+la lit qu'une fois par message.
+
+NoteRouter, lui, n'envoie chaque note qu'à une sortie (instance de synthé
+choisie par une table note -> sortie) ; les autres messages (pédale, bank
+select, étouffements) vont à toutes.
+"""
+
+import collections
+import threading
+import time
+
+import mido
+
+from dd70_ring import MidiRing, PACKERS, UNPACKED, unpack_message
+
+SINK_RING_SIZE = 1024
+LATENCY_WINDOW = 1024   # nombre de mesures gardées pour les percentiles
+
+# Statuts (sans le canal) par classe de message
+CRITICAL_STATUS = {0x80, 0x90, 0xC0}          # note_off, note_on, program_change
+COALESCE_STATUS = {0xA0, 0xB0, 0xD0, 0xE0}    # polytouch, CC, aftertouch, pitchwheel
+CRITICAL_TYPES = {'note_off', 'note_on', 'program_change', 'sysex'}
+COALESCE_TYPES = {'polytouch', 'control_change', 'aftertouch', 'pitchwheel'}
+
+
+def coalesce_key(event):
+    """Clé du contrôleur dont seule la dernière valeur compte"""
+    if event & 0xF0 in (0xA0, 0xB0):
+        # Statut + canal + n° de contrôleur (ou de note pour polytouch)
+        return event & 0xFFFF
+    return event & 0xFF
+
+
+class Sink:
+    """Une sortie : file SPSC + thread d'envoi + compteurs"""
+
+    def __init__(self, name, port, capacity=SINK_RING_SIZE):
+        self.name = name
+        self.port = port
+        self.ring = MidiRing(capacity)
+        # Au-delà, la file est réservée aux notes (et aux contrôleurs en
+        # attente qui doivent passer avant elles)
+        self.droppable_limit = self.ring.capacity * 3 // 4
+        self.deferred = {}       # clé de contrôleur -> dernière valeur (entrée seulement)
+        self.superseded = bytearray(self.ring.capacity)   # cases de CC remplacés (consommateur)
+        self.seen = set()
+        self.sent = 0
+        self.errors = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.thread = threading.Thread(target=self.send_loop, name=f'dd70-sink-{name}', daemon=True)
+        self.thread.start()
+
+    def push(self, msg):
+        """Dépose un message sans jamais bloquer l'appelant ; False s'il a été perdu"""
+        ring = self.ring
+        kind = msg.type
+        if kind in CRITICAL_TYPES:
+            # Contrôleurs en attente d'abord, dans la réserve s'il le faut : la
+            # note n'est jamais déposée avant l'état de pédale qu'elle a vu
+            # (file pleine : la note est perdue avec eux, comptée)
+            if self.deferred:
+                self.flush_deferred(ring.capacity)
+                if self.deferred:
+                    ring.overflows += 1
+                    return False
+            return ring.push(msg)
+        if self.deferred:
+            self.flush_deferred(self.droppable_limit)
+        if len(ring) < self.droppable_limit:
+            return ring.push(msg)
+        if kind in COALESCE_TYPES:
+            # File chargée : seule la dernière valeur du contrôleur est gardée
+            key = coalesce_key(PACKERS[kind](msg))
+            if key in self.deferred:
+                self.coalesced += 1
+            self.deferred[key] = msg
+            return True
+        self.dropped += 1
+        return False
+
+    def flush_deferred(self, limit):
+        """Dépose les contrôleurs gardés hors file tant que la file reste sous limit"""
+        deferred = self.deferred
+        for key in list(deferred):
+            if len(self.ring) >= limit:
+                return
+            self.ring.push(deferred.pop(key))
+
+    def is_barrier(self, slot):
+        event = self.ring.events[slot]
+        if event == UNPACKED:
+            return self.ring.objects[slot].type == 'sysex'
+        return event & 0xF0 in CRITICAL_STATUS
+
+    def mark_superseded(self, start, end):
+        """Parcours du lot à rebours : un CC suivi d'une valeur plus récente du
+        même contrôleur, sans note entre les deux, est marqué à sauter"""
+        ring = self.ring
+        seen = self.seen
+        seen.clear()
+        for index in range(end - 1, start - 1, -1):
+            slot = index & ring.mask
+            event = ring.events[slot]
+            if event & 0xF0 in COALESCE_STATUS:
+                key = coalesce_key(event)
+                if key in seen:
+                    self.superseded[slot] = 1
+                else:
+                    seen.add(key)
+            elif self.is_barrier(slot):
+                seen.clear()
+
+    def send_loop(self):
+        ring = self.ring
+        while ring.wait():
+            port = self.port
+            send_packed = getattr(port, 'send_packed', None)
+            end = ring.head
+            if end - ring.tail > 1:
+                self.mark_superseded(ring.tail, end)
+            while ring.tail != end:
+                slot = ring.tail & ring.mask
+                if self.superseded[slot]:
+                    self.superseded[slot] = 0
+                    self.coalesced += 1
+                    ring.advance()
+                    continue
+                event = ring.events[slot]
+                try:
+                    if event == UNPACKED:
+                        port.send(ring.objects[slot])
+                    elif send_packed is not None:
+                        send_packed(event, ring.stamps[slot])
+                    else:
+                        port.send(unpack_message(event, ring.stamps[slot]))
+                except Exception as e:
+                    self.errors += 1
+                    if self.errors == 1:
+                        print(f"⚠️  Sortie {self.name}: {e}")
+                else:
+                    self.sent += 1
+                    self.latencies.append(time.perf_counter() - ring.queued[slot])
+                ring.advance()
+        # File fermée et vidée : dernières valeurs gardées hors file, puis le port
+        self.send_deferred()
+        try:
+            self.port.close()
+        except Exception:
+            pass
+
+    def send_deferred(self):
+        """Après fermeture : les valeurs gardées hors file vont directement au
+        port, sans repasser par la file (elle n'a qu'un producteur, l'entrée)"""
+        for msg in list(self.deferred.values()):
+            try:
+                self.port.send(msg)
+            except Exception:
+                self.errors += 1
+            else:
+                self.sent += 1
+
+    def stats(self):
+        """Compteurs et latence file -> envoi terminé (ms)"""
+        latencies = sorted(self.latencies)
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+            worst = latencies[-1] * 1000
+        else:
+            p50 = p99 = worst = 0.0
+        return {'sent': self.sent, 'dropped': self.dropped + self.ring.overflows, 'coalesced': self.coalesced,
+                'errors': self.errors, 'queued': len(self.ring), 'high_water': self.ring.high_water,
+                'p50_ms': p50, 'p99_ms': p99, 'max_ms': worst}
+
+    def close(self):
+        """Demande l'arrêt sans écrire dans la file (l'entrée peut encore y
+        déposer) : le thread d'envoi la vide, envoie les dernières valeurs
+        gardées puis ferme le port. Ne bloque pas l'appelant"""
+        self.ring.close()
+
+    def join(self, timeout=1):
+        self.thread.join(timeout)
+
+
+class FanOut:
+    """Distribue chaque message à toutes les sorties enregistrées"""
+
+    def __init__(self):
+        self.sinks = []
+
+    def add(self, name, port, capacity=SINK_RING_SIZE):
+        # Nouvelle liste publiée en une affectation : un envoi en cours garde l'ancienne
+        self.sinks = self.sinks + [Sink(name, port, capacity)]
+
+    def remove(self, name):
+        """Retire une sortie et la ferme (sa file est vidée d'abord, par son
+        propre thread) ; False si absente"""
+        removed = [sink for sink in self.sinks if sink.name == name]
+        if not removed:
+            return False
+        self.sinks = [sink for sink in self.sinks if sink.name != name]
+        for sink in removed:
+            sink.close()
+        return True
+
+    def get(self, name):
+        for sink in self.sinks:
+            if sink.name == name:
+                return sink
+        return None
+
+    def send(self, msg):
+        for sink in self.sinks:
+            sink.push(msg)
+
+    def replace(self, name, port):
+        """Remplace le port d'une sortie (reconstruction), renvoie l'ancien"""
+        for sink in self.sinks:
+            if sink.name == name:
+                old, sink.port = sink.port, port
+                return old
+        return None
+
+    def stats(self):
+        return {sink.name: sink.stats() for sink in self.sinks}
+
+    def print_stats(self):
+        for name, st in self.stats().items():
+            print(f"  {name}: {st['sent']} envoyés, {st['coalesced']} CC fusionnés, {st['dropped']} perdus, "
+                  f"{st['errors']} erreurs, file max {st['high_water']}, "
+                  f"latence p50 {st['p50_ms']:.2f} ms / p99 {st['p99_ms']:.2f} ms / max {st['max_ms']:.2f} ms")
+
+    def close(self):
+        """Arrêt du remapper : toutes les files sont vidées avant de rendre la main"""
+        for sink in self.sinks:
+            sink.close()
+        for sink in self.sinks:
+            sink.join()
+
+
+class NoteRouter:
+    """Répartit les notes entre plusieurs sorties selon une table précalculée"""
+
+    def __init__(self, outputs, table):
+        self.outputs = outputs
+        self.table = table          # 128 entrées : note -> indice de sortie
+        self.routed = [0] * len(outputs)
+
+    def send(self, msg):
+        if msg.type in ('note_on', 'note_off'):
+            index = self.table[msg.note]
+            self.routed[index] += 1
+            self.outputs[index].send(msg)
+        else:
+            for output in self.outputs:
+                output.send(msg)
+
+    def send_packed(self, event, stamp):
+        """Comme send, pour un événement empaqueté (depuis une file MidiRing)"""
+        if event & 0xE0 == 0x80:
+            # note_off / note_on
+            index = self.table[(event >> 8) & 0x7F]
+            self.routed[index] += 1
+            self.outputs[index].send_packed(event, stamp)
+        else:
+            for output in self.outputs:
+                output.send_packed(event, stamp)
+
+    def print_stats(self):
+        print(f"  Notes par instance: {', '.join(str(n) for n in self.routed)}")
+
+    def close(self):
+        for output in self.outputs:
+            output.close()
+
+
+class MidiFileRecorder:
+    """Sortie d'enregistrement : écrit la session dans un fichier .mid à la fermeture"""
+
+    def __init__(self, path, ticks_per_beat=480, tempo=500000):
+        self.path = path
+        self.midi = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+        self.track = mido.MidiTrack()
+        self.midi.tracks.append(self.track)
+        self.track.append(mido.MetaMessage('set_tempo', tempo=tempo, time=0))
+        self.ticks_per_second = ticks_per_beat * 1000000 / tempo
+        self.last = None
+
+    def send(self, msg):
+        # Horodatage d'entrée si le remapper l'a posé, sinon l'heure d'écriture
+        now = msg.time if msg.time > 0 else time.perf_counter()
+        delta = 0 if self.last is None else max(0, int((now - self.last) * self.ticks_per_second))
+        self.last = now
+        self.track.append(msg.copy(time=delta))
+
+    def close(self):
+        self.midi.save(self.path)
+        print(f"✓ Session enregistrée: {self.path}")
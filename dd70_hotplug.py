@@ -0,0 +1,149 @@
+"""
+Surveillance hotplug des interfaces MIDI USB (DD-70)
+Permet au remapper de rouvrir uniquement les ports du DD-70 après un
+débranchement, sans redémarrer le processus ni le synthétiseur.
+
+Sources d'événements, par ordre de préférence:
+- annonces du séquenceur ALSA (port système 0:1) : l'événement arrive quand
+  le port MIDI existe vraiment (ou a vraiment disparu)
+- udev (pyudev, sous-système 'sound')
+- sinon, scrutation de /proc/asound/cards toutes les POLL_INTERVAL secondes
+
+attach(engine, callback) branche la source sur la boucle d'événements
+(dd70_engine) : descripteur surveillé ou minuterie, aucun thread.
+
+Requirements (optionnel):
+- libasound2 ou python3-pyudev
+"""
+
+from dd70_alsaseq import (AlsaSeq, AlsaSeqError, SND_SEQ_OPEN_INPUT, SND_SEQ_KERNEL_CLIENT,
+                          SND_SEQ_EVENT_PORT_START, SND_SEQ_EVENT_PORT_EXIT,
+                          SND_SEQ_EVENT_CLIENT_EXIT)
+
+POLL_INTERVAL = 0.2
+ASOUND_CARDS = '/proc/asound/cards'
+
+
+class HotplugWatcher:
+    """Émet 'add' / 'remove' quand une interface MIDI apparaît ou disparaît"""
+
+    def __init__(self):
+        self.emit = None
+        self.source = None
+        self.seq = None
+        self.pyudev = None
+        self.kernel_clients = set()
+        self.engine = None
+        self.fd = None
+        self.monitor = None
+        self.cards = []
+
+    def open_seq(self):
+        """Port d'annonces du séquenceur, None si indisponible"""
+        self.seq = AlsaSeq('DD70_Hotplug')
+        if self.seq.open(SND_SEQ_OPEN_INPUT, verbose=False):
+            try:
+                self.seq.watch_announce()
+            except AlsaSeqError:
+                self.seq.close()
+                self.seq = None
+        else:
+            self.seq = None
+        if self.seq is not None:
+            self.kernel_clients = {p.client for p in self.seq.ports()
+                                   if p.client_type == SND_SEQ_KERNEL_CLIENT}
+        return self.seq
+
+    def attach(self, engine, callback):
+        """callback('add' / 'remove') depuis la boucle d'événements"""
+        self.engine = engine
+        self.emit = callback
+        if self.open_seq() is not None:
+            try:
+                self.fd = self.seq.input_fd()
+            except AlsaSeqError:
+                self.seq.close()
+                self.seq = None
+        if self.seq is not None:
+            self.source = 'annonces ALSA seq'
+            engine.add_reader(self.fd, self.seq_ready)
+        elif self.load_pyudev():
+            self.source = 'udev'
+            self.monitor = self.udev_monitor()
+            self.fd = self.monitor.fileno()
+            engine.add_reader(self.fd, self.udev_ready)
+        else:
+            self.source = ASOUND_CARDS
+            self.cards = self.read_cards()
+            engine.every(POLL_INTERVAL, self.poll_cards)
+        print(f"✓ Surveillance hotplug active ({self.source}, boucle d'événements)")
+
+    def seq_event(self, event):
+        """Annonces du séquenceur : seuls les clients noyau (matériel) comptent"""
+        event_type, client, port = event
+        if event_type == SND_SEQ_EVENT_PORT_START:
+            if self.seq.client_type(client) == SND_SEQ_KERNEL_CLIENT:
+                self.kernel_clients.add(client)
+                self.emit('add')
+        elif event_type in (SND_SEQ_EVENT_PORT_EXIT, SND_SEQ_EVENT_CLIENT_EXIT):
+            if client in self.kernel_clients:
+                if event_type == SND_SEQ_EVENT_CLIENT_EXIT:
+                    self.kernel_clients.discard(client)
+                self.emit('remove')
+
+    def seq_ready(self):
+        """Descripteur prêt : toutes les annonces en attente (handle non bloquant)"""
+        while True:
+            event = self.seq.read_event()
+            if event is None:
+                return
+            self.seq_event(event)
+
+    def load_pyudev(self):
+        """pyudev n'est importé que si les annonces ALSA sont indisponibles"""
+        try:
+            import pyudev
+        except ImportError:
+            return False
+        self.pyudev = pyudev
+        return True
+
+    def udev_monitor(self):
+        context = self.pyudev.Context()
+        monitor = self.pyudev.Monitor.from_netlink(context)
+        monitor.filter_by('sound')
+        monitor.start()
+        return monitor
+
+    def udev_event(self, device):
+        """Événements udev : seuls les périphériques rawmidi nous intéressent"""
+        if device.sys_name.startswith('midiC') and device.action in ('add', 'remove'):
+            self.emit(device.action)
+
+    def udev_ready(self):
+        device = self.monitor.poll(timeout=0)
+        if device is not None:
+            self.udev_event(device)
+
+    def poll_cards(self):
+        """Repli sans udev : compare la liste des cartes son à la précédente"""
+        cards = self.read_cards()
+        if cards == self.cards:
+            return
+        if len(cards) < len(self.cards):
+            self.emit('remove')
+        else:
+            self.emit('add')
+        self.cards = cards
+
+    def read_cards(self):
+        try:
+            with open(ASOUND_CARDS, 'r') as f:
+                return f.read().splitlines()
+        except OSError:
+            return []
+
+    def stop(self):
+        if self.engine is not None and self.fd is not None:
+            self.engine.remove_reader(self.fd)
+            self.fd = None
@@ -0,0 +1,201 @@
+"""
+Fusion de plusieurs entrées MIDI dans un seul pipeline
+Le DD-70 peut être complété par des pads de déclenchement ou un second
+contrôleur : chaque périphérique est ouvert en mode callback et garde son
+propre mapping de notes (une note 38 des pads n'est pas la caisse claire du
+DD-70). Les callbacks rtmidi tournent dans un thread par entrée ; un verrou
+unique les sérialise et l'horodatage est pris sous ce verrou, donc le
+pipeline voit les messages de toutes les entrées un par un, dans l'ordre
+de leurs horodatages, sans thread ni file supplémentaire.
+
+Le thread principal reste la seule boucle d'événements : la coroutine
+hotplug() (boucle asyncio de dd70_engine) ferme / rouvre uniquement les
+entrées concernées, resync() rattrape un événement manqué, et stalled()
+détecte un message bloqué dans le pipeline (watchdog).
+"""
+
+import threading
+import time
+
+import mido
+
+# Délai max pour retrouver une entrée après son retour, et temps laissé à
+# ALSA pour retirer ses ports après un débranchement
+RECONNECT_TIMEOUT = 5.0
+REMOVE_SETTLE = 0.05
+# Au démarrage (service lancé par udev dès l'énumération USB), délai max
+# pour voir apparaître les ports ALSA des entrées requises
+STARTUP_WAIT = 3.0
+
+
+class InputDevice:
+    """Une entrée : motifs de recherche du port, mapping propre, port ouvert"""
+
+    def __init__(self, name, patterns, mapping, required=False, index=0):
+        self.name = name
+        self.patterns = patterns
+        self.index = index  # n-ième port correspondant (plusieurs appareils identiques)
+        self.mapping = mapping
+        self.required = required
+        self.port = None
+        self.port_name = None
+        self.reconnects = 0
+
+    def find_port(self, port_names):
+        """Le port est recherché à chaque ouverture : son numéro de client
+        ALSA peut changer d'un branchement à l'autre"""
+        matches = [port for port in port_names
+                   if 'Through' not in port and any(p in port for p in self.patterns)]
+        if len(matches) > self.index:
+            return matches[self.index]
+        return None
+
+
+class InputMerger:
+    """Ouvre plusieurs entrées et livre leurs messages, sérialisés, à handler(device, msg)"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.devices = []
+        self.lock = threading.Lock()
+        self.busy_since = None  # début du traitement en cours (perf_counter)
+
+    def add(self, name, patterns, mapping, required=False, index=0):
+        device = InputDevice(name, patterns, mapping, required, index)
+        self.devices.append(device)
+        return device
+
+    def callback_for(self, device):
+        def callback(msg):
+            with self.lock:
+                # Horodatage d'entrée sous le verrou : ordre de traitement = ordre des horodatages
+                msg.time = self.busy_since = time.perf_counter()
+                try:
+                    self.handler(device, msg)
+                finally:
+                    self.busy_since = None
+        return callback
+
+    def stalled(self, timeout):
+        """True si un message est en traitement depuis plus de timeout secondes
+        (envoi bloqué sur un synthé figé, par exemple)"""
+        busy_since = self.busy_since
+        return busy_since is not None and time.perf_counter() - busy_since > timeout
+
+    def open_device(self, device, port_name):
+        device.port = mido.open_input(port_name, callback=self.callback_for(device))
+        device.port_name = port_name
+
+    def close_device(self, device):
+        """Ferme une seule entrée : les autres continuent de jouer"""
+        if device.port:
+            device.port.close()
+            device.port = None
+
+    def wait_for_required(self, timeout=STARTUP_WAIT):
+        """Attend que les ports des entrées requises existent (la première
+        entrée compte comme requise : elle est ouverte en priorité)"""
+        expected = [device for device in self.devices if device.required or device is self.devices[0]]
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            port_names = mido.get_input_names()
+            if all(device.find_port(port_names) for device in expected):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def open_all(self):
+        """Ouvre toutes les entrées présentes ; False si une entrée requise manque"""
+        port_names = mido.get_input_names()
+        ok = True
+        for device in self.devices:
+            port_name = device.find_port(port_names)
+            if port_name is None and device is self.devices[0]:
+                # Comme avant : à défaut de DD-70, première entrée réelle venue
+                port_name = next((p for p in port_names if 'Through' not in p), None)
+                if port_name is not None:
+                    device.patterns = (port_name.split(':')[0],)
+                    print(f"⚠️  Entrée '{device.name}' non trouvée, utilisation de {port_name}")
+            if port_name is None:
+                if device.required:
+                    print(f"✗ Entrée '{device.name}' non trouvée")
+                    ok = False
+                else:
+                    print(f"⚠️  Entrée '{device.name}' absente, ouverte dès son branchement")
+                continue
+            try:
+                self.open_device(device, port_name)
+                print(f"✓ Entrée '{device.name}': {port_name}")
+            except Exception as e:
+                print(f"✗ Erreur d'ouverture de '{device.name}': {e}")
+                ok = ok and not device.required
+        return ok
+
+    def any_open(self):
+        return any(device.port for device in self.devices)
+
+    def missing(self):
+        return [device for device in self.devices if device.port is None]
+
+    def reopen_missing(self, start=None):
+        """Rouvre les entrées fermées dont le port a réapparu (un essai, sans
+        attente : la coroutine hotplug() réessaie) ; True si au moins une
+        entrée a été rouverte"""
+        start = start or time.perf_counter()
+        reopened = False
+        port_names = mido.get_input_names()
+        for device in self.missing():
+            port_name = device.find_port(port_names)
+            if port_name is None:
+                continue
+            try:
+                self.open_device(device, port_name)
+            except Exception as e:
+                print(f"⚠️  Réouverture de '{device.name}' impossible: {e}")
+                self.close_device(device)
+                continue
+            device.reconnects += 1
+            reopened = True
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"🔌 Entrée '{device.name}' reconnectée en {elapsed_ms:.1f} ms "
+                  f"(reconnexions: {device.reconnects})")
+        return reopened
+
+    def close_removed(self):
+        """Ferme les entrées dont le port a disparu"""
+        port_names = set(mido.get_input_names())
+        for device in self.devices:
+            if device.port and device.port_name not in port_names:
+                self.close_device(device)
+                print(f"🔌 Entrée '{device.name}' débranchée, en attente de reconnexion...")
+
+    def resync(self):
+        """Filet de sécurité si un événement hotplug a été manqué (un essai, sans attente)"""
+        self.close_removed()
+        if self.missing():
+            self.reopen_missing()
+
+    async def hotplug(self, event):
+        """Réagit à un événement du HotplugWatcher ('add' / 'remove' / None) ;
+        les attentes cèdent la main au lieu de dormir (watchdog, contrôle et
+        autres entrées continuent)"""
+        import asyncio  # déjà chargé par la boucle ; pas au démarrage du script
+
+        if event == 'remove':
+            await asyncio.sleep(REMOVE_SETTLE)
+            self.close_removed()
+        elif event == 'add' and self.missing():
+            start = time.perf_counter()
+            while not self.reopen_missing(start=start) and self.missing():
+                if time.perf_counter() - start >= RECONNECT_TIMEOUT:
+                    return
+                await asyncio.sleep(0.01)
+        elif event is None:
+            self.resync()
+
+    def reconnects(self):
+        return sum(device.reconnects for device in self.devices)
+
+    def close(self):
+        for device in self.devices:
+            self.close_device(device)
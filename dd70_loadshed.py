@@ -0,0 +1,175 @@
+"""
+Délestage adaptatif du synthé (FluidSynth)
+Quand une instance FluidSynth approche de la saturation de son cœur ou que
+des xruns apparaissent, on dégrade le rendu par paliers via le shell TCP de
+FluidSynth (port 9800 + n° d'instance) plutôt que de laisser le son
+craquer : polyphonie réduite, reverb coupée, interpolation linéaire...
+Quand la charge redescend durablement, les paliers sont levés un par un.
+
+Chaque changement de palier est journalisé avec son heure, la charge CPU
+et le nombre de xruns qui l'ont déclenché.
+
+Mesures :
+- CPU : utime + stime de chaque processus FluidSynth (/proc/<pid>/stat),
+  en fraction d'un cœur ; on retient l'instance la plus chargée
+- xruns : lignes "underrun" / "xrun" ajoutées au journal de FluidSynth
+"""
+
+import os
+import re
+import socket
+import time
+
+# Seuils (fraction d'un cœur) et temporisations
+SHED_CPU_HIGH = 0.85       # au-dessus : palier suivant
+SHED_CPU_LOW = 0.60        # en dessous pendant SHED_RESTORE_AFTER : palier précédent
+SHED_RESTORE_AFTER = 10.0  # secondes de calme avant de restaurer un palier
+SHED_INTERVAL = 1.0        # période de mesure
+SHELL_TIMEOUT = 0.5
+
+XRUN_PATTERN = re.compile(r'underrun|xrun', re.IGNORECASE)
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def shed_steps(polyphony):
+    """Paliers dans l'ordre d'application : (libellé, commandes, commandes de restauration)"""
+    reduced = max(16, polyphony * 2 // 3)
+    return [
+        (f'polyphonie {reduced}', [f'set synth.polyphony {reduced}'], [f'set synth.polyphony {polyphony}']),
+        ('reverb coupée', ['reverb off'], ['reverb on']),
+        ('interpolation linéaire', ['interp 1'], ['interp 4']),
+        ('polyphonie 16', ['set synth.polyphony 16'], [f'set synth.polyphony {reduced}']),
+    ]
+
+
+def shell_command(port, commands, host='127.0.0.1'):
+    """Envoie des commandes au shell TCP de FluidSynth ; False si injoignable"""
+    try:
+        with socket.create_connection((host, port), timeout=SHELL_TIMEOUT) as sock:
+            sock.sendall(''.join(f'{command}\n' for command in commands).encode())
+            # Fin d'écriture : FluidSynth exécute les commandes puis ferme la session
+            sock.shutdown(socket.SHUT_WR)
+            try:
+                while sock.recv(1024):
+                    pass
+            except socket.timeout:
+                pass
+        return True
+    except OSError:
+        return False
+
+
+class LoadShedder:
+    """Surveille les instances FluidSynth et ajuste le palier de délestage"""
+
+    def __init__(self, shell_ports, polyphony, log_path):
+        self.shell_ports = shell_ports
+        self.steps = shed_steps(polyphony)
+        self.log_path = log_path
+        self.level = 0
+        self.last_check = None
+        self.cpu_times = {}       # pid -> temps CPU (s) à la dernière mesure
+        self.log_offset = self.log_size()
+        self.calm_since = None
+        self.xruns = 0
+        self.history = []         # (heure, palier, cpu, xruns)
+
+    def log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+
+    def read_xruns(self):
+        """xruns apparus dans le journal depuis la dernière mesure"""
+        size = self.log_size()
+        if size < self.log_offset:
+            # Journal tronqué ou recréé
+            self.log_offset = 0
+        if size == self.log_offset:
+            return 0
+        try:
+            with open(self.log_path, 'r', errors='replace') as f:
+                f.seek(self.log_offset)
+                text = f.read()
+        except OSError:
+            return 0
+        self.log_offset = size
+        return len(XRUN_PATTERN.findall(text))
+
+    def process_cpu(self, pid):
+        """Temps CPU cumulé d'un processus en secondes, None s'il n'existe plus"""
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as f:
+                # Le nom du processus peut contenir des espaces : couper après ')'
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            return None
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def measure_cpu(self, pids, elapsed):
+        """Charge de l'instance la plus chargée (fraction d'un cœur)"""
+        load = 0.0
+        times = {}
+        for pid in pids:
+            cpu = self.process_cpu(pid)
+            if cpu is None:
+                continue
+            times[pid] = cpu
+            if pid in self.cpu_times and elapsed > 0:
+                load = max(load, (cpu - self.cpu_times[pid]) / elapsed)
+        self.cpu_times = times
+        return load
+
+    def update(self, pids):
+        """À appeler régulièrement depuis la boucle de supervision"""
+        now = time.monotonic()
+        if self.last_check is not None and now - self.last_check < SHED_INTERVAL:
+            return
+        elapsed = 0.0 if self.last_check is None else now - self.last_check
+        self.last_check = now
+
+        cpu = self.measure_cpu(pids, elapsed)
+        xruns = self.read_xruns()
+        self.xruns += xruns
+
+        if (xruns or cpu > SHED_CPU_HIGH) and self.level < len(self.steps):
+            self.calm_since = None
+            self.set_level(self.level + 1, cpu, xruns)
+        elif xruns == 0 and cpu < SHED_CPU_LOW and self.level > 0:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= SHED_RESTORE_AFTER:
+                self.calm_since = now
+                self.set_level(self.level - 1, cpu, xruns)
+        else:
+            self.calm_since = None
+
+    def set_level(self, level, cpu, xruns):
+        """Applique ou lève un palier sur toutes les instances"""
+        if level > self.level:
+            label, commands, _ = self.steps[level - 1]
+            action = f"⚠️  Délestage palier {level}: {label}"
+        else:
+            label, _, commands = self.steps[level]
+            action = f"✓ Restauration palier {level}: {label} levé"
+        for port in self.shell_ports:
+            if not shell_command(port, commands):
+                print(f"⚠️  Shell FluidSynth injoignable (port {port})")
+        self.level = level
+        stamp = time.strftime('%H:%M:%S')
+        self.history.append((stamp, level, cpu, xruns))
+        print(f"[{stamp}] {action} (cpu {cpu * 100:.0f}%, xruns {xruns})")
+
+    def reapply(self, port):
+        """Une instance relancée repart des réglages par défaut : lui réappliquer le palier courant"""
+        commands = []
+        for _, degrade, _ in self.steps[:self.level]:
+            commands.extend(degrade)
+        if commands:
+            shell_command(port, commands)
+
+    def print_summary(self):
+        if self.history:
+            print(f"  Délestage: {len(self.history)} changement(s) de palier, {self.xruns} xrun(s), "
+                  f"palier final {self.level}")
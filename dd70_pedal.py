@@ -0,0 +1,201 @@
+"""
+Machine d'état de la pédale charleston (fusion des indices)
+Le DD-70 renseigne l'ouverture de la pédale par plusieurs indices qui
+peuvent se contredire : le CC#4 continu, la note 44 (pédale enfoncée,
+"chick") et les notes 42 / 46 du pad central (le module joue charleston
+fermée ou ouverte selon sa propre lecture de la pédale). Au lieu d'une
+chaîne de if/elif, chaque message passe par des tables précalculées :
+
+- (type, numéro) -> indice : une case d'un tableau de 256 octets
+- indice -> priorité, durée d'autorité, ouverture fixée ou valeur du message
+- ouverture -> zone par la table d'hystérésis de dd70_rules.PedalZones
+
+Fusion : une source retenue fait autorité pendant sa durée (hold) ; tant
+qu'elle fait autorité, les indices moins prioritaires sont écartés. Cette
+autorité décroît d'elle-même : `hold` secondes après son dernier message,
+une source qui se tait rend la main aux indices moins prioritaires (ex.
+pédale qui n'envoie plus de CC#4 : le pad central redevient la référence).
+Aucune minuterie : l'échéance est comparée à l'horodatage du message.
+
+Chaque changement d'état, et chaque indice écarté, est gardé dans une trace
+circulaire préallouée (PedalTrace) au lieu d'être affiché : elle se lit par
+le socket de contrôle ou s'écrit en CSV pour l'analyse hors ligne.
+"""
+
+import struct
+import time
+from array import array
+
+from dd70_shm import PEDAL_CC, PEDAL_CHICK, PEDAL_PAD
+
+CUE_NONE = 0
+CONTROL_KEY = 0x80          # clé des CC : numéro | CONTROL_KEY (notes : numéro seul)
+MAX_PRIORITY = 15
+TRACE_CAPACITY = 4096       # transitions gardées (puissance de deux)
+
+# stamp, indice, valeur reçue, retenu, ouverture avant / après, zone avant / après
+TRACE_RECORD = struct.Struct('<dBBBBBBB')
+TRACE_FIELDS = ('stamp', 'cue', 'value', 'accepted', 'openness_from', 'openness_to',
+                'zone_from', 'zone_to')
+
+# Code de l'indice dans le journal partagé (dd70-diag.py, tableau de bord)
+DIAG_CUES = {'cc': PEDAL_CC, 'chick': PEDAL_CHICK}   # autres : PEDAL_PAD
+
+# Indices par défaut du DD-70 : nom, message, numéro, ouverture (None = valeur
+# du message), priorité, autorité (s)
+DEFAULT_CUES = [
+    ('cc', 'control_change', 4, None, 2, 2.0),
+    ('chick', 'note_on', 44, 0, 3, 0.0),
+    ('pad_closed', 'note_on', 42, 0, 1, 0.0),
+    ('pad_open', 'note_on', 46, 127, 1, 0.0),
+]
+
+
+class PedalTrace:
+    """Trace circulaire des transitions de la pédale
+    Un seul écrivain (le chemin des notes), tableau préalloué : une
+    transition est écrite en place, rien n'est alloué. Quand la trace est
+    pleine, les plus anciennes sont écrasées."""
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self.mask = size - 1
+        self.buffer = bytearray(size * TRACE_RECORD.size)
+        self.head = 0       # nombre total de transitions écrites
+
+    def add(self, stamp, cue, value, accepted, openness_from, openness_to, zone_from, zone_to):
+        TRACE_RECORD.pack_into(self.buffer, (self.head & self.mask) * TRACE_RECORD.size, stamp,
+                               cue, value, accepted, openness_from, openness_to, zone_from, zone_to)
+        self.head += 1
+
+    def records(self, last=None):
+        """Transitions gardées, de la plus ancienne à la plus récente"""
+        head = self.head
+        count = min(head, self.capacity)
+        if last is not None:
+            count = min(count, last)
+        return [TRACE_RECORD.unpack_from(self.buffer, (index & self.mask) * TRACE_RECORD.size)
+                for index in range(head - count, head)]
+
+    def dump(self, path, names=None, zones=None):
+        """Écrit la trace en CSV (noms d'indices et de zones si fournis)"""
+        records = self.records()
+        with open(path, 'w') as f:
+            f.write(','.join(TRACE_FIELDS) + '\n')
+            for stamp, cue, value, accepted, *rest in records:
+                row = [f"{stamp:.6f}", names[cue] if names else str(cue), str(value), str(accepted)]
+                row += [str(v) for v in rest[:2]]
+                row += [zones[z] if zones else str(z) for z in rest[2:]]
+                f.write(','.join(row) + '\n')
+        return len(records)
+
+
+class PedalState:
+    """État fusionné de la pédale (ouverture, zone) à partir des indices"""
+
+    def __init__(self, cues=DEFAULT_CUES, openness=127, trace=None):
+        self.names = ['-']
+        self.cue_of = bytearray(256)             # clé (type, numéro) -> indice
+        self.priority = bytearray(1)
+        self.hold = array('d', [0.0])
+        self.fixed = bytearray(1)                # ouverture fixée par l'indice
+        self.continuous = bytearray(1)           # 1 : ouverture = valeur du message
+        self.diag_cue = bytearray(1)
+        for name, message, number, target, priority, hold in cues:
+            if message not in ('control_change', 'note_on'):
+                raise ValueError(f"indice {name}: control_change ou note_on attendu")
+            if not isinstance(number, int) or not 0 <= number <= 127:
+                raise ValueError(f"indice {name}: numéro entre 0 et 127")
+            if target is not None and (not isinstance(target, int) or not 0 <= target <= 127):
+                raise ValueError(f"indice {name}: ouverture entre 0 et 127 ou None")
+            if not isinstance(priority, int) or not 0 <= priority <= MAX_PRIORITY:
+                raise ValueError(f"indice {name}: priorité entre 0 et {MAX_PRIORITY}")
+            if hold < 0:
+                raise ValueError(f"indice {name}: autorité positive attendue")
+            key = number | (CONTROL_KEY if message == 'control_change' else 0)
+            if self.cue_of[key]:
+                raise ValueError(f"indice {name}: message déjà utilisé par {self.names[self.cue_of[key]]}")
+            self.cue_of[key] = len(self.names)
+            self.names.append(name)
+            self.priority.append(priority)
+            self.hold.append(hold)
+            self.fixed.append(0 if target is None else target)
+            self.continuous.append(1 if target is None else 0)
+            self.diag_cue.append(DIAG_CUES.get(name, PEDAL_PAD))
+        if len(self.names) > 255:
+            raise ValueError("indices de pédale : 255 au maximum")
+        # Fin d'autorité des sources plus prioritaires, par niveau de priorité :
+        # un indice de priorité p est écarté tant que stamp < blocked[p]
+        self.blocked = array('d', [0.0]) * (MAX_PRIORITY + 1)
+        self.openness = openness
+        self.zone = 0
+        self.zones = None
+        self.trace = trace or PedalTrace()
+        self.accepted = 0
+        self.rejected = 0
+
+    def classify(self, msg):
+        """Message -> (indice, valeur) ; indice 0 si le message ne renseigne pas la pédale"""
+        kind = msg.type
+        if kind == 'control_change':
+            return self.cue_of[CONTROL_KEY | msg.control], msg.value
+        if kind == 'note_on' and msg.velocity:
+            return self.cue_of[msg.note], msg.velocity
+        return CUE_NONE, 0
+
+    def sync(self, zones):
+        """Zones du jeu de réglages du message ; remplacées -> zone recalculée
+        sans hystérésis (l'ancienne zone n'a plus de sens)"""
+        if zones is not self.zones:
+            self.zones = zones
+            self.zone = zones.table[self.openness]
+
+    def feed(self, stamp, cue, value):
+        """Fusionne un indice horodaté ; False s'il est écarté par une source
+        plus prioritaire qui fait encore autorité"""
+        priority = self.priority[cue]
+        openness = self.openness
+        zone = self.zone
+        if stamp < self.blocked[priority]:
+            self.rejected += 1
+            self.trace.add(stamp, cue, value, 0, openness, openness, zone, zone)
+            return False
+        # Ouverture visée : valeur du message (CC) ou valeur fixée (notes)
+        target = self.fixed[cue] + self.continuous[cue] * value
+        new_zone = self.zones.transitions[zone][target]
+        self.openness = target
+        self.zone = new_zone
+        self.accepted += 1
+        end = stamp + self.hold[cue]
+        blocked = self.blocked
+        for level in range(priority):
+            if blocked[level] < end:
+                blocked[level] = end
+        if target != openness or new_zone != zone:
+            self.trace.add(stamp, cue, value, 1, openness, target, zone, new_zone)
+        return True
+
+    def authority(self, now=None):
+        """Priorité la plus basse encore acceptée (0 : aucune source ne fait autorité)"""
+        now = time.perf_counter() if now is None else now
+        return max((level + 1 for level, end in enumerate(self.blocked) if now < end), default=0)
+
+    def stats(self, last=20):
+        """État, compteurs et dernières transitions (socket de contrôle)"""
+        zones = self.zones
+        return {
+            'openness': self.openness,
+            'zone': zones.names[self.zone] if zones else None,
+            'authority': self.authority(),
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'transitions': self.trace.head,
+            'trace': [dict(zip(TRACE_FIELDS, (round(stamp, 6), self.names[cue], *rest)))
+                      for stamp, cue, *rest in self.trace.records(last)],
+        }
+
+    def dump(self, path):
+        return self.trace.dump(path, self.names, self.zones.names if self.zones else None)
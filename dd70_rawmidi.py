@@ -0,0 +1,212 @@
+"""
+Accès rawmidi direct au DD-70 (/dev/snd/midiC*D0)
+Contourne le séquenceur ALSA et les threads rtmidi : un seul thread lit
+l'entrée rawmidi en non bloquant, décode le flux octet par octet (running
+status compris) et appelle le callback du remapper. En mode boucle zéro
+latence, les messages remappés repartent sur le même périphérique rawmidi.
+
+Avec une boucle d'événements (dd70_engine), le descripteur est surveillé
+par la boucle au lieu d'un thread : la lecture, le décodage et le callback
+se font dans le même appel synchrone, dès que le descripteur est prêt.
+
+L'objet RawMidiPort se comporte comme un port mido ouvert avec callback
+(entrée) et comme un port de sortie (send), on peut donc l'utiliser pour
+les deux côtés de la boucle.
+"""
+
+import errno
+import os
+import re
+import select
+import threading
+import time
+
+import mido
+
+ASOUND_CARDS = '/proc/asound/cards'
+
+# Nombre d'octets de données selon l'octet de statut
+CHANNEL_DATA_LENGTH = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+SYSTEM_DATA_LENGTH = {0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0}
+# Temps réel définis (0xF9 et 0xFD sont réservés : ignorés)
+REALTIME = frozenset((0xF8, 0xFA, 0xFB, 0xFC, 0xFE, 0xFF))
+# Buffer de sortie plein : attente max avant de perdre le message (s). Un
+# message MIDI met ~1 ms sur le câble ; au-delà, le périphérique ne suit plus
+# et attendre bloquerait l'entrée et les minuteries de la boucle
+SEND_WAIT = 0.005
+
+
+def find_rawmidi_device(patterns=('e-drum', 'DD-70')):
+    """Cherche la carte du DD-70 dans /proc/asound/cards -> /dev/snd/midiC<N>D0"""
+    try:
+        with open(ASOUND_CARDS, 'r') as f:
+            text = f.read()
+    except OSError:
+        return None
+
+    # Chaque carte occupe deux lignes : " N [id]: pilote - nom" + description
+    for match in re.finditer(r'^\s*(\d+) \[.*\n.*$', text, re.MULTILINE):
+        block = match.group(0)
+        if any(p in block for p in patterns):
+            path = f'/dev/snd/midiC{match.group(1)}D0'
+            if os.path.exists(path):
+                return path
+    return None
+
+
+class MidiStreamParser:
+    """Décodeur MIDI incrémental (running status, temps réel, SysEx)"""
+
+    def __init__(self):
+        self.status = 0
+        self.needed = 0
+        self.data = []
+        self.sysex = None
+
+    def feed(self, chunk):
+        """Décode un bloc d'octets, renvoie la liste des messages complets"""
+        messages = []
+        for byte in chunk:
+            if byte >= 0xF8:
+                # Temps réel : peut s'intercaler n'importe où, sans effet sur
+                # l'état ; les statuts réservés sont ignorés
+                if byte in REALTIME:
+                    messages.append(mido.Message.from_bytes([byte]))
+            elif byte == 0xF0:
+                self.sysex = [byte]
+                self.status = 0
+            elif byte == 0xF7:
+                if self.sysex is not None:
+                    self.sysex.append(byte)
+                    messages.append(mido.Message.from_bytes(self.sysex))
+                    self.sysex = None
+            elif byte & 0x80:
+                self.sysex = None
+                self.data = []
+                if byte >= 0xF0:
+                    # Message système commun : annule le running status
+                    # (0xF4 / 0xF5 réservés : rien à décoder)
+                    self.status = 0
+                    if byte not in SYSTEM_DATA_LENGTH:
+                        continue
+                    self.needed = SYSTEM_DATA_LENGTH[byte]
+                    if self.needed == 0:
+                        messages.append(mido.Message.from_bytes([byte]))
+                    else:
+                        self.status = byte
+                else:
+                    self.status = byte
+                    self.needed = CHANNEL_DATA_LENGTH[byte & 0xF0]
+            elif self.sysex is not None:
+                self.sysex.append(byte)
+            elif self.status:
+                self.data.append(byte)
+                if len(self.data) == self.needed:
+                    messages.append(mido.Message.from_bytes([self.status] + self.data))
+                    self.data = []
+                    if self.status >= 0xF0:
+                        self.status = 0
+            # Octet de données sans statut : ignoré
+        return messages
+
+
+class RawMidiPort:
+    """Port rawmidi : lecture non bloquante (thread ou boucle d'événements), écriture directe"""
+
+    def __init__(self, path, callback=None, output=True, engine=None):
+        self.name = path
+        self.callback = callback
+        self.closed = False
+        self.parser = MidiStreamParser()
+        self.thread = None
+        self.engine = engine
+        self.error = None
+        self.dropped = 0    # messages perdus, buffer de sortie plein
+
+        # Un seul handle pour la boucle DD-70 : lecture et écriture non bloquantes
+        if callback is not None and output:
+            flags = os.O_RDWR
+        elif callback is not None:
+            flags = os.O_RDONLY
+        else:
+            flags = os.O_WRONLY
+        self.fd = os.open(path, flags | os.O_NONBLOCK)
+        self.out_poller = select.poll()
+        self.out_poller.register(self.fd, select.POLLOUT)
+
+        if callback is not None and engine is not None:
+            engine.add_reader(self.fd, self.read_ready)
+        elif callback is not None:
+            self.thread = threading.Thread(target=self.read_loop, name='dd70-rawmidi', daemon=True)
+            self.thread.start()
+
+    def read_loop(self):
+        """Attend l'entrée avec poll() puis lit tout ce qui est disponible"""
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN | select.POLLERR | select.POLLHUP)
+        while not self.closed:
+            events = poller.poll(200)
+            if not events:
+                continue
+            if events[0][1] & (select.POLLERR | select.POLLHUP):
+                self.error = 'périphérique retiré'
+                return
+            try:
+                chunk = os.read(self.fd, 256)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                # ENODEV : DD-70 débranché, le hotplug du remapper prend le relais
+                self.error = errno.errorcode.get(e.errno, str(e))
+                return
+            for msg in self.parser.feed(chunk):
+                self.callback(msg)
+
+    def read_ready(self):
+        """Boucle d'événements : descripteur prêt, lecture et callback sans attente"""
+        try:
+            chunk = os.read(self.fd, 256)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.error = errno.errorcode.get(e.errno, str(e))
+            self.engine.remove_reader(self.fd)
+            return
+        if not chunk:
+            self.error = 'périphérique retiré'
+            self.engine.remove_reader(self.fd)
+            return
+        for msg in self.parser.feed(chunk):
+            self.callback(msg)
+
+    def send(self, msg):
+        """Écrit le message sur le même handle ; si le buffer du noyau est plein,
+        attend au plus SEND_WAIT qu'il se libère, puis perd le message (compté)"""
+        data = bytes(msg.bytes())
+        deadline = None
+        while data:
+            try:
+                written = os.write(self.fd, data)
+            except BlockingIOError:
+                now = time.perf_counter()
+                if deadline is None:
+                    deadline = now + SEND_WAIT
+                elif now >= deadline:
+                    self.dropped += 1
+                    return
+                self.out_poller.poll(max(1, int((deadline - now) * 1000)))
+                continue
+            data = data[written:]
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.engine is not None:
+            self.engine.remove_reader(self.fd)
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
@@ -0,0 +1,137 @@
+"""
+File circulaire MIDI à un producteur et un consommateur (SPSC)
+Remplace queue.Queue / deque + Condition entre l'étage d'entrée (callback
+rtmidi, sérialisé par InputMerger) et chaque étage de sortie (thread d'envoi
+du fan-out, thread audio du sampler).
+
+- capacité fixe, tableaux préalloués : chaque événement est un entier
+  (statut | data1 << 8 | data2 << 16) plus son horodatage d'entrée, rien
+  n'est alloué à l'envoi
+- push / peek / advance sans verrou : `head` n'est écrit que par le
+  producteur, `tail` que par le consommateur (une affectation d'entier est
+  atomique pour l'interpréteur). La case est remplie avant que `head` ne la
+  publie, et n'est réutilisée qu'après que `tail` l'a libérée
+- file pleine : l'événement est refusé et compté (overflows), le
+  producteur ne bloque jamais
+- les messages qui ne tiennent pas sur 3 octets (sysex...) passent tels
+  quels dans une case réservée, sans perdre leur ordre
+
+Seul le réveil d'un consommateur endormi (wait) passe par un Event, et
+seulement quand il dort réellement.
+"""
+
+import threading
+import time
+from array import array
+
+import mido
+
+RING_CAPACITY = 1024
+
+PACKERS = {
+    'note_off': lambda m: 0x80 | m.channel | m.note << 8 | m.velocity << 16,
+    'note_on': lambda m: 0x90 | m.channel | m.note << 8 | m.velocity << 16,
+    'polytouch': lambda m: 0xA0 | m.channel | m.note << 8 | m.value << 16,
+    'control_change': lambda m: 0xB0 | m.channel | m.control << 8 | m.value << 16,
+    'program_change': lambda m: 0xC0 | m.channel | m.program << 8,
+    'aftertouch': lambda m: 0xD0 | m.channel | m.value << 8,
+    'pitchwheel': lambda m: 0xE0 | m.channel | ((m.pitch + 8192) & 0x7F) << 8 | ((m.pitch + 8192) >> 7) << 16,
+}
+
+# Nombre d'octets du message selon le statut (sans le canal)
+MESSAGE_LENGTH = {0x80: 3, 0x90: 3, 0xA0: 3, 0xB0: 3, 0xC0: 2, 0xD0: 2, 0xE0: 3}
+
+# Case occupée par un message non empaqueté (objet mido dans `objects`)
+UNPACKED = 0
+
+
+def unpack_message(event, stamp=0.0):
+    """Entier empaqueté -> message mido (pour les sorties qui n'acceptent que mido)"""
+    length = MESSAGE_LENGTH[event & 0xF0]
+    data = [event & 0xFF, (event >> 8) & 0x7F, (event >> 16) & 0x7F][:length]
+    return mido.Message.from_bytes(data, time=stamp)
+
+
+class MidiRing:
+    """File circulaire SPSC d'événements MIDI empaquetés"""
+
+    def __init__(self, capacity=RING_CAPACITY):
+        # Puissance de deux : la case est l'indice masqué
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self.mask = size - 1
+        self.events = array('I', [0]) * size
+        self.stamps = array('d', [0.0]) * size    # horodatage d'entrée (msg.time)
+        self.queued = array('d', [0.0]) * size    # heure de mise en file (latence)
+        self.objects = [None] * size              # messages non empaquetables
+        self.head = 0       # prochain indice à écrire (producteur seulement)
+        self.tail = 0       # prochain indice à lire (consommateur seulement)
+        self.overflows = 0
+        self.high_water = 0
+        self.closed = False
+        self.waiting = False
+        self.wakeup = threading.Event()
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, msg):
+        """Producteur : ajoute un message mido ; False (compté) si la file est pleine"""
+        packer = PACKERS.get(msg.type)
+        if packer is None:
+            return self.push_event(UNPACKED, msg.time, msg)
+        return self.push_event(packer(msg), msg.time)
+
+    def push_event(self, event, stamp, obj=None):
+        """Producteur : ajoute un événement déjà empaqueté"""
+        head = self.head
+        used = head - self.tail
+        if used >= self.capacity:
+            self.overflows += 1
+            return False
+        slot = head & self.mask
+        self.events[slot] = event
+        self.stamps[slot] = stamp
+        self.queued[slot] = time.perf_counter()
+        if obj is not None:
+            self.objects[slot] = obj
+        # Publication : la case est complète avant d'être visible
+        self.head = head + 1
+        if used >= self.high_water:
+            self.high_water = used + 1
+        if self.waiting:
+            self.wakeup.set()
+        return True
+
+    def peek(self):
+        """Consommateur : case du prochain événement, -1 si la file est vide"""
+        tail = self.tail
+        if tail == self.head:
+            return -1
+        return tail & self.mask
+
+    def advance(self):
+        """Consommateur : libère la case lue par peek()"""
+        self.objects[self.tail & self.mask] = None
+        self.tail += 1
+
+    def wait(self):
+        """Consommateur : attend un événement ; False si la file est fermée et vide"""
+        while self.tail == self.head:
+            if self.closed:
+                return False
+            self.waiting = True
+            # Revérifier après avoir annoncé l'attente : un push qui passe
+            # entre les deux voit `waiting` et réveille
+            if self.tail == self.head and not self.closed:
+                self.wakeup.wait()
+            self.wakeup.clear()
+            self.waiting = False
+        return True
+
+    def close(self):
+        """Le consommateur finit de vider la file puis wait() renvoie False"""
+        self.closed = True
+        self.wakeup.set()
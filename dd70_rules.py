@@ -0,0 +1,358 @@
+"""
+Mapping déclaratif compilé en tables de décision
+Au lieu de `if msg.note in [38, 40]` + `hihat_openness < 64` codés dans
+chaque script, un mapping est une liste de règles. La première règle qui
+correspond à une frappe décide de la note jouée :
+
+    {'note': [38, 40], 'pedal': 'closed', 'play': 42}
+    {'note': [38, 40], 'pedal': 'open', 'play': 46}
+    {'note': 38, 'velocity': [1, 24], 'play': 37}           # ghost note -> side stick
+    {'note': 51, 'previous': 51, 'since_ms': [0, 90], 'play': 53}
+    {'note': 36, 'previous': 36, 'since_ms': [0, 25], 'drop': True}   # double déclenchement
+
+Conditions (toutes facultatives sauf 'note') :
+- pedal     : zone(s) d'ouverture de la charleston (PedalZones)
+- velocity  : [min, max] inclus
+- previous  : note(s) reçue(s) à la frappe précédente du kit
+- since_ms  : [min, max[ depuis la frappe précédente (max null = sans limite)
+Actions : 'play' (note jouée, sinon la même), 'velocity_gain' /
+'velocity_offset' (vélocité * gain + offset, bornée à 1..127), 'drop'.
+
+Compilation : les bornes de toutes les règles découpent la vélocité, la
+note précédente et le délai en zones ; chaque case (note, zone de pédale,
+zone de vélocité, classe de note précédente, zone de délai) reçoit d'avance
+l'action de la première règle qui y correspond. Une frappe coûte alors
+quelques accès de tableau, que le mapping ait une règle ou cinquante.
+
+L'ancien format (dict note -> note, 'hihat_pads', 'hihat_controller')
+reste accepté : rules_from_mapping() le traduit en règles.
+
+Zones de la charleston : le CC#4 continu est découpé en zones (closed,
+tight, half, loose, open...) avec hystérésis. Chaque zone a sa note pour
+les pads charleston, son gain de vélocité et la valeur de CC#4 transmise
+au synthé ; une table zone courante x valeur reçue -> nouvelle zone est
+précalculée, un CC#4 coûte donc un accès de tableau, une frappe aucun de
+plus (la zone fait partie de l'index de la table de décision).
+
+Settings : réglages du chemin des notes et leurs tables compilées, publiés
+en bloc par le socket de contrôle (voir dd70_control).
+"""
+
+from bisect import bisect_right
+
+NO_NOTE = 128                 # note précédente : aucune frappe encore
+MAX_TABLE_SIZE = 1 << 20      # garde-fou : cases de la table compilée
+IDENTITY_VELOCITY = bytes(range(128))
+
+RULE_FIELDS = {'note', 'pedal', 'velocity', 'previous', 'since_ms',
+               'play', 'velocity_gain', 'velocity_offset', 'drop'}
+
+
+def as_notes(value, field):
+    """Note ou liste de notes -> frozenset validé"""
+    notes = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+    result = set()
+    for note in notes:
+        if not isinstance(note, int) or not 0 <= note <= 127:
+            raise ValueError(f"{field}: note MIDI attendue (0..127), reçu {note!r}")
+        result.add(note)
+    if not result:
+        raise ValueError(f"{field}: au moins une note")
+    return frozenset(result)
+
+
+def as_note(value, field):
+    """Une seule note MIDI (note jouée : une liste n'a pas de sens)"""
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 127:
+        raise ValueError(f"{field}: une note MIDI attendue (0..127), reçu {value!r}")
+    return value
+
+
+def as_range(value, field, low, high):
+    """[min, max] -> (min, max) validé ; max None = sans limite"""
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{field}: [min, max] attendu")
+    start, end = value
+    end = high if end is None else end
+    if not isinstance(start, (int, float)) or not isinstance(end, (int, float)) or not low <= start <= end <= high:
+        raise ValueError(f"{field}: bornes entre {low} et {high}")
+    return start, end
+
+
+def velocity_table(gain, offset):
+    """Vélocité reçue -> vélocité jouée (0 reste 0 : note_on 0 = note_off)"""
+    return bytes([0] + [max(1, min(127, int(v * gain + offset))) for v in range(1, 128)])
+
+
+class PedalZones:
+    """Zones d'ouverture de la charleston avec hystérésis
+    zones : [(nom, borne basse CC#4[, note des pads, gain de vélocité, CC#4 transmis]), ...]
+    Par défaut la première zone joue 42 et les suivantes 46, gain 1, CC#4
+    transmis tel quel (None)"""
+
+    def __init__(self, zones, hysteresis=0):
+        zones = [tuple(zone) for zone in zones]
+        if not zones or zones[0][1] != 0:
+            raise ValueError("zones de pédale : la première commence à 0")
+        self.names = [zone[0] for zone in zones]
+        self.lows = [zone[1] for zone in zones]
+        if self.lows != sorted(set(self.lows)) or self.lows[-1] > 127:
+            raise ValueError("zones de pédale : bornes croissantes entre 0 et 127 attendues")
+        if len(set(self.names)) != len(self.names):
+            raise ValueError("zones de pédale : noms en double")
+        if len(zones) > 8:
+            raise ValueError("zones de pédale : 8 au maximum")
+        if not 0 <= hysteresis or any(low + hysteresis > 127 for low in self.lows):
+            raise ValueError("zones de pédale : hystérésis trop grande pour les bornes")
+        self.hysteresis = hysteresis
+        self.notes = []
+        self.gains = []
+        self.cc = []
+        for index, zone in enumerate(zones):
+            note, gain, cc = (zone + (None, None, None))[2:5]
+            if note is None:
+                note = 42 if index == 0 else 46
+            as_note(note, f"zone {zone[0]}")
+            if cc is not None and (not isinstance(cc, int) or not 0 <= cc <= 127):
+                raise ValueError(f"zone {zone[0]}: CC#4 transmis entre 0 et 127")
+            self.notes.append(note)
+            self.gains.append(1.0 if gain is None else float(gain))
+            self.cc.append(cc)
+        # Zone sans hystérésis (état initial, zones remplacées en cours de jeu)
+        self.table = bytes(bisect_right(self.lows, value) - 1 for value in range(128))
+        self.transitions = [self.transition_row(zone) for zone in range(len(zones))]
+
+    def transition_row(self, current):
+        """Valeur reçue -> nouvelle zone, depuis `current` : on ne monte qu'à
+        borne + hystérésis, on ne redescend que sous borne - hystérésis"""
+        h = self.hysteresis
+        row = []
+        for value in range(128):
+            zone = current
+            while zone + 1 < len(self.lows) and value >= self.lows[zone + 1] + h:
+                zone += 1
+            while zone > 0 and value < self.lows[zone] - h:
+                zone -= 1
+            row.append(zone)
+        return bytes(row)
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, name):
+        if name not in self.names:
+            raise ValueError(f"pedal: zone inconnue {name!r} (zones: {', '.join(self.names)})")
+        return self.names.index(name)
+
+
+def threshold_zones(threshold, hysteresis=0):
+    """Charleston fermée / ouverte : ouverte à partir de `threshold`"""
+    return PedalZones([('closed', 0), ('open', threshold)], hysteresis)
+
+
+class Rule:
+    """Une règle validée (conditions et action)"""
+
+    def __init__(self, spec, zones):
+        if not isinstance(spec, dict):
+            raise ValueError(f"règle: objet attendu, reçu {spec!r}")
+        unknown = set(spec) - RULE_FIELDS
+        if unknown:
+            raise ValueError(f"règle: champ inconnu {', '.join(sorted(unknown))}")
+        if 'note' not in spec:
+            raise ValueError("règle: 'note' obligatoire")
+        self.notes = as_notes(spec['note'], 'note')
+        pedal = spec.get('pedal')
+        if pedal is None:
+            self.zones = None
+        else:
+            names = pedal if isinstance(pedal, (list, tuple)) else [pedal]
+            self.zones = frozenset(zones.index(name) for name in names)
+        self.velocity = as_range(spec['velocity'], 'velocity', 0, 127) if 'velocity' in spec else (0, 127)
+        self.previous = as_notes(spec['previous'], 'previous') if 'previous' in spec else None
+        if 'since_ms' in spec:
+            start, end = as_range(spec['since_ms'], 'since_ms', 0, float('inf'))
+            self.since = (start / 1000, end / 1000)
+        else:
+            self.since = None
+        self.drop = spec.get('drop', False)
+        if not isinstance(self.drop, bool):
+            raise ValueError(f"drop: true ou false attendu, reçu {self.drop!r}")
+        self.play = spec.get('play')
+        if self.play is not None:
+            as_note(self.play, 'play')
+        self.gain = spec.get('velocity_gain', 1.0)
+        self.offset = spec.get('velocity_offset', 0)
+        if not isinstance(self.gain, (int, float)) or isinstance(self.gain, bool):
+            raise ValueError(f"velocity_gain: nombre attendu, reçu {self.gain!r}")
+        if not isinstance(self.offset, int) or isinstance(self.offset, bool):
+            raise ValueError(f"velocity_offset: entier attendu, reçu {self.offset!r}")
+        self.gain = float(self.gain)
+
+    def matches(self, zone, velocity, previous, since):
+        return ((self.zones is None or zone in self.zones)
+                and self.velocity[0] <= velocity <= self.velocity[1]
+                and (self.previous is None or previous in self.previous)
+                and (self.since is None or self.since[0] <= since < self.since[1]))
+
+
+def partition(sets, universe):
+    """Classes d'éléments appartenant exactement aux mêmes ensembles -> (table, représentants)"""
+    signature = {}
+    table = []
+    representatives = []
+    for element in universe:
+        key = tuple(element in s for s in sets)
+        if key not in signature:
+            signature[key] = len(representatives)
+            representatives.append(element)
+        table.append(signature[key])
+    return table, representatives
+
+
+class RuleTable:
+    """Règles compilées : une action par case (note, pédale, vélocité, précédente, délai)"""
+
+    def __init__(self, rules, zones):
+        self.zones = zones
+        self.rules = [Rule(spec, zones) for spec in rules]
+
+        # Zones de vélocité : intervalles élémentaires entre les bornes des règles
+        starts = {0}
+        for rule in self.rules:
+            starts.add(rule.velocity[0])
+            if rule.velocity[1] < 127:
+                starts.add(rule.velocity[1] + 1)
+        self.velocity_starts = sorted(starts)
+        self.velocity_zone = bytes(bisect_right(self.velocity_starts, v) - 1 for v in range(128))
+
+        # Classes de note précédente (NO_NOTE compris)
+        prev_sets = [rule.previous for rule in self.rules if rule.previous is not None]
+        self.previous_class, self.previous_repr = partition(prev_sets, range(NO_NOTE + 1))
+
+        # Zones de délai depuis la frappe précédente (secondes)
+        bounds = set()
+        for rule in self.rules:
+            if rule.since is not None:
+                bounds.update(b for b in rule.since if 0 < b < float('inf'))
+        self.since_bounds = sorted(bounds)
+        self.since_repr = [0.0] + self.since_bounds
+        self.timed = bool(self.since_bounds) or any(rule.since is not None for rule in self.rules)
+
+        self.p = len(zones)
+        self.v = len(self.velocity_starts)
+        self.c = len(self.previous_repr)
+        self.t = len(self.since_repr)
+        size = 128 * self.p * self.v * self.c * self.t
+        if size > MAX_TABLE_SIZE:
+            raise ValueError(f"mapping trop conditionnel ({size} cases, max {MAX_TABLE_SIZE})")
+        self.table = self.compile()
+        self.size = size
+
+    def compile(self):
+        velocities = {}
+        identity = [(note, IDENTITY_VELOCITY) for note in range(128)]
+        cells = self.p * self.v * self.c * self.t
+        table = []
+        for note in range(128):
+            rules = [rule for rule in self.rules if note in rule.notes]
+            if not rules:
+                table.extend([identity[note]] * cells)
+                continue
+            for zone in range(self.p):
+                for velocity in self.velocity_starts:
+                    for previous in self.previous_repr:
+                        for since in self.since_repr:
+                            action = identity[note]
+                            for rule in rules:
+                                if rule.matches(zone, velocity, previous, since):
+                                    action = self.action(rule, note, velocities)
+                                    break
+                            table.append(action)
+        return table
+
+    def action(self, rule, note, velocities):
+        """(note jouée, table de vélocité), None pour une frappe ignorée"""
+        if rule.drop:
+            return None
+        key = (rule.gain, rule.offset)
+        if key not in velocities:
+            velocities[key] = IDENTITY_VELOCITY if key == (1.0, 0) else velocity_table(*key)
+        return (note if rule.play is None else rule.play, velocities[key])
+
+    def lookup(self, note, velocity, zone, previous, since):
+        index = (((note * self.p + zone) * self.v + self.velocity_zone[velocity]) * self.c
+                 + self.previous_class[previous]) * self.t
+        if self.timed:
+            index += bisect_right(self.since_bounds, since)
+        return self.table[index]
+
+
+class HitState:
+    """État d'un kit pour les règles : frappe précédente et notes en cours
+    (un note_off suit toujours la note jouée par son note_on)"""
+
+    def __init__(self):
+        self.previous = NO_NOTE
+        self.last_hit = float('-inf')
+        self.sounding = list(range(128))   # note reçue -> note jouée
+
+    def note_on(self, table, note, velocity, zone, stamp):
+        """(note, vélocité) à jouer, None si la frappe est ignorée ('drop').
+        Une frappe ignorée ne compte pas comme frappe précédente"""
+        action = table.lookup(note, velocity, zone, self.previous, stamp - self.last_hit)
+        if action is None:
+            return None
+        self.previous = note
+        self.last_hit = stamp
+        self.sounding[note] = action[0]
+        return action[0], action[1][velocity]
+
+    def note_off(self, note):
+        return self.sounding[note]
+
+
+def rules_from_mapping(mapping, zones, gain=1.0, offset=0):
+    """Mapping (nouveau ou ancien format) -> liste de règles
+    - 'rules' : règles explicites, prioritaires
+    - 'hihat_pads' : pads qui jouent la note de chaque zone de pédale
+      (42 en zone fermée, 46 au-delà par défaut), avec son gain
+    - note -> note : remappage simple ; gain / offset s'appliquent aux notes
+      remappées (comme le boost de dd70-remapper-nolatency.py)"""
+    rules = mapping.get('rules', ())
+    if not isinstance(rules, (list, tuple)):
+        raise ValueError(f"rules: liste de règles attendue, reçu {rules!r}")
+    rules = list(rules)
+    pads = mapping.get('hihat_pads')
+    if pads:
+        pads = sorted(as_notes(pads, 'hihat_pads'))
+        for name, note, zone_gain in zip(zones.names, zones.notes, zones.gains):
+            rules.append({'note': list(pads), 'pedal': name, 'play': note,
+                          'velocity_gain': gain * zone_gain, 'velocity_offset': offset})
+    for note, target in mapping.items():
+        if isinstance(note, int):
+            rule = {'note': note, 'play': target}
+            if target != note:
+                rule.update(velocity_gain=gain, velocity_offset=offset)
+            rules.append(rule)
+    return rules
+
+
+def compile_mapping(mapping, zones, gain=1.0, offset=0):
+    return RuleTable(rules_from_mapping(mapping, zones, gain, offset), zones)
+
+
+class Settings:
+    """Jeu de réglages du chemin des notes, jamais modifié après publication"""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def replace(self, **changes):
+        """Copie avec changements (l'original reste intact pour le message en cours)"""
+        values = dict(self.__dict__)
+        values.update(changes)
+        return Settings(**values)
+
+    def as_dict(self):
+        return dict(self.__dict__)
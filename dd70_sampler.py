@@ -0,0 +1,462 @@
+"""
+Moteur de lecture d'échantillons NumPy pour le DD-70
+Alternative légère à FluidSynth/Timidity pour une batterie : les sons sont
+des one-shots sans modulation, un synthé GM complet est donc inutile.
+
+Principe:
+- Chaque note mappée × couche de vélocité est pré-rendue UNE fois en PCM
+  (via FluidSynth en mode fichier) dans une banque unique memory-mappée
+- En fonctionnement, les voix actives sont mixées par blocs NumPy vectorisés
+  et écrites directement sur ALSA avec une petite période
+- Polyphonie fixe, vol de voix (la plus ancienne) quand tout est occupé
+- "All Sound Off" (CC#120) sur un canal étouffe ses voix avec un fondu
+  d'un bloc (choke groups du remapper)
+- Au démarrage, toutes les pages de la banque sont lues (et optionnellement
+  verrouillées en RAM) : la première frappe de chaque pad ne déclenche pas
+  de lecture sur la carte SD
+
+Requirements:
+- python3-numpy
+- python3-alsaaudio (sinon repli sur aplay)
+- fluidsynth + fluid-soundfont-gm (uniquement pour construire le cache)
+
+Installation:
+sudo apt-get install python3-numpy python3-alsaaudio fluidsynth fluid-soundfont-gm
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+import mido
+
+from dd70_ring import MidiRing
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+# Paramètres audio
+SAMPLE_RATE = 48000
+CHANNELS = 2
+PERIOD_SIZE = 64          # frames par bloc (~1.3 ms à 48 kHz)
+PERIODS = 3               # nombre de périodes dans le buffer ALSA
+POLYPHONY = 16            # voix simultanées (fixe)
+MASTER_GAIN = 0.8
+
+# Couches de vélocité : borne haute de chaque couche (vélocité de rendu)
+VELOCITY_LAYERS = (32, 64, 96, 127)
+
+# Rendu des one-shots
+RENDER_SECONDS = 4.0      # durée max d'un échantillon (cymbales comprises)
+SILENCE_THRESHOLD = 16    # amplitude int16 en dessous de laquelle on coupe la queue
+DRUM_CHANNEL = 9
+
+CACHE_DIR = os.path.expanduser('~/.cache/dd70-samples')
+
+# Pré-chauffage : la première lecture d'un échantillon après pré-chauffage ne
+# doit pas coûter plus que PREWARM_TOLERANCE fois une lecture en régime établi
+# (plus une marge absolue pour le bruit de mesure)
+PREWARM_TOLERANCE = 3.0
+PREWARM_MARGIN = 50e-6
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# Reconstruction par le watchdog : attente max de l'ancien thread audio (s),
+# depuis la boucle d'événements
+RESTART_TIMEOUT = 0.1
+
+
+class SampleBank:
+    """Banque PCM pré-rendue : un fichier int16 memory-mappé + un index"""
+
+    def __init__(self, soundfont, notes, cache_dir=CACHE_DIR):
+        self.soundfont = soundfont
+        self.notes = sorted(set(notes))
+        self.cache_dir = cache_dir
+        self.data = None
+        # Table note × vélocité -> numéro d'échantillon (-1 = pas de son)
+        self.sample_for = None
+        self.starts = None
+        self.lengths = None
+        self.layer_velocity = None
+
+    def cache_key(self):
+        """Clé de cache: SoundFont (chemin, taille, date) + notes + couches
+        + paramètres du rendu (durée, seuil de silence)"""
+        st = os.stat(self.soundfont)
+        key = json.dumps([self.soundfont, st.st_size, int(st.st_mtime),
+                          self.notes, VELOCITY_LAYERS, SAMPLE_RATE,
+                          RENDER_SECONDS, SILENCE_THRESHOLD])
+        return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    def load(self):
+        """Charge la banque depuis le cache, la construit si nécessaire"""
+        bank_dir = os.path.join(self.cache_dir, self.cache_key())
+        bank_path = os.path.join(bank_dir, 'bank.pcm')
+        index_path = os.path.join(bank_dir, 'index.json')
+
+        if not os.path.exists(index_path):
+            print(f"Pré-rendu de {len(self.notes) * len(VELOCITY_LAYERS)} échantillons...")
+            os.makedirs(bank_dir, exist_ok=True)
+            self.build(bank_path, index_path)
+        else:
+            print(f"✓ Cache d'échantillons: {bank_dir}")
+
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+
+        self.data = np.memmap(bank_path, dtype=np.int16, mode='r').reshape(-1, CHANNELS)
+        self.starts = np.array([e['start'] for e in index], dtype=np.int64)
+        self.lengths = np.array([e['length'] for e in index], dtype=np.int64)
+        self.layer_velocity = np.array([e['velocity'] for e in index], dtype=np.float32)
+
+        # Table 128 × 128 précalculée : aucun calcul de couche à la frappe
+        self.sample_for = np.full((128, 128), -1, dtype=np.int32)
+        layer_of = np.searchsorted(np.array(VELOCITY_LAYERS), np.arange(128))
+        for i, e in enumerate(index):
+            self.sample_for[e['note'], layer_of == e['layer']] = i
+        self.sample_for[:, 0] = -1
+        return True
+
+    def touch_pages(self):
+        """Lit un octet par page : toute la banque passe en mémoire"""
+        flat = self.data.reshape(-1)
+        step = max(1, PAGE_SIZE // flat.itemsize)
+        return int(flat[::step].sum())
+
+    def lock_pages(self):
+        """mlock() de la banque : elle ne quitte plus la RAM (LimitMEMLOCK requis)"""
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        if libc.mlock(ctypes.c_void_p(self.data.ctypes.data), ctypes.c_size_t(self.data.nbytes)) != 0:
+            errno = ctypes.get_errno()
+            print(f"⚠️  mlock impossible ({os.strerror(errno)}), banque non verrouillée")
+            return False
+        return True
+
+    def first_block_time(self, sample):
+        """Durée de lecture du premier bloc d'un échantillon (ce que coûte une frappe)"""
+        start = self.starts[sample]
+        begin = time.perf_counter()
+        int(self.data[start:start + PERIOD_SIZE].sum())
+        return time.perf_counter() - begin
+
+    def prewarm(self, lock=False):
+        """Amène la banque en RAM puis vérifie que la première lecture de chaque
+        échantillon coûte autant qu'une lecture en régime établi"""
+        if self.data is None or not len(self.starts):
+            return True
+        begin = time.perf_counter()
+        self.touch_pages()
+        locked = self.lock_pages() if lock else False
+        warm_ms = (time.perf_counter() - begin) * 1000
+
+        first = [self.first_block_time(i) for i in range(len(self.starts))]
+        steady = [self.first_block_time(i) for i in range(len(self.starts))]
+        worst_first = max(first)
+        worst_steady = max(steady)
+        print(f"✓ Banque pré-chauffée en {warm_ms:.1f} ms ({self.data.nbytes / 1e6:.1f} Mo"
+              f"{', verrouillée en RAM' if locked else ''}) : première lecture max "
+              f"{worst_first * 1e6:.0f} µs, régime établi max {worst_steady * 1e6:.0f} µs")
+        if worst_first > worst_steady * PREWARM_TOLERANCE + PREWARM_MARGIN:
+            print("⚠️  Premières frappes encore plus lentes que le régime établi (mémoire insuffisante ?)")
+            return False
+        return True
+
+    def build(self, bank_path, index_path):
+        """Rend chaque note × couche avec FluidSynth et concatène dans la banque"""
+        index = []
+        offset = 0
+        with open(bank_path + '.tmp', 'wb') as bank, tempfile.TemporaryDirectory() as tmp:
+            for note in self.notes:
+                for layer, velocity in enumerate(VELOCITY_LAYERS):
+                    pcm = self.render_one(tmp, note, velocity)
+                    # Une frame de silence en fin d'échantillon : les voix
+                    # terminées pointent dessus au lieu d'être masquées
+                    pcm = np.concatenate([pcm, np.zeros((1, CHANNELS), dtype=np.int16)])
+                    bank.write(pcm.tobytes())
+                    index.append({'note': note, 'layer': layer, 'velocity': velocity,
+                                  'start': offset, 'length': len(pcm) - 1})
+                    offset += len(pcm)
+
+        os.replace(bank_path + '.tmp', bank_path)
+        with open(index_path, 'w') as f:
+            json.dump(index, f)
+        print(f"✓ Banque construite: {offset / SAMPLE_RATE:.1f} s d'audio")
+
+    def render_one(self, tmp, note, velocity):
+        """Rend un one-shot en PCM int16 stéréo via fluidsynth -F"""
+        mid_path = os.path.join(tmp, 'hit.mid')
+        raw_path = os.path.join(tmp, 'hit.raw')
+
+        midi = mido.MidiFile(ticks_per_beat=480)
+        track = mido.MidiTrack()
+        midi.tracks.append(track)
+        # 500000 µs/temps par défaut -> 960 ticks par seconde
+        hold = int(RENDER_SECONDS * 960)
+        track.append(mido.Message('note_on', channel=DRUM_CHANNEL, note=note,
+                                  velocity=velocity, time=0))
+        track.append(mido.Message('note_off', channel=DRUM_CHANNEL, note=note,
+                                  velocity=0, time=hold))
+        midi.save(mid_path)
+
+        subprocess.run([
+            'fluidsynth', '-ni', '-q',
+            '-g', '1.0',
+            '-r', str(SAMPLE_RATE),
+            '-o', 'synth.reverb.active=yes',
+            '-o', 'synth.chorus.active=no',
+            '-F', raw_path,
+            '-T', 'raw', '-O', 's16', '-E', 'little',
+            self.soundfont, mid_path,
+        ], check=True, capture_output=True)
+
+        pcm = np.fromfile(raw_path, dtype='<i2').reshape(-1, CHANNELS)
+
+        # Couper la queue silencieuse
+        loud = np.nonzero(np.abs(pcm).max(axis=1) > SILENCE_THRESHOLD)[0]
+        end = loud[-1] + 1 if len(loud) else 0
+        return np.ascontiguousarray(pcm[:end])
+
+
+class SampleEngine:
+    """Lecteur de one-shots polyphonique, utilisable comme un port de sortie mido"""
+
+    def __init__(self, soundfont, notes, device='hw:0', polyphony=POLYPHONY,
+                 prewarm=True, lock_memory=False):
+        self.bank = SampleBank(soundfont, notes)
+        self.device = device
+        self.polyphony = polyphony
+        self.prewarm = prewarm
+        self.lock_memory = lock_memory
+        self.pending = MidiRing()   # événements reçus (callback) -> thread audio, sans verrou
+        self.pcm = None
+        self.aplay_process = None
+        self.thread = None
+        self.running = False
+        self.stolen_voices = 0
+
+        # État des voix (tableaux de taille fixe, aucune allocation à la frappe)
+        self.voice_sample = None
+        self.voice_pos = None
+        self.voice_gain = None
+        self.voice_note = None
+        self.voice_age = None
+        self.voice_channel = None
+        self.voice_fading = None
+        self.frame_offsets = None
+        self.fade_out = None
+        self.clock = 0
+
+    def start(self):
+        """Construit/charge la banque et ouvre la sortie ALSA"""
+        if np is None:
+            print("✗ NumPy non installé!")
+            print("Installez: sudo apt-get install python3-numpy")
+            return False
+
+        try:
+            self.bank.load()
+        except FileNotFoundError:
+            print("✗ FluidSynth requis pour construire le cache d'échantillons")
+            return False
+        except Exception as e:
+            print(f"✗ Erreur de construction de la banque: {e}")
+            return False
+
+        self.voice_sample = np.zeros(self.polyphony, dtype=np.int64)
+        self.voice_pos = np.zeros(self.polyphony, dtype=np.int64)
+        self.voice_gain = np.zeros(self.polyphony, dtype=np.float32)
+        self.voice_note = np.full(self.polyphony, -1, dtype=np.int16)
+        self.voice_age = np.zeros(self.polyphony, dtype=np.int64)
+        self.voice_channel = np.full(self.polyphony, -1, dtype=np.int8)
+        self.voice_fading = np.zeros(self.polyphony, dtype=bool)
+        # Voix libres : position = longueur de l'échantillon 0 (frame de silence)
+        self.voice_pos[:] = self.bank.lengths[0] if len(self.bank.lengths) else 0
+        self.frame_offsets = np.arange(PERIOD_SIZE, dtype=np.int64)
+        self.fade_out = np.linspace(1.0, 0.0, PERIOD_SIZE, dtype=np.float32)
+
+        if self.prewarm:
+            self.bank.prewarm(self.lock_memory)
+            # Un bloc à vide : les chemins NumPy du mixage sont chauds eux aussi
+            self.mix_block()
+            self.voice_pos[:] = self.bank.lengths[0] if len(self.bank.lengths) else 0
+
+        if not self.open_output():
+            return False
+
+        self.start_audio()
+        latency_ms = PERIOD_SIZE * PERIODS * 1000 / SAMPLE_RATE
+        print(f"✓ Moteur d'échantillons démarré ({self.polyphony} voix, "
+              f"période {PERIOD_SIZE} frames, ~{latency_ms:.1f} ms de buffer)")
+        return True
+
+    def open_output(self):
+        """Ouvre le PCM ALSA (pyalsaaudio, sinon aplay sur un pipe)"""
+        try:
+            if alsaaudio is not None:
+                self.pcm = alsaaudio.PCM(
+                    type=alsaaudio.PCM_PLAYBACK,
+                    mode=alsaaudio.PCM_NORMAL,
+                    device=self.device,
+                    channels=CHANNELS,
+                    rate=SAMPLE_RATE,
+                    format=alsaaudio.PCM_FORMAT_S16_LE,
+                    periodsize=PERIOD_SIZE,
+                    periods=PERIODS,
+                )
+            else:
+                print("⚠️  pyalsaaudio absent, repli sur aplay")
+                self.aplay_process = subprocess.Popen(
+                    ['aplay', '-q', '-D', self.device,
+                     '-t', 'raw', '-f', 'S16_LE',
+                     '-c', str(CHANNELS), '-r', str(SAMPLE_RATE),
+                     f'--period-size={PERIOD_SIZE}',
+                     f'--buffer-size={PERIOD_SIZE * PERIODS}'],
+                    stdin=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+            return True
+        except Exception as e:
+            print(f"✗ Erreur d'ouverture ALSA ({self.device}): {e}")
+            return False
+
+    def close_output(self):
+        """Ferme le PCM (une écriture en cours échoue et rend la main)"""
+        if self.pcm is not None:
+            self.pcm.close()
+            self.pcm = None
+        if self.aplay_process:
+            self.aplay_process.stdin.close()
+            self.aplay_process.terminate()
+            self.aplay_process = None
+
+    def start_audio(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.audio_loop, name='dd70-sampler', daemon=True)
+        self.thread.start()
+
+    def alive(self):
+        """Thread audio en marche (il s'arrête sur une erreur ALSA : carte retirée...)"""
+        return self.running and self.thread is not None and self.thread.is_alive()
+
+    def restart(self):
+        """Rouvre la sortie ALSA et relance le thread audio (banque, voix et file
+        conservées) ; False si l'ancien thread ne rend pas la main à temps ou si
+        ALSA refuse : nouvel essai par le watchdog"""
+        self.running = False
+        self.close_output()
+        if self.thread:
+            # Un seul consommateur pour la file : l'ancien thread doit être arrêté
+            self.thread.join(timeout=RESTART_TIMEOUT)
+            if self.thread.is_alive():
+                return False
+        if not self.open_output():
+            return False
+        self.start_audio()
+        print("✓ Moteur d'échantillons relancé")
+        return True
+
+    def send(self, msg):
+        """Interface port mido : met le message en file pour le thread audio
+        (seuls note_on et All Sound Off y servent : un flot de CC#4 ne peut
+        pas remplir la file avant une note)"""
+        if msg.type == 'note_on' or (msg.type == 'control_change' and msg.control == 120):
+            self.pending.push(msg)
+
+    def send_packed(self, event, stamp):
+        """Depuis une file MidiRing (sortie du fan-out) : déjà empaqueté"""
+        if event & 0xF0 == 0x90 or event & 0xFFF0 == 0x78B0:
+            self.pending.push_event(event, stamp)
+
+    def note_on(self, note, velocity, channel):
+        """Alloue une voix (vol de la plus ancienne si la polyphonie est pleine)"""
+        sample = self.bank.sample_for[note, velocity]
+        if sample < 0:
+            return
+
+        free = np.nonzero(self.voice_pos >= self.bank.lengths[self.voice_sample])[0]
+        if len(free):
+            voice = free[0]
+        else:
+            voice = int(np.argmin(self.voice_age))
+            self.stolen_voices += 1
+
+        self.clock += 1
+        self.voice_sample[voice] = sample
+        self.voice_pos[voice] = 0
+        self.voice_gain[voice] = velocity / self.bank.layer_velocity[sample]
+        self.voice_note[voice] = note
+        self.voice_age[voice] = self.clock
+        self.voice_channel[voice] = channel
+        self.voice_fading[voice] = False
+
+    def choke_channel(self, channel):
+        """Étouffe toutes les voix d'un canal (fondu sur le prochain bloc)"""
+        self.voice_fading |= self.voice_channel == channel
+
+    def drain_pending(self):
+        """Applique les événements reçus depuis le dernier bloc"""
+        pending = self.pending
+        slot = pending.peek()
+        while slot >= 0:
+            event = pending.events[slot]
+            pending.advance()
+            status = event & 0xF0
+            if status == 0x90 and event >> 16:
+                self.note_on((event >> 8) & 0x7F, event >> 16, event & 0x0F)
+            elif status == 0xB0 and (event >> 8) & 0x7F == 120:
+                self.choke_channel(event & 0x0F)
+            # note_off ignoré : les one-shots jouent jusqu'au bout
+            slot = pending.peek()
+
+    def mix_block(self):
+        """Mixe un bloc : une seule indexation vectorisée pour toutes les voix"""
+        lengths = self.bank.lengths[self.voice_sample]
+        pos = np.minimum(self.voice_pos[:, None] + self.frame_offsets, lengths[:, None])
+        frames = self.bank.data[self.bank.starts[self.voice_sample][:, None] + pos]
+        gain = np.where(self.voice_fading[:, None], self.fade_out, 1.0) * self.voice_gain[:, None]
+        block = (frames * gain[:, :, None]).sum(axis=0) * MASTER_GAIN
+        self.voice_pos += PERIOD_SIZE
+        # Voix étouffées : libérées après leur bloc de fondu
+        self.voice_pos[self.voice_fading] = lengths[self.voice_fading]
+        self.voice_fading[:] = False
+        return np.clip(block, -32768, 32767).astype(np.int16)
+
+    def audio_loop(self):
+        """Thread audio : l'écriture ALSA bloquante cadence la boucle"""
+        try:
+            while self.running:
+                self.drain_pending()
+                data = self.mix_block().tobytes()
+                if self.pcm is not None:
+                    self.pcm.write(data)
+                else:
+                    self.aplay_process.stdin.write(data)
+        except Exception as e:
+            if self.running:
+                print(f"✗ Erreur moteur audio: {e}")
+
+    def close(self):
+        """Arrête le thread audio et ferme ALSA"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1)
+        self.close_output()
+        if self.stolen_voices:
+            print(f"  Voix volées: {self.stolen_voices}")
+        if self.pending.overflows:
+            print(f"  Événements perdus (file pleine): {self.pending.overflows}")
+        print("✓ Moteur d'échantillons arrêté")
@@ -0,0 +1,241 @@
+"""
+Journal d'événements en mémoire partagée entre le remapper et ses outils
+Le processus temps réel (remapper) ne fait que lire, remapper et envoyer :
+au lieu d'afficher chaque message, il écrit un enregistrement de taille fixe
+dans un tampon circulaire de /dev/shm et incrémente des compteurs. Les
+diagnostics (dd70-diag.py : journal, enregistrement, métriques) et le
+tableau de bord tournent dans d'autres processus, avec leur propre GIL :
+leur charge ne peut plus retarder une frappe.
+
+- un seul écrivain, jamais bloqué : quand un lecteur est en retard, les
+  enregistrements les plus anciens sont écrasés (le lecteur compte ses pertes)
+- lecteurs en lecture seule (mmap ACCESS_READ), autant qu'on veut, chacun
+  avec sa propre position
+- un enregistrement peut être réécrit pendant sa lecture : le lecteur relit
+  `head` après coup et jette ce qui a pu être écrasé
+
+Disposition (little-endian) :
+  0    en-tête  : magic, version, capacité, taille d'enregistrement, pid
+  32   head     : nombre total d'enregistrements écrits (uint64)
+  64   compteurs: COUNTER_SLOTS x uint64
+  192  sources  : noms des sources (kits), séparés par des NUL
+  448  enregistrements : capacité x RECORD
+"""
+
+import mmap
+import os
+import struct
+import time
+
+from dd70_ring import PACKERS
+
+SHM_PATH = '/dev/shm/dd70-diag'
+SHM_CAPACITY = 4096     # enregistrements (puissance de deux)
+
+MAGIC = b'DD70DIAG'
+VERSION = 1
+HEADER = struct.Struct('<8sIIII')
+HEAD_OFFSET = 32
+COUNTERS_OFFSET = 64
+COUNTER_SLOTS = 16
+SOURCES_OFFSET = 192
+SOURCES_SIZE = 256
+RECORDS_OFFSET = 448
+
+# stamp (perf_counter d'entrée), événement reçu, événement envoyé (dd70_ring),
+# type, source (kit), ouverture charleston, drapeaux, latence entrée -> envoi (s)
+RECORD = struct.Struct('<dIIBBBBf')
+
+# Types d'enregistrement
+KIND_MESSAGE = 0    # message reçu et envoyé après remappage
+KIND_PEDAL = 1      # indice d'état de la pédale (drapeaux : PEDAL_*)
+KIND_CHOKE = 2      # étouffement d'un groupe (événement envoyé : le CC#120)
+# Les reconnexions hotplug ne sont pas des enregistrements : elles ont lieu
+# dans la boucle d'événements, pas dans le thread du chemin des notes (seul
+# écrivain du journal). Elles passent par le compteur COUNT_RECONNECTS
+
+# Origine d'un changement d'état de la pédale
+PEDAL_CC = 1        # CC#4 continu
+PEDAL_CHICK = 2     # note 44 (pédale enfoncée)
+PEDAL_PAD = 3       # déduit d'une frappe 42/46 du pad central
+PEDAL_CUE_MASK = 0x0F
+PEDAL_ZONE_SHIFT = 4   # zone de pédale (dd70_rules.PedalZones) : bits 4 à 6
+PEDAL_ZONE_MASK = 0x07
+PEDAL_CHANGED = 0x80
+
+# Compteurs
+COUNT_MESSAGES = 0
+COUNT_NOTES = 1
+COUNT_CHOKES = 2
+COUNT_SEND_ERRORS = 3
+COUNT_RECONNECTS = 4
+COUNT_DROPPED = 5       # messages perdus par les files de sortie (fan-out, sampler)
+
+
+def pack(msg):
+    """Message mido -> événement empaqueté (0 si non empaquetable)"""
+    packer = PACKERS.get(msg.type)
+    return packer(msg) if packer else 0
+
+
+class DiagWriter:
+    """Côté temps réel : écrit les enregistrements et les compteurs"""
+
+    def __init__(self, path=SHM_PATH, capacity=SHM_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.size = RECORDS_OFFSET + capacity * RECORD.size
+        self.map = None
+        # Sans /dev/shm, les écritures vont dans une mémoire privée : le
+        # chemin chaud reste identique, sans test
+        self.buf = bytearray(self.size)
+        self.head = 0
+        self.bind()
+
+    def bind(self):
+        self.head_view = memoryview(self.buf)[HEAD_OFFSET:HEAD_OFFSET + 8].cast('Q')
+        self.counters = memoryview(self.buf)[COUNTERS_OFFSET:COUNTERS_OFFSET + 8 * COUNTER_SLOTS].cast('Q')
+
+    def open(self, sources=()):
+        """Crée (ou réutilise) le fichier partagé ; False si /dev/shm est indisponible.
+        Le fichier n'est jamais supprimé : un lecteur reste attaché à travers
+        les redémarrages du remapper"""
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, self.size)
+                shared = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"⚠️  Diagnostics partagés indisponibles ({self.path}): {e}")
+            return False
+        self.release()
+        self.map = shared
+        self.buf = shared
+        self.bind()
+        self.head = 0
+        self.head_view[0] = 0
+        for slot in range(COUNTER_SLOTS):
+            self.counters[slot] = 0
+        names = '\0'.join(sources).encode()[:SOURCES_SIZE - 1]
+        self.buf[SOURCES_OFFSET:SOURCES_OFFSET + SOURCES_SIZE] = names.ljust(SOURCES_SIZE, b'\0')
+        # En-tête écrit en dernier : un lecteur n'accepte le fichier qu'une fois prêt
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, self.capacity, RECORD.size, os.getpid())
+        return True
+
+    def publish(self, kind, stamp, event_in, event_out, source=0, openness=0, flags=0, latency=0.0):
+        """Écrit un enregistrement puis le publie (head)"""
+        head = self.head
+        RECORD.pack_into(self.buf, RECORDS_OFFSET + (head & self.mask) * RECORD.size,
+                         stamp, event_in, event_out, kind, source, openness, flags, latency)
+        self.head = head + 1
+        self.head_view[0] = head + 1
+
+    def message(self, msg_in, msg_out, source=0, openness=0):
+        """Un message traité : reçu, envoyé, latence d'entrée à envoi"""
+        latency = time.perf_counter() - msg_in.time if msg_in.time > 0 else 0.0
+        self.publish(KIND_MESSAGE, msg_in.time, pack(msg_in), pack(msg_out), source, openness, 0, latency)
+        self.counters[COUNT_MESSAGES] += 1
+        if msg_out.type == 'note_on' and msg_out.velocity > 0:
+            self.counters[COUNT_NOTES] += 1
+
+    def pedal(self, stamp, cue, openness, changed, source=0, zone=0):
+        flags = cue | (zone & PEDAL_ZONE_MASK) << PEDAL_ZONE_SHIFT | (PEDAL_CHANGED if changed else 0)
+        self.publish(KIND_PEDAL, stamp, 0, 0, source, openness, flags)
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def release(self):
+        self.head_view.release()
+        self.counters.release()
+
+    def close(self):
+        """Détache le remapper (le fichier reste pour les lecteurs)"""
+        self.release()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class DiagReader:
+    """Côté outils : attache en lecture seule, lit depuis sa propre position"""
+
+    def __init__(self, path=SHM_PATH):
+        self.path = path
+        self.map = None
+        self.capacity = 0
+        self.mask = 0
+        self.tail = 0
+        self.lost = 0
+        self.pid = None
+
+    def open(self):
+        """Attache le fichier du remapper ; False s'il n'existe pas encore"""
+        try:
+            with open(self.path, 'rb') as f:
+                shared = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        magic, version, capacity, record_size, pid = HEADER.unpack_from(shared, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            shared.close()
+            return False
+        self.map = shared
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.pid = pid
+        # Lecture en direct : on ne rejoue pas l'historique
+        self.tail = self.head()
+        return True
+
+    def head(self):
+        return struct.unpack_from('<Q', self.map, HEAD_OFFSET)[0]
+
+    def writer_alive(self):
+        """Le remapper qui a créé le journal tourne-t-il encore ?"""
+        pid = HEADER.unpack_from(self.map, 0)[4]
+        if pid != self.pid:
+            # Remapper redémarré : nouveau journal, on repart de son début
+            self.pid = pid
+            self.tail = 0
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def sources(self):
+        raw = self.map[SOURCES_OFFSET:SOURCES_OFFSET + SOURCES_SIZE].rstrip(b'\0')
+        return raw.decode(errors='replace').split('\0') if raw else []
+
+    def counters(self):
+        return struct.unpack_from(f'<{COUNTER_SLOTS}Q', self.map, COUNTERS_OFFSET)
+
+    def read(self):
+        """Nouveaux enregistrements depuis le dernier appel (tuples RECORD)"""
+        head = self.head()
+        if head < self.tail:
+            # Remapper redémarré (head remis à zéro)
+            self.tail = 0
+        if head - self.tail > self.capacity:
+            self.lost += head - self.tail - self.capacity
+            self.tail = head - self.capacity
+        records = [RECORD.unpack_from(self.map, RECORDS_OFFSET + (index & self.mask) * RECORD.size)
+                   for index in range(self.tail, head)]
+        # Ce qui a pu être réécrit pendant la lecture est jeté
+        overwritten = self.head() - self.capacity - self.tail
+        if overwritten > 0:
+            self.lost += overwritten
+            records = records[overwritten:]
+        self.tail = head
+        return records
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
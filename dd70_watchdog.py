@@ -0,0 +1,154 @@
+"""
+Watchdog systemd et reprise sur place des composants du remapper
+Restart=on-failure ne voit que les processus qui s'arrêtent : un callback
+rtmidi bloqué ou un FluidSynth figé (mais vivant) laissent le kit muet.
+
+Chaque composant (entrée, synthé, route ALSA) déclare un test de santé et
+une reconstruction. La boucle principale appelle tick() au moins une fois
+par seconde :
+- composant en échec -> reconstruit sur place (lui seul), au plus une
+  tentative toutes les RECOVERY_RETRY secondes ; une reconstruction ne
+  prend jamais de verrou du chemin des notes (elle échange des attributs)
+- tout est sain -> WATCHDOG=1 envoyé à systemd (sd_notify)
+
+Le battement prouve donc que la boucle principale tourne ET que le chemin
+des notes n'est pas bloqué. Si la reconstruction n'aboutit pas, les
+battements cessent et systemd relance le service après WatchdogSec : la
+reprise est bornée dans tous les cas.
+"""
+
+import os
+import time
+
+# Un message en cours de traitement depuis plus longtemps = chemin bloqué
+STALL_TIMEOUT = 2.0
+# Délai entre deux tentatives de reconstruction d'un même composant
+RECOVERY_RETRY = 2.0
+# Réponse attendue du shell FluidSynth
+SHELL_PROBE_TIMEOUT = 1.0
+# Commande qui interroge le synthé lui-même (pas seulement ses réglages)
+SHELL_PROBE_COMMAND = b'channels\n'
+
+
+def sd_notify(state):
+    """Envoie un état à systemd (READY=1, WATCHDOG=1, STATUS=...) ; sans effet hors systemd"""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    import socket
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode(), address)
+        return True
+    except OSError:
+        return False
+
+
+def watchdog_interval():
+    """Période des battements (moitié de WatchdogSec), None si le watchdog n'est pas actif"""
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or not usec.isdigit() or (pid and pid != str(os.getpid())):
+        return None
+    return int(usec) / 1e6 / 2
+
+
+def shell_responds(port, host='127.0.0.1'):
+    """True si le shell TCP de FluidSynth répond à une commande"""
+    import socket
+    try:
+        with socket.create_connection((host, port), timeout=SHELL_PROBE_TIMEOUT) as sock:
+            sock.sendall(SHELL_PROBE_COMMAND)
+            sock.shutdown(socket.SHUT_WR)
+            return bool(sock.recv(1024))
+    except OSError:
+        return False
+
+
+async def shell_probe(port, host='127.0.0.1'):
+    """Comme shell_responds, sans bloquer la boucle d'événements"""
+    import asyncio
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), SHELL_PROBE_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(SHELL_PROBE_COMMAND)
+        writer.write_eof()
+        return bool(await asyncio.wait_for(reader.read(1024), SHELL_PROBE_TIMEOUT))
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+class Component:
+    """Un composant surveillé : test de santé et reconstruction sur place"""
+
+    def __init__(self, name, check, rebuild):
+        self.name = name
+        self.check = check
+        self.rebuild = rebuild
+        self.failing_since = None
+        self.last_attempt = 0.0
+        self.rebuilds = 0
+
+
+class Watchdog:
+    """Teste les composants, reconstruit celui qui échoue, bat pour systemd"""
+
+    def __init__(self):
+        self.components = []
+        self.interval = watchdog_interval()
+        self.last_ping = 0.0
+
+    def add(self, name, check, rebuild):
+        self.components.append(Component(name, check, rebuild))
+
+    def ready(self):
+        """Le kit est jouable : fin du démarrage pour systemd (Type=notify)"""
+        sd_notify('READY=1')
+        if self.interval:
+            print(f"✓ Watchdog systemd actif (battement toutes les {self.interval:.1f} s)")
+
+    def recover(self, component, now):
+        """Reconstruit un composant en échec (une tentative par RECOVERY_RETRY)"""
+        if component.failing_since is None:
+            component.failing_since = now
+            print(f"⚠️  {component.name}: bloqué ou absent, reconstruction...")
+        if now - component.last_attempt < RECOVERY_RETRY:
+            return False
+        component.last_attempt = now
+        try:
+            ok = component.rebuild()
+        except Exception as e:
+            print(f"✗ {component.name}: reconstruction impossible: {e}")
+            return False
+        if ok and component.check():
+            component.rebuilds += 1
+            elapsed_ms = (time.monotonic() - component.failing_since) * 1000
+            print(f"✓ {component.name}: reconstruit en {elapsed_ms:.0f} ms (reconstructions: {component.rebuilds})")
+            component.failing_since = None
+            return True
+        return False
+
+    def tick(self):
+        """À appeler depuis la boucle principale : santé, reprise, battement"""
+        now = time.monotonic()
+        healthy = True
+        for component in self.components:
+            if component.check():
+                component.failing_since = None
+            elif not self.recover(component, now):
+                healthy = False
+        if healthy and self.interval and now - self.last_ping >= self.interval:
+            sd_notify('WATCHDOG=1')
+            self.last_ping = now
+        return healthy
+
+    def print_stats(self):
+        rebuilt = [f"{c.name} x{c.rebuilds}" for c in self.components if c.rebuilds]
+        if rebuilt:
+            print(f"  Reconstructions: {', '.join(rebuilt)}")
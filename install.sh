@@ -7,6 +7,20 @@ echo "  Installation DD-70 Remapper + FluidSynth"
 echo "==================================================="
 echo
 
+# Choix du mode de fonctionnement
+echo "Mode du remapper:"
+echo "  1) Zéro latence : le son est généré par le DD-70 (par défaut)"
+echo "  2) Synthé FluidSynth persistant sur le Raspberry Pi"
+read -r mode
+if [[ "$mode" == "2" ]]; then
+    REMAPPER_SCRIPT=dd70-remap-synth-v3.py
+    WITH_SYNTH=1
+else
+    REMAPPER_SCRIPT=dd70-remapper-nolatency.py
+    WITH_SYNTH=0
+fi
+echo
+
 # Mise à jour du système
 echo "[1/7] Mise à jour du système..."
 sudo apt-get update
@@ -31,12 +45,25 @@ sudo python3 -m venv /opt/dd70-remap/venv
 # Installation de mido dans l'environnement virtuel
 echo "[4/7] Installation de mido dans l'environnement virtuel..."
 sudo /opt/dd70-remap/venv/bin/pip install --upgrade pip
-sudo /opt/dd70-remap/venv/bin/pip install mido python-rtmidi
+sudo /opt/dd70-remap/venv/bin/pip install mido python-rtmidi pyudev
 
 # Copie des scripts
 echo "[5/7] Installation des scripts..."
-sudo cp dd70-remapper-nolatency.py /opt/dd70-remap/
-sudo chmod +x /opt/dd70-remap/dd70-remapper-nolatency.py
+sudo cp "$REMAPPER_SCRIPT" dd70_hotplug.py dd70_alsaseq.py dd70_rawmidi.py dd70_watchdog.py \
+    dd70_engine.py dd70_control.py dd70_rules.py dd70_pedal.py dd70_ring.py dd70_shm.py dd70_fanout.py \
+    dd70-ctl.py dd70-diag.py dd70-dashboard.py /opt/dd70-remap/
+sudo chmod +x "/opt/dd70-remap/$REMAPPER_SCRIPT"
+if [[ "$WITH_SYNTH" == "1" ]]; then
+    sudo cp dd70-synth-daemon.py dd70_sampler.py dd70_inputs.py dd70_loadshed.py /opt/dd70-remap/
+    sudo chmod +x /opt/dd70-remap/dd70-synth-daemon.py
+fi
+sudo cp dd70_boottime.py dd70-startup-report.py dd70-boot-report.py dd70-build-pyz.py /opt/dd70-remap/
+
+# Démarrage rapide : archive zipapp du remapper avec bytecode précompilé
+# (construite avec l'interpréteur du venv qui la lancera), et bytecode des
+# modules du synthé (/opt/dd70-remap n'est pas modifiable par le service)
+sudo /opt/dd70-remap/venv/bin/python3 dd70-build-pyz.py "$REMAPPER_SCRIPT" -o /opt/dd70-remap/dd70-remap.pyz
+sudo /opt/dd70-remap/venv/bin/python3 -m compileall -q /opt/dd70-remap/*.py
 
 # Configuration audio - Volume du jack (plus nécessaire en mode no-latency mais utile au cas où)
 echo "[6/7] Configuration audio..."
@@ -49,22 +76,84 @@ echo "[7/7] Configuration du service systemd..."
 SERVICE_USER=${SUDO_USER:-$(whoami)}
 echo "  -> Le service tournera sous l'utilisateur : $SERVICE_USER"
 
+# Synthé persistant : service séparé, jamais redémarré avec le remapper
+SYNTH_UNIT_DEPS=""
+if [[ "$WITH_SYNTH" == "1" ]]; then
+    sudo tee /etc/systemd/system/dd70-synth.service > /dev/null <<EOF
+[Unit]
+Description=DD-70 Synth persistant (FluidSynth)
+After=sound.target
+
+[Service]
+Type=notify
+NotifyAccess=main
+User=$SERVICE_USER
+WorkingDirectory=/opt/dd70-remap
+ExecStart=/opt/dd70-remap/venv/bin/python3 /opt/dd70-remap/dd70-synth-daemon.py
+Restart=always
+RestartSec=1
+# Le daemon ne bat que si toutes ses instances répondent (relance d'une instance comprise)
+WatchdogSec=30
+LimitMEMLOCK=infinity
+Environment="PYTHONUNBUFFERED=1"
+
+[Install]
+WantedBy=multi-user.target
+EOF
+    SYNTH_UNIT_DEPS="Wants=dd70-synth.service
+After=dd70-synth.service"
+fi
+
+# Démarrage rapide : le remapper est lancé par udev dès l'énumération USB du
+# DD-70 (règle 99-dd70.rules), sans attendre le réseau ni multi-user.target.
+# Pas de BindsTo sur le périphérique : un débranchement est géré par le
+# hotplug interne, le service reste actif.
 sudo tee /etc/systemd/system/dd70-remap.service > /dev/null <<EOF
 [Unit]
-Description=DD-70 MIDI Pad Remapper (Zero Latency)
-After=network.target sound.target
+Description=DD-70 MIDI Pad Remapper
+DefaultDependencies=no
+After=local-fs.target dev-dd70midi.device
+Conflicts=shutdown.target
+Before=shutdown.target
+$SYNTH_UNIT_DEPS
+
+[Service]
+Type=notify
+NotifyAccess=main
+User=$SERVICE_USER
+WorkingDirectory=/opt/dd70-remap
+ExecStart=/opt/dd70-remap/venv/bin/python3 /opt/dd70-remap/dd70-remap.pyz
+# Battement tant que le chemin des notes avance ; sinon reconstruction sur
+# place, et relance complète si elle n'aboutit pas avant WatchdogSec
+WatchdogSec=10
+Restart=on-failure
+RestartSec=1
+LimitMEMLOCK=infinity
+# Socket de contrôle local : /run/dd70/control.sock
+RuntimeDirectory=dd70
+Environment="PYTHONUNBUFFERED=1"
+EOF
+
+# Diagnostics dans un processus séparé, de basse priorité : journal des
+# frappes et de la pédale lu dans /dev/shm, sans toucher au remapper
+sudo tee /etc/systemd/system/dd70-diag.service > /dev/null <<EOF
+[Unit]
+Description=DD-70 Diagnostics (journal des frappes, métriques)
+After=dd70-remap.service
+PartOf=dd70-remap.service
 
 [Service]
 Type=simple
 User=$SERVICE_USER
 WorkingDirectory=/opt/dd70-remap
-ExecStart=/opt/dd70-remap/venv/bin/python3 /opt/dd70-remap/dd70-remapper-nolatency.py
+ExecStart=/opt/dd70-remap/venv/bin/python3 /opt/dd70-remap/dd70-diag.py
+Nice=10
 Restart=on-failure
 RestartSec=5
 Environment="PYTHONUNBUFFERED=1"
 
 [Install]
-WantedBy=multi-user.target
+WantedBy=dd70-remap.service
 EOF
 
 # Rechargement systemd
@@ -75,7 +164,18 @@ echo
 echo "Voulez-vous activer le démarrage automatique? (o/n)"
 read -r response
 if [[ "$response" =~ ^[Oo]$ ]]; then
-    sudo systemctl enable dd70-remap.service
+    # Règle udev : /dev/dd70midi + démarrage du remapper à l'énumération USB
+    # (au démarrage, le déclenchement initial d'udev couvre un DD-70 déjà branché)
+    sudo tee /etc/udev/rules.d/99-dd70.rules > /dev/null <<'EOF'
+SUBSYSTEM=="sound", KERNEL=="midiC*D0", ATTRS{product}=="*e-drum*|*DD-70*", SYMLINK+="dd70midi", TAG+="systemd", ENV{SYSTEMD_WANTS}+="dd70-remap.service"
+EOF
+    sudo udevadm control --reload
+    # Ancien démarrage via multi-user.target (installations précédentes)
+    sudo systemctl disable dd70-remap.service 2>/dev/null || true
+    if [[ "$WITH_SYNTH" == "1" ]]; then
+        sudo systemctl enable dd70-synth.service
+    fi
+    sudo systemctl enable dd70-diag.service
     echo "✓ Service activé au démarrage"
 fi
 
@@ -92,8 +192,15 @@ echo "Commandes disponibles:"
 echo "  - Démarrer:  sudo systemctl start dd70-remap"
 echo "  - Arrêter:   sudo systemctl stop dd70-remap"
 echo "  - Statut:    sudo systemctl status dd70-remap"
-echo "  - Manuel:    /opt/dd70-remap/venv/bin/python3 /opt/dd70-remap/dd70-remapper-nolatency.py"
+echo "  - Manuel:    /opt/dd70-remap/venv/bin/python3 /opt/dd70-remap/$REMAPPER_SCRIPT"
 echo "  - Logs:      sudo journalctl -u dd70-remap -f"
+echo "  - Frappes:   sudo journalctl -u dd70-diag -f  (ou: python3 /opt/dd70-remap/dd70-diag.py -v)"
+echo "  - Tableau:   python3 /opt/dd70-remap/dd70-dashboard.py  (frappes, pédale, latence en direct)"
+echo "  - Contrôle:  python3 /opt/dd70-remap/dd70-ctl.py help  (réglages à chaud, enregistrement, sorties)"
+echo "  - Boot:      sudo /opt/dd70-remap/venv/bin/python3 /opt/dd70-remap/dd70-boot-report.py"
+if [[ "$WITH_SYNTH" == "1" ]]; then
+    echo "  - Synthé:    sudo systemctl status dd70-synth (reste actif si le remapper redémarre)"
+fi
 echo
 echo "Note: Branchez simplement le DD-70 en USB au Raspberry Pi."
 echo "      Pas besoin de câble audio Jack."
@@ -0,0 +1,86 @@
+import threading
+
+import mido
+
+from dd70_fanout import Sink
+
+
+class BlockedPort:
+    """Port dont l'envoi reste bloqué jusqu'à release()"""
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.sent = []
+
+    def send(self, msg):
+        self.released.wait()
+        self.sent.append(msg)
+
+    def release(self):
+        self.released.set()
+
+    def close(self):
+        pass
+
+
+def test_cc_flood_on_blocked_sink_keeps_room_for_notes():
+    port = BlockedPort()
+    sink = Sink('test', port, capacity=1024)
+    try:
+        for i in range(2000):
+            sink.push(mido.Message('control_change', channel=9, control=4, value=i % 128))
+        assert len(sink.ring) <= sink.droppable_limit
+        assert sink.ring.overflows == 0
+        assert sink.push(mido.Message('note_on', channel=9, note=38, velocity=100))
+    finally:
+        port.release()
+        sink.close()
+        sink.join()
+    notes = [m for m in port.sent if m.type == 'note_on']
+    ccs = [m for m in port.sent if m.type == 'control_change']
+    assert len(notes) == 1
+    # La dernière valeur du CC atteint la sortie
+    assert ccs[-1].value == 1999 % 128
+
+
+def test_note_refused_when_deferred_controllers_do_not_fit():
+    port = BlockedPort()
+    sink = Sink('test', port, capacity=64)
+    try:
+        # File au-delà de droppable_limit : les valeurs suivantes restent hors file
+        for i in range(sink.droppable_limit + 40):
+            sink.push(mido.Message('control_change', channel=9, control=4 + i % 8, value=i % 128))
+        assert len(sink.deferred) == 8
+        # Réserve presque pleine : il ne reste pas de place pour tous les contrôleurs
+        while len(sink.ring) < sink.ring.capacity - 4:
+            sink.ring.push(mido.Message('note_off', channel=0, note=0))
+        # Plutôt perdue (comptée) que déposée avant les contrôleurs
+        assert not sink.push(mido.Message('note_on', channel=9, note=38, velocity=100))
+        assert sink.ring.overflows == 1
+    finally:
+        port.release()
+        sink.close()
+        sink.join()
+
+
+def test_deferred_controllers_drain_before_note():
+    port = BlockedPort()
+    sink = Sink('test', port, capacity=64)
+    try:
+        for i in range(sink.droppable_limit + 40):
+            sink.push(mido.Message('control_change', channel=9, control=4 + i % 8, value=i % 128))
+        last = {m.control: m.value for m in sink.deferred.values()}
+        assert sink.push(mido.Message('note_on', channel=9, note=38, velocity=100))
+        assert not sink.deferred
+    finally:
+        port.release()
+        sink.close()
+        sink.join()
+    sent = [m for m in port.sent if m.type in ('note_on', 'control_change')]
+    note = next(i for i, m in enumerate(sent) if m.type == 'note_on')
+    # Aucune valeur de contrôleur déposée avant la note ne part après elle
+    assert all(m.type == 'note_on' for m in sent[note:])
+    before = {}
+    for m in sent[:note]:
+        before[m.control] = m.value
+    assert before == last
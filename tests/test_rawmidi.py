@@ -0,0 +1,43 @@
+import os
+import time
+
+import mido
+
+from dd70_rawmidi import SEND_WAIT, MidiStreamParser, RawMidiPort
+
+
+def test_reserved_status_inside_note_is_ignored():
+    parser = MidiStreamParser()
+    messages = parser.feed(bytes([0x99, 0xF9, 38, 0xFD, 100]))
+    assert [m.type for m in messages] == ['note_on']
+    assert (messages[0].channel, messages[0].note, messages[0].velocity) == (9, 38, 100)
+
+
+def test_realtime_keeps_running_status():
+    parser = MidiStreamParser()
+    messages = parser.feed(bytes([0x99, 38, 100, 0xF8, 42, 90]))
+    assert [m.type for m in messages] == ['note_on', 'clock', 'note_on']
+    assert messages[2].note == 42
+
+
+def test_reserved_system_common_is_ignored():
+    parser = MidiStreamParser()
+    messages = parser.feed(bytes([0xF4, 0xF5, 0x99, 38, 100]))
+    assert [m.type for m in messages] == ['note_on']
+
+
+def test_send_gives_up_when_output_is_full(tmp_path):
+    # FIFO jamais lue : le buffer se remplit comme celui d'un DD-70 qui ne suit plus
+    path = str(tmp_path / 'midi')
+    os.mkfifo(path)
+    reader = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    port = RawMidiPort(path, output=True)
+    try:
+        msg = mido.Message('note_on', channel=9, note=38, velocity=100)
+        while port.dropped == 0:
+            start = time.perf_counter()
+            port.send(msg)
+        assert time.perf_counter() - start < SEND_WAIT + 0.05
+    finally:
+        port.close()
+        os.close(reader)
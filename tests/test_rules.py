@@ -0,0 +1,36 @@
+import pytest
+
+from dd70_rules import HitState, PedalZones, compile_mapping, threshold_zones
+
+
+def test_play_list_is_rejected_at_compile_time():
+    with pytest.raises(ValueError):
+        compile_mapping({'rules': [{'note': 38, 'play': [42, 46]}]}, threshold_zones(64))
+
+
+def test_mapping_target_list_is_rejected():
+    with pytest.raises(ValueError):
+        compile_mapping({38: [42, 46]}, threshold_zones(64))
+
+
+def test_zone_note_list_is_rejected():
+    with pytest.raises(ValueError):
+        PedalZones([('closed', 0, [42, 44]), ('open', 64)])
+
+
+def test_play_single_note():
+    table = compile_mapping({'rules': [{'note': 38, 'play': 42}]}, threshold_zones(64))
+    assert HitState().note_on(table, 38, 100, 0, 0.0) == (42, 100)
+
+
+@pytest.mark.parametrize('drop', ['no', 1, None])
+def test_drop_must_be_a_bool(drop):
+    with pytest.raises(ValueError):
+        compile_mapping({'rules': [{'note': 38, 'drop': drop}]}, threshold_zones(64))
+
+
+@pytest.mark.parametrize('mapping', [{'rules': 5}, {'hihat_pads': 5.0}, {'hihat_pads': 'abc'},
+                                     {'rules': [{'note': 38, 'velocity_gain': [2]}]}])
+def test_malformed_mapping_raises_value_error(mapping):
+    with pytest.raises(ValueError):
+        compile_mapping(mapping, threshold_zones(64))